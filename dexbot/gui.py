@@ -2,6 +2,7 @@ import sys
 
 from dexbot.config import Config
 from dexbot.controllers.main_controller import MainController
+from dexbot.storage import configure_storage
 from dexbot.views.worker_list import MainView
 
 from PyQt5.QtWidgets import QApplication
@@ -13,6 +14,7 @@ class App(QApplication):
 
         # Init config
         config = Config()
+        configure_storage(config.config_file)
 
         # Init main controller
         self.main_controller = MainController(config)
@@ -0,0 +1,23 @@
+"""add balances timestamp index
+
+Revision ID: 3c7a9e2f1b6d
+Revises: 8f3b2c1d4e5a
+Create Date: 2026-10-17 14:05:21.530917
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c7a9e2f1b6d'
+down_revision = '8f3b2c1d4e5a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_balances_timestamp', 'balances', ['timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_balances_timestamp', 'balances')
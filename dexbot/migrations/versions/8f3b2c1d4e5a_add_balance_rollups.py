@@ -0,0 +1,44 @@
+"""add balance rollups
+
+Revision ID: 8f3b2c1d4e5a
+Revises: ce86e6fa9370
+Create Date: 2026-10-17 09:12:40.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3b2c1d4e5a'
+down_revision = 'ce86e6fa9370'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'balance_rollups',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('period', sa.Integer),
+        sa.Column('account', sa.String),
+        sa.Column('worker', sa.String),
+        sa.Column('base_total', sa.Float),
+        sa.Column('base_symbol', sa.String),
+        sa.Column('quote_total', sa.Float),
+        sa.Column('quote_symbol', sa.String),
+        sa.Column('center_price', sa.Float),
+        sa.Column('timestamp', sa.Integer),
+    )
+    op.create_index(
+        'ix_balance_rollups_account_worker_symbols_timestamp',
+        'balance_rollups',
+        ['account', 'worker', 'base_symbol', 'quote_symbol', 'timestamp'],
+    )
+    op.create_index('ix_balance_rollups_period_timestamp', 'balance_rollups', ['period', 'timestamp'])
+
+
+def downgrade():
+    op.drop_index('ix_balance_rollups_period_timestamp', 'balance_rollups')
+    op.drop_index('ix_balance_rollups_account_worker_symbols_timestamp', 'balance_rollups')
+    op.drop_table('balance_rollups')
@@ -0,0 +1,39 @@
+"""add indexes
+
+Revision ID: ce86e6fa9370
+Revises: d1e6672520b2
+Create Date: 2026-10-17 04:30:55.473108
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'ce86e6fa9370'
+down_revision = 'd1e6672520b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Keep only the most recent value of duplicated keys before enforcing uniqueness
+    op.execute('DELETE FROM config WHERE id NOT IN (SELECT MAX(id) FROM config GROUP BY category, key)')
+    op.create_index('ix_config_category_key', 'config', ['category', 'key'], unique=True)
+
+    op.create_index('ix_orders_order_id', 'orders', ['order_id'])
+    op.create_index('ix_orders_worker_order_id', 'orders', ['worker', 'order_id'])
+    op.create_index('ix_orders_worker_virtual_custom', 'orders', ['worker', 'virtual', 'custom'])
+
+    op.create_index(
+        'ix_balances_account_worker_symbols_timestamp',
+        'balances',
+        ['account', 'worker', 'base_symbol', 'quote_symbol', 'timestamp'],
+    )
+
+
+def downgrade():
+    op.drop_index('ix_balances_account_worker_symbols_timestamp', 'balances')
+    op.drop_index('ix_orders_worker_virtual_custom', 'orders')
+    op.drop_index('ix_orders_worker_order_id', 'orders')
+    op.drop_index('ix_orders_order_id', 'orders')
+    op.drop_index('ix_config_category_key', 'config')
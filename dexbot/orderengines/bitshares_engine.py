@@ -1,7 +1,9 @@
 import copy
 import datetime
 import logging
+import threading
 import time
+import weakref
 
 import bitshares.exceptions
 import bitsharesapi
@@ -9,16 +11,233 @@ import bitsharesapi.exceptions
 from bitshares.amount import Amount, Asset
 from bitshares.dex import Dex
 from bitshares.instance import shared_bitshares_instance
-from bitshares.market import Market
-from bitshares.price import FilledOrder, Order, UpdateCallOrder
-from bitshares.utils import formatTime
+from bitshares.price import FilledOrder, Order, Price, UpdateCallOrder
+from bitshares.transactionbuilder import TransactionBuilder
+from bitshares.utils import formatTime, parse_time
 from dexbot.config import Config
 from dexbot.helper import truncate
+from dexbot.orderengines.retry import RetryPolicy
+from dexbot.pricefeeds.order_book import get_order_book
+from dexbot.pricefeeds.ticker_cache import get_ticker_cache
 from dexbot.storage import Storage
 from events import Events
 
-# Number of maximum retries used to retry action before failing
-MAX_TRIES = 3
+# Maximum number of objects requested with one get_objects call
+GET_OBJECTS_MAX = 100
+
+# Maximum number of orders placed with one transaction
+PLACE_ORDERS_CHUNK = 50
+
+# Maximum age in seconds of cached fee schedule and core exchange rates
+FEE_CACHE_TTL = 60 * 60
+
+# Maximum age in seconds of cached tickers, normally they are dropped on every new block
+CONVERSION_RATES_TTL = 3
+
+# Asset used to route conversions between assets without a direct market
+CONVERSION_ROUTE_ASSET = 'BTS'
+
+
+class FeeCache:
+    """ Fee schedule and core exchange rates shared by the workers using the same BitShares instance
+
+        Fee schedule changes only at chain maintenance, so it is refreshed when the next maintenance time passes, or
+        when it is older than `ttl`. Core exchange rates are refreshed when older than `ttl`.
+
+        :param bitshares.BitShares bitshares: BitShares instance
+        :param float ttl: maximum age of cached data in seconds
+    """
+
+    def __init__(self, bitshares, ttl=FEE_CACHE_TTL):
+        self.bitshares = bitshares
+        self.dex = Dex(bitshares)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.fees = None
+        self.fees_expiration = 0
+        # {asset_id: (rate, expiration)}
+        self.core_exchange_rates = {}
+
+    def get_fees(self):
+        """ Get fee schedule, see :meth:`bitshares.dex.Dex.returnFees`
+        """
+        with self.lock:
+            now = time.time()
+            if self.fees is None or now >= self.fees_expiration:
+                self.fees = self.dex.returnFees()
+                properties = self.bitshares.rpc.get_dynamic_global_properties()
+                next_maintenance = parse_time(properties['next_maintenance_time']).timestamp()
+                self.fees_expiration = min(now + self.ttl, next_maintenance)
+            return self.fees
+
+    def get_core_exchange_rate(self, asset):
+        """ Get core exchange rate of the asset
+
+            :param Asset asset: asset other than BTS
+            :return: float amount of the asset per 1 BTS
+        """
+        with self.lock:
+            now = time.time()
+            rate, expiration = self.core_exchange_rates.get(asset['id'], (None, 0))
+            if now >= expiration:
+                options = self.bitshares.rpc.get_objects([asset['id']])[0]['options']
+                price = Price(options['core_exchange_rate'], bitshares_instance=self.bitshares)
+                if price['base']['asset']['id'] != asset['id']:
+                    price = price.invert()
+                rate = price['price']
+                self.core_exchange_rates[asset['id']] = (rate, now + self.ttl)
+            return rate
+
+    def invalidate(self):
+        """ Drop cached data, e.g. after changing the node
+        """
+        with self.lock:
+            self.fees = None
+            self.core_exchange_rates = {}
+
+
+class ConversionRates:
+    """ Latest prices between assets shared by the workers using the same BitShares instance
+
+        Each market ticker is fetched once per block and used for both directions. Assets without a traded direct
+        market are converted through :data:`CONVERSION_ROUTE_ASSET`.
+
+        :param bitshares.BitShares bitshares: BitShares instance
+        :param float ttl: maximum age of cached tickers in seconds
+    """
+
+    def __init__(self, bitshares, ttl=CONVERSION_RATES_TTL):
+        self.bitshares = bitshares
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.block = None
+        self.expiration = 0
+        # {(base_symbol, quote_symbol): latest price as BASE/QUOTE}
+        self.prices = {}
+
+    def on_block(self, block, *args, **kwargs):
+        """ Drop cached tickers when a new block arrives
+
+            Subscribed to ontick of every worker, so only the first worker to see the block clears the cache.
+        """
+        with self.lock:
+            if block != self.block:
+                self.block = block
+                self.prices = {}
+
+    def _latest_price(self, base, quote):
+        """ Latest price of the market as BASE/QUOTE, 0 if there are no trades
+        """
+        if time.time() >= self.expiration:
+            self.prices = {}
+            self.expiration = time.time() + self.ttl
+
+        if (base, quote) in self.prices:
+            return self.prices[(base, quote)]
+        if (quote, base) in self.prices:
+            price = self.prices[(quote, base)]
+            return 1 / price if price else 0
+
+        price = float(self.bitshares.rpc.get_ticker(base, quote)['latest'])
+        self.prices[(base, quote)] = price
+        return price
+
+    def get_rate(self, from_asset, to_asset):
+        """ Amount of to_asset worth one from_asset
+
+            :param str from_asset: symbol of the input asset
+            :param str to_asset: symbol of the output asset
+            :return: float rate, 0 if there is no way to convert the assets
+        """
+        if from_asset == to_asset:
+            return 1
+
+        with self.lock:
+            rate = self._latest_price(to_asset, from_asset)
+            if rate or CONVERSION_ROUTE_ASSET in (from_asset, to_asset):
+                return rate
+
+            # No trades in direct market, go through the route asset
+            rate = self._latest_price(CONVERSION_ROUTE_ASSET, from_asset)
+            if rate:
+                rate *= self._latest_price(to_asset, CONVERSION_ROUTE_ASSET)
+            return rate
+
+    def get_rates(self, from_assets, to_asset):
+        """ Rates of several assets to one asset, each market is queried at most once
+
+            :param iterable from_assets: symbols of the input assets
+            :param str to_asset: symbol of the output asset
+            :return: dict {from_asset: rate}
+        """
+        return {from_asset: self.get_rate(from_asset, to_asset) for from_asset in set(from_assets)}
+
+
+# Shared caches per BitShares instance
+fee_caches = weakref.WeakKeyDictionary()
+conversion_rates = weakref.WeakKeyDictionary()
+shared_caches_lock = threading.Lock()
+
+
+def get_fee_cache(bitshares):
+    """ Get fee cache shared by all workers using the BitShares instance
+    """
+    with shared_caches_lock:
+        if bitshares not in fee_caches:
+            fee_caches[bitshares] = FeeCache(bitshares)
+        return fee_caches[bitshares]
+
+
+def get_conversion_rates(bitshares):
+    """ Get conversion rates shared by all workers using the BitShares instance
+    """
+    with shared_caches_lock:
+        if bitshares not in conversion_rates:
+            conversion_rates[bitshares] = ConversionRates(bitshares)
+        return conversion_rates[bitshares]
+
+
+class PendingTransaction:
+    """ Handle of a transaction broadcast without waiting for it to be included into a block
+
+        The callback is called once with the handle when the status changes from pending.
+
+        :param str transaction_id: id of the signed transaction
+        :param float expiration: transaction expiration as unix timestamp
+        :param callable callback: function called with the handle when the transaction is resolved
+    """
+
+    PENDING = 'pending'
+    CONFIRMED = 'confirmed'
+    EXPIRED = 'expired'
+    FAILED = 'failed'
+
+    def __init__(self, transaction_id, expiration, callback=None):
+        self.id = transaction_id
+        self.expiration = expiration
+        self.callback = callback
+        self.status = self.PENDING
+        # Transaction with operation_results as included into the block
+        self.transaction = None
+        self.block_num = None
+        self.error = None
+
+    @property
+    def done(self):
+        return self.status != self.PENDING
+
+    def resolve(self, status, transaction=None, block_num=None, error=None):
+        """ Set final status of the transaction and notify the callback
+        """
+        self.status = status
+        self.transaction = transaction
+        self.block_num = block_num
+        self.error = error
+        if self.callback:
+            self.callback(self)
+
+    def __repr__(self):
+        return '<PendingTransaction {} {}>'.format(self.id, self.status)
 
 
 class BitsharesOrderEngine(Storage, Events):
@@ -60,6 +279,24 @@ class BitsharesOrderEngine(Storage, Events):
         # Events
         Events.__init__(self)
 
+        # Account data is cached until the next block, an account notification or an own broadcast
+        self.account_state_stale = True
+        self.ontick += self.invalidate_account_state
+        self.onAccount += self.invalidate_account_state
+
+        # Own limit orders indexed by order id and the account limit_orders list the index was built from
+        self.limit_orders_index = {}
+        self.indexed_limit_orders = None
+
+        # Transactions broadcast with execute_async(), tracked against incoming blocks
+        self.pending_transactions = {}
+        # Number of the next block to look for pending transactions in
+        self.pending_scan_block = None
+        self.ontick += self.check_pending_transactions
+
+        # Retries of failed broadcasts
+        self.retry_policy = RetryPolicy()
+
         # Redirect this event to also call order placed and order matched
         self.onMarketUpdate += self._callbackPlaceFillOrders
 
@@ -79,11 +316,19 @@ class BitsharesOrderEngine(Storage, Events):
 
         self.fee_asset = fee_asset_symbol
 
-        # CER cache
-        self.core_exchange_rate = None
+        # Fee schedule and CER cache
+        self.fee_cache = get_fee_cache(self.bitshares)
+
+        # Asset conversion rates, refreshed on each block
+        self.conversion_rates = get_conversion_rates(self.bitshares)
+        self.ontick += self.conversion_rates.on_block
 
-        # Ticker
-        self.ticker = self._market.ticker
+        # Tickers cached until the next block or market notification
+        self.ticker_cache = get_ticker_cache(self.bitshares)
+        self.ontick += self.ticker_cache.on_block
+
+        # Order book shared by all workers on the market
+        self.order_book = get_order_book(self.bitshares, self._market)
 
         # Settings for bitshares instance
         self.bitshares.bundle = bitshares_bundle
@@ -132,28 +377,24 @@ class BitsharesOrderEngine(Storage, Events):
             :param string | return_asset: Balance is returned as this asset
             :return: float: Value of the account in one asset
         """
-        total_value = 0
-
-        # Total balance calculation
+        # Sum balances and amounts in orders per asset, so each asset is converted once
+        totals = {}
         for balance in self.balances:
-            if balance['symbol'] != return_asset:
-                # Convert to asset if different
-                total_value += self.convert_asset(balance['amount'], balance['symbol'], return_asset)
-            else:
-                total_value += balance['amount']
-
-        # Orders balance calculation
-        for order in self.all_own_orders:
-            updated_order = self.get_updated_order(order['id'])
+            totals[balance['symbol']] = totals.get(balance['symbol'], 0) + balance['amount']
 
-            if not order:
+        for updated_order in self.get_updated_orders(self.all_own_orders):
+            if not updated_order:
                 continue
-            if updated_order['base']['symbol'] == return_asset:
-                total_value += updated_order['base']['amount']
+            symbol = updated_order['base']['symbol']
+            totals[symbol] = totals.get(symbol, 0) + updated_order['base']['amount']
+
+        rates = self.conversion_rates.get_rates(totals.keys(), return_asset)
+        total_value = 0
+        for symbol, amount in totals.items():
+            if symbol == return_asset:
+                total_value += amount
             else:
-                total_value += self.convert_asset(
-                    updated_order['base']['amount'], updated_order['base']['symbol'], return_asset
-                )
+                total_value += self.convert_asset(amount, symbol, return_asset, rate=rates[symbol])
 
         return total_value
 
@@ -164,7 +405,12 @@ class BitsharesOrderEngine(Storage, Events):
             :param float | fee_reservation: How much is saved in reserve for the fees
             :return: Balance of specific asset
         """
-        balance = self._account.balance(asset)
+        symbol = asset['symbol'] if isinstance(asset, dict) else asset
+        for balance in self.balances:
+            if balance['symbol'] == symbol:
+                break
+        else:
+            balance = Amount(0, symbol, bitshares_instance=self.bitshares)
 
         if fee_reservation > 0:
             balance['amount'] = balance['amount'] - fee_reservation
@@ -324,8 +570,7 @@ class BitsharesOrderEngine(Storage, Events):
         quote_asset = self._market['quote']['id']
         base_asset = self._market['base']['id']
 
-        for order_id in order_ids:
-            order = self.get_updated_order(order_id)
+        for order in self.get_updated_orders(order_ids):
             if not order:
                 continue
             asset_id = order['base']['asset']['id']
@@ -369,6 +614,13 @@ class BitsharesOrderEngine(Storage, Events):
         except IndexError:
             return None
 
+    def ticker(self):
+        """ Returns the market ticker, fetched at most once per block
+
+            :return: dict ticker, see bitshares.market.Market.ticker()
+        """
+        return self.ticker_cache.get_ticker(self._market)
+
     def get_market_orders(self, depth=1, updated=True):
         """ Returns orders from the current market. Orders are sorted by price.
 
@@ -379,7 +631,7 @@ class BitsharesOrderEngine(Storage, Events):
                                    remainders and not just initial amounts
             :return: Returns a list of orders or None
         """
-        orders = self.bitshares.rpc.get_limit_orders(self._market['base']['id'], self._market['quote']['id'], depth)
+        orders = self.order_book.get_limit_orders(depth)
         if updated:
             orders = [self.get_updated_limit_order(o) for o in orders]
         orders = [Order(o, bitshares_instance=self.bitshares) for o in orders]
@@ -392,7 +644,7 @@ class BitsharesOrderEngine(Storage, Events):
             :return: Cancellation fee as fee asset
         """
         # Get fee
-        fees = self.dex.returnFees()
+        fees = self.fee_cache.get_fees()
         limit_order_cancel = fees['limit_order_cancel']
         return self.convert_fee(limit_order_cancel['fee'], fee_asset)
 
@@ -403,7 +655,7 @@ class BitsharesOrderEngine(Storage, Events):
             :return:
         """
         # Get fee
-        fees = self.dex.returnFees()
+        fees = self.fee_cache.get_fees()
         limit_order_create = fees['limit_order_create']
         return self.convert_fee(limit_order_create['fee'], fee_asset)
 
@@ -450,26 +702,58 @@ class BitsharesOrderEngine(Storage, Events):
 
             :param str|dict order_id: blockchain Order object or id of the order
         """
-        if isinstance(order_id, dict):
-            order_id = order_id['id']
+        return self.get_updated_orders([order_id])[0]
 
-        # At first, try to look up own orders. This prevents RPC calls whether requested order is own order
-        order = None
-        for limit_order in self._account['limit_orders']:
-            if order_id == limit_order['id']:
-                order = limit_order
-                break
-        else:
-            # We are using direct rpc call here because passing an Order object to self.get_updated_limit_order() give
-            # us weird error "Object of type 'BitShares' is not JSON serializable"
-            order = self.bitshares.rpc.get_objects([order_id])[0]
+    def get_updated_orders(self, order_ids):
+        """ Get updated orders, own orders are taken from account data and the rest is fetched with one API call
 
-        # Do not try to continue whether there is no order in the blockchain
-        if not order:
-            return None
+            :param list order_ids: blockchain Order objects or ids of the orders
+            :return: list of Order objects in the same order as order_ids, None for orders which don't exist
+        """
+        limit_orders = self._get_limit_orders(order_ids, self.own_limit_orders)
+
+        orders = []
+        for order_id in self._get_order_ids(order_ids):
+            limit_order = limit_orders[order_id]
+            # Do not try to continue whether there is no order in the blockchain
+            if not limit_order:
+                orders.append(None)
+                continue
+            updated_order = self.get_updated_limit_order(limit_order)
+            orders.append(Order(updated_order, bitshares_instance=self.bitshares))
+        return orders
 
-        updated_order = self.get_updated_limit_order(order)
-        return Order(updated_order, bitshares_instance=self.bitshares)
+    def _get_limit_orders(self, order_ids, own_orders):
+        """ Get raw limit order objects, looking up own orders first and fetching the rest with one API call
+
+            :param list order_ids: blockchain Order objects or ids of the orders
+            :param dict own_orders: own limit orders by id, see own_limit_orders
+            :return: dict {order_id: limit order object or None if the order doesn't exist}
+        """
+        limit_orders = {}
+        missing = []
+        for order_id in self._get_order_ids(order_ids):
+            if order_id in own_orders:
+                limit_orders[order_id] = own_orders[order_id]
+            elif order_id not in limit_orders:
+                limit_orders[order_id] = None
+                missing.append(order_id)
+
+        # We are using direct rpc call here because passing an Order object to self.get_updated_limit_order() give
+        # us weird error "Object of type 'BitShares' is not JSON serializable"
+        while missing:
+            chunk, missing = missing[:GET_OBJECTS_MAX], missing[GET_OBJECTS_MAX:]
+            limit_orders.update(zip(chunk, self.bitshares.rpc.get_objects(chunk)))
+
+        return limit_orders
+
+    @staticmethod
+    def _get_order_ids(orders):
+        """ Convert list of orders or order ids into list of order ids
+        """
+        if isinstance(orders, (str, dict)):
+            orders = [orders]
+        return [order['id'] if isinstance(order, dict) else order for order in orders]
 
     def execute(self):
         """ Execute a bundle of operations
@@ -479,8 +763,80 @@ class BitsharesOrderEngine(Storage, Events):
         self.bitshares.blocking = "head"
         r = self.bitshares.txbuffer.broadcast()
         self.bitshares.blocking = False
+        self.invalidate_account_state()
         return r
 
+    def execute_async(self, callback=None):
+        """ Broadcast a bundle of operations without waiting for inclusion into a block
+
+            The transaction is tracked on each new block, see :meth:`check_pending_transactions`.
+
+            :param callable callback: called with the :class:`PendingTransaction` when it is confirmed, expired or
+                failed
+            :return: PendingTransaction, None if there are no operations to broadcast
+        """
+        txbuffer = self.bitshares.txbuffer
+        signed_transaction = txbuffer.sign()
+        if not signed_transaction:
+            return None
+        expiration = parse_time(txbuffer['expiration']).timestamp()
+        pending_transaction = PendingTransaction(signed_transaction.id, expiration, callback)
+
+        previous_blocking = self.bitshares.blocking
+        self.bitshares.blocking = False
+        try:
+            txbuffer.broadcast()
+        except bitsharesapi.exceptions.RPCError as exception:
+            self.log.exception('Broadcast of transaction {} failed'.format(pending_transaction.id))
+            pending_transaction.resolve(PendingTransaction.FAILED, error=exception)
+            return pending_transaction
+        finally:
+            self.bitshares.blocking = previous_blocking
+
+        self.log.debug('Broadcast transaction {}'.format(pending_transaction.id))
+        if not self.pending_transactions:
+            # Blocks are scanned from the current head, the transaction can't be included into earlier blocks
+            properties = self.bitshares.rpc.get_dynamic_global_properties()
+            self.pending_scan_block = properties['head_block_number']
+        self.pending_transactions[pending_transaction.id] = pending_transaction
+        return pending_transaction
+
+    def check_pending_transactions(self, block_id, *args, **kwargs):
+        """ Look for pending transactions in the blocks up to the new one, drop the expired ones
+
+            Subscribed to ontick event. Every block since the last check is scanned, so transactions included into
+            blocks the worker missed are not taken for expired ones.
+
+            :param str block_id: id of the new block, it starts with the block number
+        """
+        if not self.pending_transactions:
+            return
+
+        head_block_num = int(block_id[:8], 16)
+        if self.pending_scan_block is None or self.pending_scan_block > head_block_num:
+            self.pending_scan_block = head_block_num
+
+        # Transactions expire by chain time
+        now = time.time()
+        for block_num in range(self.pending_scan_block, head_block_num + 1):
+            block = self.bitshares.rpc.get_block(block_num)
+            if not block:
+                continue
+            now = parse_time(block['timestamp']).timestamp()
+            for transaction_id, transaction in zip(block['transaction_ids'], block['transactions']):
+                pending_transaction = self.pending_transactions.pop(transaction_id, None)
+                if pending_transaction:
+                    self.log.debug('Transaction {} included into block {}'.format(transaction_id, block_num))
+                    self.invalidate_account_state()
+                    pending_transaction.resolve(PendingTransaction.CONFIRMED, transaction, block_num)
+        self.pending_scan_block = head_block_num + 1
+
+        for pending_transaction in list(self.pending_transactions.values()):
+            if now > pending_transaction.expiration:
+                self.log.warning('Transaction {} expired'.format(pending_transaction.id))
+                del self.pending_transactions[pending_transaction.id]
+                pending_transaction.resolve(PendingTransaction.EXPIRED)
+
     def is_buy_order(self, order):
         """ Check whether an order is buy order
 
@@ -553,6 +909,8 @@ class BitsharesOrderEngine(Storage, Events):
         self.log.info(
             'Placing a buy order with {:.{prec}f} {} @ {:.8f}'.format(base_amount, symbol, price, prec=precision)
         )
+        request = {'type': 'buy', 'amount': amount, 'price': price}
+        may_match = self._may_match([request]) if return_order_id else None
 
         # Place the order
         buy_transaction = self.retry_action(
@@ -569,17 +927,209 @@ class BitsharesOrderEngine(Storage, Events):
 
         self.log.debug('Placed buy order {}'.format(buy_transaction))
         if return_order_id:
-            buy_order = self.get_order(buy_transaction['orderid'], return_none=return_none)
-            if buy_order and buy_order['deleted']:
-                # The API doesn't return data on orders that don't exist
-                # We need to calculate the data on our own
-                buy_order = self.calculate_order_data('buy', buy_order, amount, price)
-                buy_order['id'] = buy_transaction['orderid']
-                self.recheck_orders = True
-            return buy_order
+            return self._get_placed_orders([request], [(buy_transaction, 0)], may_match, return_none)[0]
         else:
             return True
 
+    def place_market_orders(self, orders, return_none=False):
+        """ Places several orders in the market with one transaction
+
+            Balance is checked once for all the orders. Orders are broadcast in chunks of PLACE_ORDERS_CHUNK, a
+            chunk rejected by the node because of an order is split in halves and retried, so one bad order doesn't
+            fail the others. Errors known to :attr:`retry_policy`, like insufficient fee balance or node problems,
+            don't depend on the orders and fail the whole batch.
+
+            :param list | orders: dicts with 'type' ('buy' or 'sell'), 'amount' in QUOTE and 'price' in BASE
+            :param bool | return_none: return None for orders filled right away instead of calculated order data
+            :return: list of placed Order objects in the same order as requested, None for orders not placed
+        """
+        base_symbol = self._market['base']['symbol']
+        base_precision = self._market['base']['precision']
+        quote_symbol = self._market['quote']['symbol']
+        quote_precision = self._market['quote']['precision']
+        results = [None] * len(orders)
+        if not orders:
+            return results
+
+        # Make sure the orders are valid and we have enough balance for all of them
+        base_needed = 0
+        quote_needed = 0
+        for order in orders:
+            if order['type'] == 'buy':
+                base_amount = truncate(order['price'] * order['amount'], base_precision)
+                if not base_amount:
+                    self.log.critical('Trying to buy 0')
+                    self.disabled = True
+                    return results
+                base_needed += base_amount
+            elif order['type'] == 'sell':
+                quote_amount = truncate(order['amount'], quote_precision)
+                if not quote_amount:
+                    self.log.critical('Trying to sell 0')
+                    self.disabled = True
+                    return results
+                quote_needed += quote_amount
+            else:
+                raise ValueError('Invalid order type')
+
+        if base_needed and self.balance(self._market['base']) < base_needed:
+            self.log.critical("Insufficient buy balance, needed {} {}".format(base_needed, base_symbol))
+            self.disabled = True
+            return results
+        if quote_needed and self.balance(self._market['quote']) < quote_needed:
+            self.log.critical("Insufficient sell balance, needed {} {}".format(quote_needed, quote_symbol))
+            self.disabled = True
+            return results
+
+        self.log.info(
+            'Placing {} orders, {:.{base_prec}f} {} for buying and {:.{quote_prec}f} {} for selling'.format(
+                len(orders),
+                base_needed,
+                base_symbol,
+                quote_needed,
+                quote_symbol,
+                base_prec=base_precision,
+                quote_prec=quote_precision,
+            )
+        )
+
+        # Place the orders
+        may_match = self._may_match(orders)
+        placements = [None] * len(orders)
+        chunks = []
+        indexes = list(range(len(orders)))
+        while indexes:
+            chunk, indexes = indexes[:PLACE_ORDERS_CHUNK], indexes[PLACE_ORDERS_CHUNK:]
+            chunks.append(chunk)
+
+        while chunks:
+            chunk = chunks.pop(0)
+            try:
+                transaction = self.retry_action(self._place_orders_transaction, [orders[index] for index in chunk])
+            except bitsharesapi.exceptions.UnhandledRPCError as exception:
+                if self.retry_policy.classify(exception) is not None:
+                    # Retries are exhausted already, splitting the chunk would only repeat the error
+                    placed = len([placement for placement in placements if placement])
+                    self.log.error('Unable to place orders, {} of {} were placed'.format(placed, len(orders)))
+                    raise
+                if len(chunk) == 1:
+                    self.log.exception('Unable to place order {}'.format(orders[chunk[0]]))
+                    continue
+                self.log.warning('Unable to place {} orders at once, splitting them'.format(len(chunk)))
+                middle = len(chunk) // 2
+                chunks[:0] = [chunk[:middle], chunk[middle:]]
+                continue
+            self.log.debug('Placed orders {}'.format(transaction))
+            for operation_index, index in enumerate(chunk):
+                placements[index] = (transaction, operation_index)
+
+        return self._get_placed_orders(orders, placements, may_match, return_none)
+
+    def _may_match(self, orders):
+        """ Check which orders cross the opposite side of the market, so they may be filled right when placed
+
+            Must be called before placing the orders.
+
+            :param list | orders: dicts with 'type' and 'price', see :meth:`place_market_orders`
+            :return: list of bools
+        """
+        # The cached ticker may miss orders placed since the last block, a crossing order would be taken for a resting
+        # one, so the node is queried directly
+        ticker = self._market.ticker()
+        lowest_ask = float(ticker['lowestAsk'])
+        highest_bid = float(ticker['highestBid'])
+        may_match = []
+        for order in orders:
+            if order['type'] == 'buy':
+                may_match.append(bool(lowest_ask) and order['price'] >= lowest_ask)
+            else:
+                may_match.append(bool(highest_bid) and order['price'] <= highest_bid)
+        return may_match
+
+    def _order_from_operation(self, order_id, operation):
+        """ Build Order object of a just created order from its limit_order_create operation
+        """
+        limit_order = {
+            'id': order_id,
+            'seller': operation['seller'],
+            'for_sale': operation['amount_to_sell']['amount'],
+            'sell_price': {'base': operation['amount_to_sell'], 'quote': operation['min_to_receive']},
+            'expiration': operation['expiration'],
+        }
+        order = Order(limit_order, bitshares_instance=self.bitshares)
+        order['deleted'] = False
+        return order
+
+    def _get_placed_orders(self, orders, placements, may_match, return_none):
+        """ Map the resulting objects back to the requested orders
+
+            Orders which didn't cross the market are built from their operations; only orders which may have been
+            filled at creation are queried from the node.
+
+            :param list | orders: dicts with 'type', 'amount' and 'price', see :meth:`place_market_orders`
+            :param list | placements: (transaction, operation index) of the created orders, None for orders not placed
+            :param list | may_match: bools from :meth:`_may_match`
+            :param bool | return_none: return None for orders filled right away instead of calculated order data
+            :return: list of Order objects, None for orders not placed
+        """
+        results = [None] * len(orders)
+        queried = []
+        for index, placement in enumerate(placements):
+            if not placement:
+                continue
+            transaction, operation_index = placement
+            order_id = transaction['operation_results'][operation_index][1]
+            if may_match[index]:
+                queried.append((index, order_id))
+            else:
+                results[index] = self._order_from_operation(order_id, transaction['operations'][operation_index][1])
+
+        if not queried:
+            return results
+
+        placed_orders = self.get_orders([order_id for _, order_id in queried], return_none=False)
+        for (index, order_id), placed_order in zip(queried, placed_orders):
+            if placed_order['deleted']:
+                if return_none:
+                    continue
+                # The API doesn't return data on orders that don't exist, we need to calculate the data on our own
+                placed_order = self.calculate_order_data(
+                    orders[index]['type'], placed_order, orders[index]['amount'], orders[index]['price']
+                )
+                placed_order['id'] = order_id
+                self.recheck_orders = True
+            results[index] = placed_order
+
+        return results
+
+    def _place_orders_transaction(self, orders, cancel_order_ids=()):
+        """ Broadcast one transaction creating the orders and wait for it to be included into a block
+
+            :param list | orders: dicts with 'type', 'amount' and 'price', see :meth:`place_market_orders`
+            :param list | cancel_order_ids: ids of the orders to cancel before creating the new ones
+            :return: dict: transaction with operation_results
+        """
+        transaction = TransactionBuilder(blockchain_instance=self.bitshares)
+        if cancel_order_ids:
+            self.bitshares.cancel(cancel_order_ids, account=self._account, append_to=transaction)
+        for order in orders:
+            action = self._market.buy if order['type'] == 'buy' else self._market.sell
+            action(
+                order['price'],
+                Amount(amount=order['amount'], asset=self._market["quote"], bitshares_instance=self.bitshares),
+                account=self._account.name,
+                expiration=self.expiration,
+                append_to=transaction,
+            )
+        transaction.set_fee_asset(self.fee_asset['id'])
+
+        previous_blocking = self.bitshares.blocking
+        self.bitshares.blocking = "head"
+        try:
+            return transaction.broadcast()
+        finally:
+            self.bitshares.blocking = previous_blocking
+
     def place_market_sell_order(self, amount, price, return_none=False, invert=False, *args, **kwargs):
         """ Places a sell order in the market
 
@@ -611,6 +1161,8 @@ class BitsharesOrderEngine(Storage, Events):
         self.log.info(
             'Placing a sell order with {:.{prec}f} {} @ {:.8f}'.format(quote_amount, symbol, price, prec=precision)
         )
+        request = {'type': 'sell', 'amount': amount, 'price': price}
+        may_match = self._may_match([request]) if return_order_id else None
 
         # Place the order
         sell_transaction = self.retry_action(
@@ -627,109 +1179,203 @@ class BitsharesOrderEngine(Storage, Events):
 
         self.log.debug('Placed sell order {}'.format(sell_transaction))
         if return_order_id:
-            sell_order = self.get_order(sell_transaction['orderid'], return_none=return_none)
-            if sell_order and sell_order['deleted']:
-                # The API doesn't return data on orders that don't exist, we need to calculate the data on our own
-                sell_order = self.calculate_order_data('sell', sell_order, amount, price)
-                sell_order['id'] = sell_transaction['orderid']
-                self.recheck_orders = True
+            sell_order = self._get_placed_orders([request], [(sell_transaction, 0)], may_match, return_none)[0]
             if sell_order and invert:
                 sell_order.invert()
             return sell_order
         else:
             return True
 
+    def replace_order(self, order, amount, price, return_none=False):
+        """ Replaces an order with a new one, cancelling and creating in one transaction
+
+            When the old order was filled or cancelled meanwhile, only the new order is placed. In bundle mode the
+            operations are added to the pending transaction next to each other.
+
+            :param dict | order: Order to replace
+            :param float | amount: New order amount in QUOTE
+            :param float | price: New order price in BASE
+            :param bool | return_none: return None when the new order was filled right away
+            :return: new Order object, True in bundle mode, None if placing failed
+        """
+        if self.is_buy_order(order):
+            request = {'type': 'buy', 'amount': amount, 'price': price}
+            asset = self._market['base']
+            needed = truncate(price * amount, asset['precision'])
+        else:
+            request = {'type': 'sell', 'amount': amount, 'price': price}
+            asset = self._market['quote']
+            needed = truncate(amount, asset['precision'])
+
+        if not needed:
+            self.log.critical('Trying to {} 0'.format(request['type']))
+            self.disabled = True
+            return None
+
+        if self.bitshares.bundle:
+            self.log.info('Replacing {} order {}'.format(request['type'], order['id']))
+            self._cancel_orders(order['id'])
+            action = self._market.buy if request['type'] == 'buy' else self._market.sell
+            self.retry_action(
+                action,
+                price,
+                Amount(amount=amount, asset=self._market["quote"], bitshares_instance=self.bitshares),
+                account=self._account.name,
+                expiration=self.expiration,
+                fee_asset=self.fee_asset['id'],
+            )
+            return True
+
+        # Funds of the old order are released by the same transaction
+        released = order['for_sale']['amount'] if 'for_sale' in order else order['base']['amount']
+        if self.balance(asset) + released < needed:
+            self.log.critical("Insufficient {} balance, needed {} {}".format(request['type'], needed, asset['symbol']))
+            self.disabled = True
+            return None
+
+        self.log.info(
+            'Replacing {} order {} with {:.{prec}f} {} @ {:.8f}'.format(
+                request['type'], order['id'], needed, asset['symbol'], price, prec=asset['precision']
+            )
+        )
+
+        may_match = self._may_match([request])
+        try:
+            transaction = self.retry_action(self._place_orders_transaction, [request], cancel_order_ids=[order['id']])
+        except bitsharesapi.exceptions.UnhandledRPCError as exception:
+            if 'Unable to find Object' not in str(exception):
+                raise
+            # Old order is already filled or cancelled, just place the new one
+            self.log.info('Order {} is not on the market anymore, placing new order only'.format(order['id']))
+            self.invalidate_account_state()
+            return self.place_market_orders([request], return_none=return_none)[0]
+
+        self.log.debug('Replaced order {}'.format(transaction))
+        # First operation belongs to the cancel
+        return self._get_placed_orders([request], [(transaction, 1)], may_match, return_none)[0]
+
     def retry_action(self, action, *args, **kwargs):
         """ Perform an action, and if certain suspected-to-be-spurious grapheme bugs occur,
             instead of bubbling the exception, it is quietly logged (level WARN), and try again
-            tries a fixed number of times (MAX_TRIES) before failing
+
+            Known errors, their retry budgets and delays are defined by :attr:`retry_policy`.
 
             :param action:
             :return:
         """
-        tries = 0
         while True:
             try:
-                return action(*args, **kwargs)
+                result = action(*args, **kwargs)
+                self.retry_policy.reset()
+                # Own operations change balances and orders
+                self.invalidate_account_state()
+                return result
             except bitsharesapi.exceptions.UnhandledRPCError as exception:
-                if "Assert Exception: amount_to_sell.amount > 0" in str(exception):
-                    if tries > MAX_TRIES:
-                        raise
-                    else:
-                        tries += 1
-                        self.log.warning("Ignoring: '{}'".format(str(exception)))
-                        self.bitshares.txbuffer.clear()
-                        self._account.refresh()
-                        time.sleep(2)
-                elif "now <= trx.expiration" in str(exception):  # Usually loss of sync to blockchain
-                    if tries > MAX_TRIES:
-                        raise
-                    else:
-                        tries += 1
-                        self.log.warning("retrying on '{}'".format(str(exception)))
-                        self.bitshares.txbuffer.clear()
-                        time.sleep(6)  # Wait at least a BitShares block
-                elif "trx.expiration <= now + chain_parameters.maximum_time_until_expiration" in str(exception):
-                    if tries > MAX_TRIES:
-                        info = self.bitshares.info()
-                        raise Exception(
-                            'Too much difference between node block time and trx expiration, please change '
-                            'the node. Block time: {}, local time: {}'.format(
-                                info['time'], formatTime(datetime.datetime.utcnow())
-                            )
-                        )
-                    else:
-                        tries += 1
-                        self.log.warning(
-                            'Too much difference between node block time and trx expiration, switching node'
-                        )
-                        self.bitshares.txbuffer.clear()
-                        self.bitshares.rpc.next()
-                elif "Assert Exception: delta.amount > 0: Insufficient Balance" in str(exception):
-                    self.log.critical('Insufficient balance of fee asset')
+                rule = self.retry_policy.classify(exception)
+                if rule is None:
+                    self.retry_policy.reset()
                     raise
-                elif "trx.ref_block_prefix == tapos_block_summary.block_id._hash" in str(exception):
-                    self.log.warning('Got tapos_block_summary exception, switching node')
-                    self.bitshares.txbuffer.clear()
+
+                # Retries are counted by the policy, across deferrals of the action
+                attempt = self.retry_policy.next_attempt(rule)
+                if attempt is None:
+                    self._retries_exhausted(rule, exception)
+
+                self.log.warning("Retrying on '{}'".format(str(exception)))
+                self.bitshares.txbuffer.clear()
+                if rule.switch_node:
                     self.bitshares.rpc.next()
-                else:
-                    raise
+                if rule.refresh_account:
+                    self.refresh_account(force=True)
+                self.retry_policy.wait(rule, attempt, exception)
+
+    def _retries_exhausted(self, rule, exception):
+        """ Raise the error of an action which can't be retried anymore
+        """
+        if rule.name == 'fee_balance':
+            self.log.critical('Insufficient balance of fee asset')
+        elif rule.name == 'node_time':
+            info = self.bitshares.info()
+            raise Exception(
+                'Too much difference between node block time and trx expiration, please change '
+                'the node. Block time: {}, local time: {}'.format(info['time'], formatTime(datetime.datetime.utcnow()))
+            )
+        raise exception
 
     @property
     def balances(self):
         """ Returns all the balances of the account assigned for the worker.
             :return: Balances in list where each asset is in their own Amount object
         """
-        return self._account.balances
+        self.refresh_account()
+        return [
+            Amount({'amount': balance['balance'], 'asset_id': balance['asset_type']}, bitshares_instance=self.bitshares)
+            for balance in self._account['balances']
+            if int(balance['balance']) > 0
+        ]
 
-    def get_own_orders(self, refresh=True):
+    def refresh_account(self, force=False):
+        """ Refresh account data, unless it is already up to date
+
+            Account data is refreshed at most once per block, or after an account notification or an own broadcast.
+
+            :param bool force: True = refresh even if account data is up to date
+        """
+        if force or self.account_state_stale:
+            self._account.refresh()
+            self.account_state_stale = False
+
+    @property
+    def own_limit_orders(self):
+        """ Own limit order objects from account data indexed by order id
+
+            The index is rebuilt when account data is refreshed.
+
+            :return: dict {order_id: limit order object}
+        """
+        limit_orders = self._account['limit_orders']
+        if limit_orders is not self.indexed_limit_orders:
+            self.limit_orders_index = {limit_order['id']: limit_order for limit_order in limit_orders}
+            self.indexed_limit_orders = limit_orders
+        return self.limit_orders_index
+
+    def invalidate_account_state(self, *args, **kwargs):
+        """ Mark account data outdated, so it will be refreshed on next access
+
+            Subscribed to ontick and onAccount events.
+        """
+        self.account_state_stale = True
+
+    def get_own_orders(self, refresh=True, force_refresh=False):
         """ Return the account's open orders in the current market
 
             :param bool refresh: Use most recent data
+            :param bool force_refresh: Query account data even if it was already refreshed in this block
             :return: List of Order objects
         """
         orders = []
 
         # Refresh account data
         if refresh:
-            self._account.refresh()
+            self.refresh_account(force=force_refresh)
 
+        worker_market = self._market.get_string('/')
         for order in self._account.openorders:
-            worker_market = self._market.get_string('/')
-            if worker_market == order.market and self._account.openorders:
+            if worker_market == order.market:
                 orders.append(order)
 
         return orders
 
-    def get_all_own_orders(self, refresh=True):
+    def get_all_own_orders(self, refresh=True, force_refresh=False):
         """ Return the worker's open orders in all markets
 
             :param bool refresh: Use most recent data
+            :param bool force_refresh: Query account data even if it was already refreshed in this block
             :return: List of Order objects
         """
         # Refresh account data
         if refresh:
-            self._account.refresh()
+            self.refresh_account(force=force_refresh)
 
         orders = []
         for order in self._account.openorders:
@@ -788,21 +1434,20 @@ class BitsharesOrderEngine(Storage, Events):
         order['sell_price']['quote']['amount'] = quote_amount
         return order
 
-    @staticmethod
-    def convert_asset(from_value, from_asset, to_asset):
+    def convert_asset(self, from_value, from_asset, to_asset, rate=None):
         """ Converts asset to another based on the latest market value
 
             :param float | from_value: Amount of the input asset
             :param string | from_asset: Symbol of the input asset
             :param string | to_asset: Symbol of the output asset
+            :param float | rate: Known conversion rate, looked up from the latest market value if not given
             :return: float Asset converted to another asset as float value
         """
-        market = Market('{}/{}'.format(from_asset, to_asset))
-        ticker = market.ticker()
-        latest_price = ticker.get('latest', {}).get('price', None)
-        precision = market['base']['precision']
+        if rate is None:
+            rate = self.conversion_rates.get_rate(from_asset, to_asset)
+        precision = Asset(to_asset, bitshares_instance=self.bitshares)['precision']
 
-        return truncate((from_value * latest_price), precision)
+        return truncate((from_value * rate), precision)
 
     def convert_fee(self, fee_amount, fee_asset):
         """ Convert fee amount in BTS to fee in fee_asset
@@ -818,11 +1463,8 @@ class BitsharesOrderEngine(Storage, Events):
             # Fee asset is BTS, so no further calculations are needed
             return fee_amount
         else:
-            if not self.core_exchange_rate:
-                # Determine how many fee_asset is needed for core-exchange
-                temp_market = Market(base=fee_asset, quote=Asset('1.3.0', bitshares_instance=self.bitshares))
-                self.core_exchange_rate = temp_market.ticker()['core_exchange_rate']
-            return fee_amount * self.core_exchange_rate['base']['amount']
+            # Determine how many fee_asset is needed for core-exchange
+            return fee_amount * self.fee_cache.get_core_exchange_rate(fee_asset)
 
     def get_order(self, order_id, return_none=True):
         """ Get Order object with order_id
@@ -835,6 +1477,11 @@ class BitsharesOrderEngine(Storage, Events):
             return None
         if 'id' in order_id:
             order_id = order_id['id']
+        if not self.account_state_stale and order_id in self.own_limit_orders:
+            # Account data is up to date, no need to query the order
+            order = Order(self.own_limit_orders[order_id], bitshares_instance=self.bitshares)
+            order['deleted'] = False
+            return order
         try:
             order = Order(order_id, bitshares_instance=self.bitshares)
         except Exception:
@@ -844,6 +1491,31 @@ class BitsharesOrderEngine(Storage, Events):
             return None
         return order
 
+    def get_orders(self, order_ids, return_none=True):
+        """ Get Order objects of many orders, resolving own orders from account data and the rest with one API call
+
+            :param list order_ids: blockchain Order objects or ids of the orders
+            :param bool return_none: return None instead of an empty Order object when the order doesn't exist
+            :return: list of Order objects in the same order as order_ids
+        """
+        # Outdated account data is not refreshed, querying the orders themselves is cheaper
+        own_orders = {} if self.account_state_stale else self.own_limit_orders
+        limit_orders = self._get_limit_orders(order_ids, own_orders)
+
+        orders = []
+        for order_id in self._get_order_ids(order_ids):
+            limit_order = limit_orders[order_id]
+            if limit_order:
+                order = Order(limit_order, bitshares_instance=self.bitshares)
+                order['deleted'] = False
+            elif return_none:
+                order = None
+            else:
+                # Let Order build the empty "deleted" object
+                order = Order(order_id, bitshares_instance=self.bitshares)
+            orders.append(order)
+        return orders
+
     def is_partially_filled(self, order, threshold=0.3):
         """ Checks whether order was partially filled
 
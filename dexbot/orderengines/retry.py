@@ -0,0 +1,148 @@
+import random
+import time
+
+# Number of maximum retries used to retry action before failing
+MAX_TRIES = 3
+
+# Upper limit of a single backoff delay in seconds
+MAX_DELAY = 60
+
+# Random part of a backoff delay, relative
+JITTER = 0.5
+
+
+class RetryDeferred(Exception):
+    """ Raised instead of sleeping when the retry of an action has to wait
+
+        The worker should stop processing the current event and try again after `delay` seconds.
+    """
+
+    def __init__(self, rule, delay, exception):
+        self.rule = rule
+        self.delay = delay
+        self.exception = exception
+        super().__init__('{}: retry in {:.1f}s after "{}"'.format(rule.name, delay, exception))
+
+
+class RetryRule:
+    """ Class of errors which are worth to retry
+
+        :param str name: short name of the error class, used in counters
+        :param tuple patterns: substrings of the exception text identifying the error
+        :param int budget: maximum number of retries of one action, 0 = never retry
+        :param float delay: base delay before the first retry in seconds, doubled on each next retry
+        :param bool switch_node: True = connect to the next node before retrying
+        :param bool refresh_account: True = refresh account data before retrying
+    """
+
+    def __init__(self, name, patterns, budget=MAX_TRIES + 1, delay=0, switch_node=False, refresh_account=False):
+        self.name = name
+        self.patterns = patterns
+        self.budget = budget
+        self.delay = delay
+        self.switch_node = switch_node
+        self.refresh_account = refresh_account
+
+    def matches(self, exception):
+        message = str(exception)
+        return any(pattern in message for pattern in self.patterns)
+
+
+# Errors known to be spurious or caused by the node
+DEFAULT_RULES = (
+    RetryRule('zero_amount', ('Assert Exception: amount_to_sell.amount > 0',), delay=2, refresh_account=True),
+    # Usually loss of sync to blockchain, wait at least a BitShares block
+    RetryRule('expired', ('now <= trx.expiration',), delay=6),
+    RetryRule(
+        'node_time',
+        ('trx.expiration <= now + chain_parameters.maximum_time_until_expiration',),
+        switch_node=True,
+    ),
+    RetryRule('tapos', ('trx.ref_block_prefix == tapos_block_summary.block_id._hash',), switch_node=True),
+    RetryRule('fee_balance', ('Assert Exception: delta.amount > 0: Insufficient Balance',), budget=0),
+)
+
+
+class RetryPolicy:
+    """ Decides whether and when a failed action is retried
+
+        Delays grow exponentially with random jitter. In non-blocking mode the policy doesn't sleep; it raises
+        :class:`RetryDeferred` and remembers until when the worker should wait, so other workers keep processing
+        blocks meanwhile. Retries are counted per error class until an action succeeds, so an error which persists
+        over several deferrals gets longer delays and finally exhausts its budget.
+
+        :param tuple rules: :class:`RetryRule` instances, the first matching one is used
+        :param bool blocking: True = sleep before retrying, False = raise RetryDeferred
+        :param float max_delay: upper limit of a single delay in seconds
+        :param float jitter: random part of a delay, relative
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, blocking=True, max_delay=MAX_DELAY, jitter=JITTER):
+        self.rules = rules
+        self.blocking = blocking
+        self.max_delay = max_delay
+        self.jitter = jitter
+        # Unix time until which retries are postponed
+        self.deferred_until = 0
+        # {rule name: retries since the last successful action}
+        self.attempts = {}
+        # {rule name: {'retries': int, 'deferred': int, 'exhausted': int}}
+        self.counters = {rule.name: {'retries': 0, 'deferred': 0, 'exhausted': 0} for rule in rules}
+
+    def classify(self, exception):
+        """ Find the rule for the exception
+
+            :return: RetryRule, None if the error should not be retried
+        """
+        for rule in self.rules:
+            if rule.matches(exception):
+                return rule
+        return None
+
+    def next_attempt(self, rule):
+        """ Count a retry of the rule
+
+            :return: int number of the retry counted from 0, None if the budget of the rule is exhausted
+        """
+        attempt = self.attempts.get(rule.name, 0)
+        if attempt >= rule.budget:
+            self.counters[rule.name]['exhausted'] += 1
+            self.reset()
+            return None
+        self.attempts[rule.name] = attempt + 1
+        self.counters[rule.name]['retries'] += 1
+        return attempt
+
+    def reset(self):
+        """ Forget retries of the previous action, called when an action succeeds or finally fails
+        """
+        self.attempts = {}
+
+    def backoff(self, rule, attempt):
+        """ Delay in seconds before retry number `attempt` (counted from 0)
+        """
+        delay = min(self.max_delay, rule.delay * 2 ** attempt)
+        return delay * random.uniform(1, 1 + self.jitter)
+
+    def is_deferred(self):
+        """ Whether the worker should still wait before processing events
+        """
+        return time.time() < self.deferred_until
+
+    def wait(self, rule, attempt, exception):
+        """ Wait before the retry, or raise RetryDeferred in non-blocking mode
+        """
+        delay = self.backoff(rule, attempt)
+        if not delay:
+            return
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            self.counters[rule.name]['deferred'] += 1
+            self.deferred_until = time.time() + delay
+            raise RetryDeferred(rule, delay, exception)
+
+    def stats(self):
+        """ Copy of retry counters per error class
+        """
+        return {name: dict(counters) for name, counters in self.counters.items()}
@@ -3,6 +3,9 @@ import math
 
 from bitshares.instance import shared_bitshares_instance
 from bitshares.price import Order
+from dexbot.pricefeeds.market_depth import MarketDepth, get_depth_prices
+from dexbot.pricefeeds.order_book import get_order_book
+from dexbot.pricefeeds.ticker_cache import get_ticker_cache
 
 
 class BitsharesPriceFeed:
@@ -19,7 +22,6 @@ class BitsharesPriceFeed:
     def __init__(self, market, bitshares_instance=None):
 
         self.market = market
-        self.ticker = self.market.ticker
         self.disabled = False  # flag for suppress errors
 
         # Count of orders to be fetched from the API
@@ -27,17 +29,33 @@ class BitsharesPriceFeed:
         # BitShares instance
         self.bitshares = bitshares_instance or shared_bitshares_instance()
 
+        # Order book shared by all feeds on the market
+        self.order_book = get_order_book(self.bitshares, self.market)
+
+        # Tickers shared by all feeds using the BitShares instance
+        self.ticker_cache = get_ticker_cache(self.bitshares)
+
+        # Market data hub handing out market snapshots, set for workers run by WorkerInfrastructure
+        self.market_data = None
+
         self.log = logging.LoggerAdapter(logging.getLogger('dexbot.pricefeed_log'), {})
 
+    def ticker(self):
+        """ Returns the market ticker, fetched at most once per block
+
+            :return: dict ticker, see bitshares.market.Market.ticker()
+        """
+        return self.ticker_cache.get_ticker(self.market)
+
     def get_limit_orders(self, depth=1):
         """ Returns orders from the current market. Orders are sorted by price. Does not require account info.
 
-            get_limit_orders() call does not have any depth limit.
+            Orders are read from the local order book shared by all workers on the market.
 
             :param int depth: Amount of orders per side will be fetched, default=1
             :return: Returns a list of orders or None
         """
-        orders = self.bitshares.rpc.get_limit_orders(self.market['base']['id'], self.market['quote']['id'], depth)
+        orders = self.order_book.get_limit_orders(depth)
         orders = [Order(o, bitshares_instance=self.bitshares) for o in orders]
         return orders
 
@@ -154,138 +172,67 @@ class BitsharesPriceFeed:
         sell_orders = self.filter_sell_orders(orders)
         return sell_orders
 
-    def get_market_buy_price(self, quote_amount=0, base_amount=0, **kwargs):
-        # TODO: refactor to use orders instead of exclude_own_orders
-        """ Returns the BASE/QUOTE price for which [depth] worth of QUOTE could be bought, enhanced with
-            moving average or weighted moving average
+    @property
+    def market_snapshot(self):
+        """ Snapshot of the market shared by all workers on the market, None if there is no market data hub
 
-            :param float | quote_amount:
-            :param float | base_amount:
-            :param dict | kwargs:
-            :return: price as float
+            :return: MarketSnapshot of [fetch_depth] orders per side
         """
-        market_buy_orders = []
+        if self.market_data is None:
+            return None
+        return self.market_data.get_snapshot(self.market, self.fetch_depth)
 
-        # In case amount is not given, return price of the highest buy order on the market
-        if quote_amount == 0 and base_amount == 0:
-            return float(self.ticker().get('highestBid'))
+    def get_market_depth(self, **kwargs):
+        """ Returns buy and sell sides of one order book snapshot of [fetch_depth] orders per side
 
-        # Like get_market_sell_price(), but defaulting to base_amount if both base and quote are specified.
-        asset_amount = base_amount
+            :param dict | kwargs: passed by subclasses which filter the orders
+            :return: tuple of buy side and sell side as MarketDepth
+        """
+        snapshot = self.market_snapshot
+        if snapshot is not None:
+            return snapshot.buy_side, snapshot.sell_side
 
-        # Since the purpose is never get both quote and base amounts, favor base amount if both given because
-        # this function is looking for buy price.
+        limit_orders = self.order_book.get_limit_orders(self.fetch_depth)
+        return MarketDepth.from_limit_orders(limit_orders, self.market)
 
-        if base_amount > quote_amount:
-            base = True
-        else:
-            asset_amount = quote_amount
-            base = False
-
-        if not market_buy_orders:
-            market_buy_orders = self.get_market_buy_orders(depth=self.fetch_depth)
-        market_fee = self.market['base'].market_fee_percent
-
-        target_amount = asset_amount * (1 + market_fee)
-
-        quote_amount = 0
-        base_amount = 0
-        missing_amount = target_amount
-
-        for order in market_buy_orders:
-            if base:
-                # BASE amount was given
-                if order['base']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['base']['amount']
-                else:
-                    base_amount += missing_amount
-                    quote_amount += missing_amount / order['price']
-                    break
-            elif not base:
-                # QUOTE amount was given
-                if order['quote']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['quote']['amount']
-                else:
-                    base_amount += missing_amount * order['price']
-                    quote_amount += missing_amount
-                    break
-
-        # Prevent division by zero
-        if not quote_amount:
-            return 0.0
-
-        return base_amount / quote_amount
+    def get_market_prices(self, amounts, **kwargs):
+        """ Returns BASE/QUOTE buy and sell prices for several depths from one order book snapshot
 
-    def get_market_sell_price(self, quote_amount=0, base_amount=0, **kwargs):
-        # TODO: refactor to use orders instead of exclude_own_orders
-        """ Returns the BASE/QUOTE price for which [quote_amount] worth of QUOTE could be bought,
-            enhanced with moving average or weighted moving average.
+            Each depth is given as (quote_amount, base_amount) pair, like in get_market_buy_price() and
+            get_market_sell_price(). Zero amounts mean the best price regardless of size.
 
-            [quote/base]_amount = 0 means lowest regardless of size
+            :param list | amounts: (quote_amount, base_amount) tuples
+            :param dict | kwargs: passed to get_market_depth()
+            :return: list of (buy price, sell price) tuples
+        """
+        buy_side, sell_side = self.get_market_depth(**kwargs)
+        buy_fee = self.market['base'].market_fee_percent
+        sell_fee = self.market['quote'].market_fee_percent
+        return get_depth_prices(buy_side, sell_side, amounts, buy_fee, sell_fee)
+
+    def get_market_buy_price(self, quote_amount=0, base_amount=0, **kwargs):
+        """ Returns the BASE/QUOTE price for which [depth] worth of QUOTE could be bought
+
+            [quote/base]_amount = 0 means highest regardless of size
 
             :param float | quote_amount:
             :param float | base_amount:
-            :param dict | kwargs:
-            :return:
+            :param dict | kwargs: passed to get_market_depth()
+            :return: price as float
         """
-        market_sell_orders = []
-
-        # In case amount is not given, return price of the lowest sell order on the market
-        if quote_amount == 0 and base_amount == 0:
-            return float(self.ticker().get('lowestAsk'))
+        return self.get_market_prices([(quote_amount, base_amount)], **kwargs)[0][0]
 
-        asset_amount = quote_amount
+    def get_market_sell_price(self, quote_amount=0, base_amount=0, **kwargs):
+        """ Returns the BASE/QUOTE price for which [quote_amount] worth of QUOTE could be bought
 
-        # Since the purpose is never get both quote and base amounts, favor quote amount if both given because
-        # this function is looking for sell price.
+            [quote/base]_amount = 0 means lowest regardless of size
 
-        if quote_amount > base_amount:
-            quote = True
-        else:
-            asset_amount = base_amount
-            quote = False
-
-        if not market_sell_orders:
-            market_sell_orders = self.get_market_sell_orders(depth=self.fetch_depth)
-        market_fee = self.market['quote'].market_fee_percent
-
-        target_amount = asset_amount * (1 + market_fee)
-
-        quote_amount = 0
-        base_amount = 0
-        missing_amount = target_amount
-
-        for order in market_sell_orders:
-            if quote:
-                # QUOTE amount was given
-                if order['quote']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['quote']['amount']
-                else:
-                    base_amount += missing_amount * order['price']
-                    quote_amount += missing_amount
-                    break
-            elif not quote:
-                # BASE amount was given
-                if order['base']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['base']['amount']
-                else:
-                    base_amount += missing_amount
-                    quote_amount += missing_amount / order['price']
-                    break
-
-        # Prevent division by zero
-        if not quote_amount:
-            return 0.0
-
-        return base_amount / quote_amount
+            :param float | quote_amount:
+            :param float | base_amount:
+            :param dict | kwargs: passed to get_market_depth()
+            :return: price as float
+        """
+        return self.get_market_prices([(quote_amount, base_amount)], **kwargs)[0][1]
 
     def get_market_center_price(self, base_amount=0, quote_amount=0, suppress_errors=False):
         """ Returns the center price of market including own orders.
@@ -296,8 +243,7 @@ class BitsharesPriceFeed:
             :return: Market center price as float
         """
         center_price = None
-        buy_price = self.get_market_buy_price(quote_amount=quote_amount, base_amount=base_amount)
-        sell_price = self.get_market_sell_price(quote_amount=quote_amount, base_amount=base_amount)
+        buy_price, sell_price = self.get_market_prices([(quote_amount, base_amount)])[0]
 
         if buy_price is None or buy_price == 0.0:
             if not suppress_errors:
@@ -323,8 +269,7 @@ class BitsharesPriceFeed:
             :param float | base_amount:
             :return: Market spread as float or None
         """
-        ask = self.get_market_sell_price(quote_amount=quote_amount, base_amount=base_amount)
-        bid = self.get_market_buy_price(quote_amount=quote_amount, base_amount=base_amount)
+        bid, ask = self.get_market_prices([(quote_amount, base_amount)])[0]
 
         # Calculate market spread
         if ask == 0 or bid == 0:
@@ -0,0 +1,127 @@
+import threading
+
+from bitshares.market import Market
+from dexbot.pricefeeds.market_depth import MarketDepth, get_depth_prices
+from dexbot.pricefeeds.order_book import get_order_book
+from dexbot.pricefeeds.ticker_cache import get_ticker_cache, notification_asset_ids
+
+
+class MarketSnapshot:
+    """ Market data of one block, shared read-only by all workers on the market
+
+        :param block: id of the block the snapshot was taken at
+        :param list limit_orders: raw limit orders, buy orders followed by sell orders, best first
+        :param dict ticker: market ticker
+        :param MarketDepth buy_side: buy orders
+        :param MarketDepth sell_side: sell orders
+    """
+
+    def __init__(self, block, limit_orders, ticker, buy_side, sell_side):
+        self.block = block
+        self.limit_orders = limit_orders
+        self.ticker = ticker
+        self.buy_side = buy_side
+        self.sell_side = sell_side
+
+
+class MarketDataHub:
+    """ Market objects and per-block market snapshots shared by all workers of :class:`WorkerInfrastructure`
+
+        Workers subscribe to their market with the order book depth they use and the depths they price the market
+        at. The first worker asking for a market after a new block makes the hub take one snapshot of the market and
+        depth: order book, ticker and buy/sell prices at the depths of all subscribed workers. Snapshots of a market
+        are dropped when a notification about the market comes in and are taken again on the next request. So the node
+        is queried per market, not per worker, and only for markets somebody looks at.
+
+        :param bitshares.BitShares bitshares: BitShares instance
+    """
+
+    def __init__(self, bitshares):
+        self.bitshares = bitshares
+        self.lock = threading.RLock()
+        self.block = None
+        # {market name: Market}
+        self.markets = {}
+        # {worker name: (Market, fetch depth, list of (quote_amount, base_amount))}
+        self.subscriptions = {}
+        # {(base id, quote id, fetch depth): MarketSnapshot}
+        self.snapshots = {}
+
+    def get_market(self, name):
+        """ Market object shared by all workers on the market
+
+            :param str name: market name, e.g. 'QUOTE/BASE'
+            :return: bitshares.market.Market
+        """
+        with self.lock:
+            if name not in self.markets:
+                self.markets[name] = Market(name, bitshares_instance=self.bitshares)
+            return self.markets[name]
+
+    def subscribe(self, worker_name, market_name, depth, amounts=()):
+        """ Price snapshots of the market at the depths the worker uses
+
+            :param str worker_name: name of the worker
+            :param str market_name: market name, e.g. 'QUOTE/BASE'
+            :param int depth: number of orders per side the worker prices the market from
+            :param list amounts: (quote_amount, base_amount) depths the worker prices the market at
+        """
+        with self.lock:
+            self.subscriptions[worker_name] = (self.get_market(market_name), depth, list(amounts))
+
+    def unsubscribe(self, worker_name):
+        with self.lock:
+            self.subscriptions.pop(worker_name, None)
+
+    def on_block(self, block, *args, **kwargs):
+        """ Drop snapshots of the previous block, new ones are taken on first request
+        """
+        # Tickers of the previous block must not get into the snapshots
+        get_ticker_cache(self.bitshares).on_block(block)
+
+        with self.lock:
+            self.block = block
+            self.snapshots = {}
+
+    def on_market(self, notification):
+        """ Drop snapshots of the market the notification belongs to
+
+            :param notification: market notification, deleted orders carry no market and drop all snapshots
+        """
+        asset_ids = notification_asset_ids(notification)
+        with self.lock:
+            for key in list(self.snapshots):
+                if asset_ids is None or frozenset(key[:2]) == asset_ids:
+                    del self.snapshots[key]
+
+    def get_snapshot(self, market, depth, amounts=None):
+        """ Snapshot of the market, taken if there is none since the last block or market notification
+
+            :param bitshares.market.Market market: market
+            :param int depth: number of orders per side
+            :param iterable amounts: (quote_amount, base_amount) depths to price the market at in advance, default is
+                the depths of all workers subscribed to the market and depth
+            :return: MarketSnapshot
+        """
+        with self.lock:
+            key = (market['base']['id'], market['quote']['id'], depth)
+            snapshot = self.snapshots.get(key)
+            if snapshot is not None:
+                return snapshot
+
+            if amounts is None:
+                amounts = set()
+                for subscribed_market, subscribed_depth, subscribed_amounts in self.subscriptions.values():
+                    if (subscribed_market['base']['id'], subscribed_market['quote']['id'], subscribed_depth) == key:
+                        amounts.update(subscribed_amounts)
+
+            limit_orders = get_order_book(self.bitshares, market).get_limit_orders(depth)
+            ticker = get_ticker_cache(self.bitshares).get_ticker(market)
+            buy_side, sell_side = MarketDepth.from_limit_orders(limit_orders, market)
+            get_depth_prices(
+                buy_side, sell_side, amounts, market['base'].market_fee_percent, market['quote'].market_fee_percent
+            )
+
+            snapshot = MarketSnapshot(self.block, limit_orders, ticker, buy_side, sell_side)
+            self.snapshots[key] = snapshot
+            return snapshot
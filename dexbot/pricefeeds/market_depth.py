@@ -0,0 +1,144 @@
+from bisect import bisect_right
+
+
+class MarketDepth:
+    """ One side of the order book as cumulative BASE and QUOTE amounts, best order first
+
+        The side is walked once when the snapshot is taken; the price for any amount is then found by bisection over
+        the cumulative amounts, so several depths are priced from the same snapshot without walking the orders again.
+
+        All prices are BASE/QUOTE, sell orders are stored inverted like in :meth:`filter_sell_orders`.
+
+        :param list orders: (base amount, quote amount) tuples, best order first
+    """
+
+    def __init__(self, orders=()):
+        self.prices = []
+        self.base_totals = []
+        self.quote_totals = []
+        # {(amount, base): price}, sides may be shared by several workers asking for the same depths
+        self.price_cache = {}
+
+        base_total = 0
+        quote_total = 0
+        for base_amount, quote_amount in orders:
+            base_total += base_amount
+            quote_total += quote_amount
+            self.prices.append(base_amount / quote_amount)
+            self.base_totals.append(base_total)
+            self.quote_totals.append(quote_total)
+
+    @classmethod
+    def from_limit_orders(cls, limit_orders, market):
+        """ Split raw limit orders into buy and sell sides
+
+            Amounts are taken from the order prices, same as in :class:`bitshares.price.Order`, without creating the
+            objects.
+
+            :param list limit_orders: raw limit orders as returned by get_limit_orders API call, best first
+            :param bitshares.market.Market market: market of the orders
+            :return: tuple of buy side and sell side
+        """
+        base_id = market['base']['id']
+        base_precision = 10 ** market['base']['precision']
+        quote_precision = 10 ** market['quote']['precision']
+
+        buy_orders = []
+        sell_orders = []
+        for limit_order in limit_orders:
+            sell_price = limit_order['sell_price']
+            if sell_price['base']['asset_id'] == base_id:
+                base_amount = int(sell_price['base']['amount']) / base_precision
+                quote_amount = int(sell_price['quote']['amount']) / quote_precision
+                buy_orders.append((base_amount, quote_amount))
+            else:
+                base_amount = int(sell_price['quote']['amount']) / base_precision
+                quote_amount = int(sell_price['base']['amount']) / quote_precision
+                sell_orders.append((base_amount, quote_amount))
+
+        return cls(buy_orders), cls(sell_orders)
+
+    @property
+    def best_price(self):
+        """ Price of the best order, 0.0 if the side is empty
+        """
+        if not self.prices:
+            return 0.0
+        return self.prices[0]
+
+    def get_price(self, amount, base=False):
+        """ Average price for which the amount could be traded against this side
+
+            If the side is not deep enough, the average price of the whole side is returned.
+
+            :param float amount: amount to trade
+            :param bool base: True = amount is in BASE, False = amount is in QUOTE
+            :return: price as float, 0.0 if the side is empty
+        """
+        if (amount, base) in self.price_cache:
+            return self.price_cache[(amount, base)]
+
+        totals = self.base_totals if base else self.quote_totals
+        # Number of orders which are taken whole
+        index = bisect_right(totals, amount)
+
+        base_amount = self.base_totals[index - 1] if index else 0
+        quote_amount = self.quote_totals[index - 1] if index else 0
+        if index < len(self.prices):
+            # Remaining amount is taken from the next order
+            missing_amount = amount - (totals[index - 1] if index else 0)
+            if base:
+                base_amount += missing_amount
+                quote_amount += missing_amount / self.prices[index]
+            else:
+                base_amount += missing_amount * self.prices[index]
+                quote_amount += missing_amount
+
+        # Prevent division by zero
+        price = base_amount / quote_amount if quote_amount else 0.0
+        self.price_cache[(amount, base)] = price
+        return price
+
+    def get_prices(self, amounts, base=False):
+        """ Average prices for several amounts, see :meth:`get_price`
+
+            :param list amounts: amounts to trade
+            :param bool base: True = amounts are in BASE, False = amounts are in QUOTE
+            :return: list of prices
+        """
+        return [self.get_price(amount, base=base) for amount in amounts]
+
+
+def get_depth_prices(buy_side, sell_side, amounts, buy_fee=0, sell_fee=0):
+    """ BASE/QUOTE buy and sell prices for several depths
+
+        Each depth is given as (quote_amount, base_amount) pair. Zero amounts mean the best price regardless of size.
+        Since the purpose is never get both quote and base amounts, buy price favors base amount and sell price favors
+        quote amount if both are given.
+
+        :param MarketDepth buy_side: buy orders
+        :param MarketDepth sell_side: sell orders
+        :param list amounts: (quote_amount, base_amount) tuples
+        :param float buy_fee: market fee of BASE, added to the amounts traded against buy orders
+        :param float sell_fee: market fee of QUOTE, added to the amounts traded against sell orders
+        :return: list of (buy price, sell price) tuples
+    """
+    prices = []
+    for quote_amount, base_amount in amounts:
+        if quote_amount == 0 and base_amount == 0:
+            prices.append((buy_side.best_price, sell_side.best_price))
+            continue
+
+        if base_amount > quote_amount:
+            buy_price = buy_side.get_price(base_amount * (1 + buy_fee), base=True)
+        else:
+            buy_price = buy_side.get_price(quote_amount * (1 + buy_fee))
+
+        if quote_amount > base_amount:
+            sell_price = sell_side.get_price(quote_amount * (1 + sell_fee))
+        else:
+            sell_price = sell_side.get_price(base_amount * (1 + sell_fee), base=True)
+
+        prices.append((buy_price, sell_price))
+
+    return prices
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+import weakref
+
+log = logging.getLogger(__name__)
+
+# Number of orders per side kept in the local order book
+ORDER_BOOK_DEPTH = 100
+
+# Seconds between consistency checks of a local order book against the node
+ORDER_BOOK_CHECK_INTERVAL = 60
+
+
+def limit_order_price(limit_order):
+    """ Price of a raw limit order as sold asset per received asset, used to sort the book best first
+    """
+    sell_price = limit_order['sell_price']
+    return int(sell_price['base']['amount']) / int(sell_price['quote']['amount'])
+
+
+def raw_limit_order(order):
+    """ Convert Order object from a market notification back into raw limit order object
+    """
+    for_sale = order['for_sale']
+    return {
+        'id': order['id'],
+        'seller': order['seller'],
+        'for_sale': int(round(for_sale['amount'] * 10 ** for_sale['asset']['precision'])),
+        'sell_price': order['sell_price'],
+        'expiration': order.get('expiration'),
+        'deferred_fee': order.get('deferred_fee', 0),
+    }
+
+
+class OrderBook:
+    """ Local copy of the limit orders of one market, shared by the workers on the market
+
+        The book is seeded from the node and then kept up to date from market notifications passed to
+        :meth:`update`. Until :attr:`live` is set by the one subscribed to the notifications, every read fetches the
+        book from the node, as before. Every `check_interval` seconds the local book is compared with a fresh snapshot
+        and replaced if they differ.
+
+        :param bitshares.BitShares bitshares: BitShares instance
+        :param str base_id: id of the market BASE asset
+        :param str quote_id: id of the market QUOTE asset
+        :param int depth: number of orders per side to keep
+        :param float check_interval: seconds between consistency checks
+    """
+
+    def __init__(self, bitshares, base_id, quote_id, depth=ORDER_BOOK_DEPTH, check_interval=ORDER_BOOK_CHECK_INTERVAL):
+        self.bitshares = bitshares
+        self.base_id = base_id
+        self.quote_id = quote_id
+        self.depth = depth
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        # {asset id sold by the orders: {order id: raw limit order}}
+        self.sides = {base_id: {}, quote_id: {}}
+        # Worst price per side known to have no gaps below it, None = whole side is known
+        self.horizon = {base_id: None, quote_id: None}
+        # Market notifications are passed to update()
+        self.live = False
+        self.synced_at = None
+
+    def fetch(self, depth):
+        """ Fetch raw limit orders from the node
+        """
+        return self.bitshares.rpc.get_limit_orders(self.base_id, self.quote_id, depth)
+
+    def sync(self):
+        """ Replace the local book with a fresh snapshot from the node
+
+            :return: bool True = local book matched the snapshot
+        """
+        limit_orders = self.fetch(self.depth)
+        with self.lock:
+            sides = {self.base_id: {}, self.quote_id: {}}
+            for limit_order in limit_orders:
+                sides[limit_order['sell_price']['base']['asset_id']][limit_order['id']] = limit_order
+
+            horizon = {}
+            for asset_id, side in sides.items():
+                if len(side) < self.depth:
+                    horizon[asset_id] = None
+                else:
+                    horizon[asset_id] = min(limit_order_price(limit_order) for limit_order in side.values())
+
+            consistent = self.synced_at is None or self._snapshot(sides, horizon) == self._snapshot(
+                self.sides, horizon
+            )
+            if not consistent:
+                log.warning('Local order book {}/{} got out of sync, replacing it'.format(self.quote_id, self.base_id))
+            self.sides = sides
+            self.horizon = horizon
+            self.synced_at = time.time()
+            return consistent
+
+    @staticmethod
+    def _snapshot(sides, horizon):
+        """ Comparable state of the orders within the horizon
+        """
+        snapshot = {}
+        for asset_id, side in sides.items():
+            snapshot[asset_id] = {
+                order_id: (str(limit_order['for_sale']), limit_order_price(limit_order))
+                for order_id, limit_order in side.items()
+                if horizon[asset_id] is None or limit_order_price(limit_order) >= horizon[asset_id]
+            }
+        return snapshot
+
+    def update(self, order):
+        """ Apply a market notification
+
+            :param bitshares.price.Order order: new, changed or deleted limit order, other notifications are ignored
+        """
+        with self.lock:
+            if order.get('deleted'):
+                for side in self.sides.values():
+                    side.pop(order['id'], None)
+                return
+
+            limit_order = raw_limit_order(order)
+            asset_id = limit_order['sell_price']['base']['asset_id']
+            if asset_id in self.sides:
+                self.sides[asset_id][limit_order['id']] = limit_order
+
+    def get_limit_orders(self, depth=1):
+        """ Raw limit orders of both sides, best first, like get_limit_orders API call
+
+            :param int depth: number of orders per side
+            :return: list of buy orders followed by sell orders
+        """
+        if depth > self.depth:
+            return self.fetch(depth)
+
+        with self.lock:
+            expired = self.synced_at is None or time.time() - self.synced_at > self.check_interval
+            if not self.live or expired:
+                self.sync()
+
+            limit_orders = []
+            for asset_id in (self.base_id, self.quote_id):
+                side = self._get_side(asset_id)
+                if len(side) < depth and self.horizon[asset_id] is not None:
+                    # Orders deeper than the known part of the book are needed
+                    self.sync()
+                    side = self._get_side(asset_id)
+                limit_orders.extend(side[:depth])
+            return limit_orders
+
+    def _get_side(self, asset_id):
+        """ Orders of one side within the horizon, best first
+        """
+        horizon = self.horizon[asset_id]
+        side = [
+            limit_order
+            for limit_order in self.sides[asset_id].values()
+            if horizon is None or limit_order_price(limit_order) >= horizon
+        ]
+        return sorted(side, key=limit_order_price, reverse=True)
+
+
+# Order books per BitShares instance and market
+order_books = weakref.WeakKeyDictionary()
+order_books_lock = threading.Lock()
+
+
+def get_order_book(bitshares, market):
+    """ Get order book shared by all workers using the BitShares instance and the market
+
+        :param bitshares.BitShares bitshares: BitShares instance
+        :param bitshares.market.Market market: market
+    """
+    key = frozenset((market['base']['id'], market['quote']['id']))
+    with order_books_lock:
+        books = order_books.setdefault(bitshares, {})
+        if key not in books:
+            books[key] = OrderBook(bitshares, market['base']['id'], market['quote']['id'])
+        return books[key]
+
+
+def update_order_books(bitshares, order):
+    """ Pass a market notification to the order books of the BitShares instance
+
+        :param bitshares.BitShares bitshares: BitShares instance
+        :param order: market notification, only :class:`bitshares.price.Order` changes the books
+    """
+    books = order_books.get(bitshares, {})
+    if order.get('deleted'):
+        # Deleted orders carry no market, try all books
+        for book in list(books.values()):
+            book.update(order)
+        return
+
+    if 'for_sale' not in order or 'sell_price' not in order:
+        return
+    sell_price = order['sell_price']
+    book = books.get(frozenset((sell_price['base']['asset_id'], sell_price['quote']['asset_id'])))
+    if book:
+        book.update(order)
@@ -0,0 +1,448 @@
+import bisect
+import logging
+import mmap
+import os
+import struct
+import time
+
+from bitshares.utils import parse_time
+from dexbot.helper import get_user_data_directory, mkdir
+from dexbot.pricefeeds.order_book import get_order_book
+
+log = logging.getLogger(__name__)
+
+# Number of orders per side recorded by default
+RECORDER_DEPTH = 8
+
+RECORDING_MAGIC = b'DXOB'
+RECORDING_VERSION = 1
+
+# File header: magic, version, depth, base precision, quote precision, base symbol, quote symbol
+HEADER = struct.Struct('<4sHHBB16s16s')
+
+# Record header: block number, unix time, number of buy orders, sell orders and fills
+RECORD = struct.Struct('<IdHHH')
+
+# Index entry: block number, unix time, offset of the record in the data file
+INDEX_ENTRY = struct.Struct('<IdQ')
+
+# Fill sides
+BUY = 0
+SELL = 1
+
+
+def block_number(block_id):
+    """ Block number encoded in the first 4 bytes of a block id
+    """
+    return int(block_id[:8], 16)
+
+
+def get_columns(limit_orders, market):
+    """ Convert raw limit orders into price and amount columns
+
+        Prices are BASE/QUOTE, amounts are remaining QUOTE amounts, sell orders are inverted like in
+        :meth:`filter_sell_orders`.
+
+        :param list limit_orders: raw limit orders, best first
+        :param bitshares.market.Market market: market of the orders
+        :return: tuple of buy prices, buy amounts, sell prices, sell amounts
+    """
+    base_id = market['base']['id']
+    base_precision = 10 ** market['base']['precision']
+    quote_precision = 10 ** market['quote']['precision']
+
+    buy_prices, buy_amounts, sell_prices, sell_amounts = [], [], [], []
+    for limit_order in limit_orders:
+        sell_price = limit_order['sell_price']
+        if sell_price['base']['asset_id'] == base_id:
+            price = (int(sell_price['base']['amount']) / base_precision) / (
+                int(sell_price['quote']['amount']) / quote_precision
+            )
+            buy_prices.append(price)
+            buy_amounts.append(int(limit_order['for_sale']) / base_precision / price)
+        else:
+            price = (int(sell_price['quote']['amount']) / base_precision) / (
+                int(sell_price['base']['amount']) / quote_precision
+            )
+            sell_prices.append(price)
+            sell_amounts.append(int(limit_order['for_sale']) / quote_precision)
+
+    return tuple(buy_prices), tuple(buy_amounts), tuple(sell_prices), tuple(sell_amounts)
+
+
+def get_fill(fill, market):
+    """ Convert fill notification into price, QUOTE amount and side of the filled order
+
+        :param dict fill: raw fill with `pays` and `receives` amounts, e.g. :class:`bitshares.price.FilledOrder`
+        :param bitshares.market.Market market: market of the fill
+        :return: tuple (price, amount, side)
+    """
+    base_precision = 10 ** market['base']['precision']
+    quote_precision = 10 ** market['quote']['precision']
+
+    if fill['pays']['asset_id'] == market['base']['id']:
+        base_amount = int(fill['pays']['amount']) / base_precision
+        quote_amount = int(fill['receives']['amount']) / quote_precision
+        side = BUY
+    else:
+        base_amount = int(fill['receives']['amount']) / base_precision
+        quote_amount = int(fill['pays']['amount']) / quote_precision
+        side = SELL
+
+    return base_amount / quote_amount, quote_amount, side
+
+
+def record_size(buys, sells, fills):
+    """ Size of a record in the data file including its header
+    """
+    return RECORD.size + (2 * buys + 2 * sells + 2 * fills) * 8 + fills
+
+
+def recording_paths(path, market):
+    """ Paths of the data file and the index file of a market recording
+    """
+    name = os.path.join(path, market.get_string('_'))
+    return name + '.book', name + '.index'
+
+
+class MarketRecorder:
+    """ Writes order book snapshots and fills of one market into an append-only recording
+
+        The data file starts with a header, followed by one record per recorded block: record header, then columns of
+        buy prices, buy amounts, sell prices, sell amounts, fill prices, fill amounts and fill sides. Prices and amounts
+        are little-endian doubles, sides are bytes. The index file holds one fixed-width entry per record with the
+        block number and the offset of the record. Blocks where neither the book changed nor fills happened are not
+        recorded.
+
+        :param str path: directory of the recording
+        :param bitshares.market.Market market: market to record
+        :param int depth: number of orders per side to record
+    """
+
+    def __init__(self, path, market, depth=RECORDER_DEPTH):
+        self.market = market
+        self.depth = depth
+        self.fills = []
+        self.last_columns = None
+
+        mkdir(path)
+        self.data_file, self.index_file = recording_paths(path, market)
+        self.repair()
+        self.data = open(self.data_file, 'ab')
+        self.index = open(self.index_file, 'ab')
+
+        header = HEADER.pack(
+            RECORDING_MAGIC,
+            RECORDING_VERSION,
+            depth,
+            market['base']['precision'],
+            market['quote']['precision'],
+            market['base']['symbol'].encode(),
+            market['quote']['symbol'].encode(),
+        )
+        if not self.data.tell():
+            self.data.write(header)
+            self.data.flush()
+        else:
+            with open(self.data_file, 'rb') as data:
+                existing = HEADER.unpack(data.read(HEADER.size))
+            if existing[:2] != (RECORDING_MAGIC, RECORDING_VERSION) or existing[5:] != HEADER.unpack(header)[5:]:
+                raise ValueError('{} is not a recording of {}'.format(self.data_file, market.get_string('/')))
+
+    def repair(self):
+        """ Cut off the tail of the recording left by an interrupted write
+
+            The index is truncated to whole entries pointing to complete records, the data file is truncated to the
+            end of the last indexed record, so appended records and entries stay aligned.
+        """
+        if not os.path.exists(self.data_file) or not os.path.exists(self.index_file):
+            return
+
+        data_size = os.path.getsize(self.data_file)
+        index_size = os.path.getsize(self.index_file)
+        entries = index_size // INDEX_ENTRY.size
+        data_end = min(data_size, HEADER.size)
+
+        with open(self.data_file, 'rb') as data, open(self.index_file, 'rb') as index:
+            while entries:
+                index.seek((entries - 1) * INDEX_ENTRY.size)
+                _, _, offset = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+                data.seek(offset)
+                header = data.read(RECORD.size)
+                if len(header) == RECORD.size:
+                    _, _, buys, sells, fills = RECORD.unpack(header)
+                    if offset + record_size(buys, sells, fills) <= data_size:
+                        data_end = offset + record_size(buys, sells, fills)
+                        break
+                entries -= 1
+
+        if index_size != entries * INDEX_ENTRY.size:
+            log.warning('Dropping incomplete index entries of {}'.format(self.index_file))
+            os.truncate(self.index_file, entries * INDEX_ENTRY.size)
+        if data_size != data_end:
+            log.warning('Dropping incomplete records of {}'.format(self.data_file))
+            os.truncate(self.data_file, data_end)
+
+    def add_fill(self, fill):
+        """ Remember a fill to be written with the next block
+
+            :param dict fill: raw fill with `pays` and `receives` amounts
+        """
+        self.fills.append(get_fill(fill, self.market))
+
+    def record(self, block_num, limit_orders, timestamp=None):
+        """ Write the order book and fills of the block
+
+            :param int block_num: block number
+            :param list limit_orders: raw limit orders, buy orders followed by sell orders, best first
+            :param float timestamp: unix time of the block, default now
+            :return: bool True = record was written, False = nothing changed since the previous record
+        """
+        columns = get_columns(limit_orders, self.market)
+        if columns == self.last_columns and not self.fills:
+            return False
+
+        buy_prices, buy_amounts, sell_prices, sell_amounts = columns
+        fill_prices = [fill[0] for fill in self.fills]
+        fill_amounts = [fill[1] for fill in self.fills]
+        fill_sides = bytes(fill[2] for fill in self.fills)
+        timestamp = time.time() if timestamp is None else timestamp
+
+        offset = self.data.tell()
+        self.data.write(RECORD.pack(block_num, timestamp, len(buy_prices), len(sell_prices), len(self.fills)))
+        for column in (buy_prices, buy_amounts, sell_prices, sell_amounts, fill_prices, fill_amounts):
+            self.data.write(struct.pack('<{}d'.format(len(column)), *column))
+        self.data.write(fill_sides)
+        self.data.flush()
+
+        # Index entry is written after the record, so an entry never points to an incomplete record
+        self.index.write(INDEX_ENTRY.pack(block_num, timestamp, offset))
+        self.index.flush()
+
+        self.last_columns = columns
+        self.fills = []
+        return True
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class OrderBookRecorder:
+    """ Records order book snapshots and fills of configured markets, driven by market notifications and blocks
+
+        Enabled by the `recorder` section of the config:
+
+        .. code-block:: yaml
+
+            recorder:
+                markets: [USD/BTS, CNY/BTS]
+                depth: 8  # orders per side, optional
+                path: /path/to/recordings  # optional, default is recordings in the user data directory
+
+        :param bitshares.BitShares bitshares: BitShares instance
+        :param list markets: :class:`bitshares.market.Market` objects to record
+        :param str path: directory of the recordings
+        :param int depth: number of orders per side to record
+    """
+
+    def __init__(self, bitshares, markets, path, depth=RECORDER_DEPTH):
+        self.bitshares = bitshares
+        self.recorders = {}
+        for market in markets:
+            key = frozenset((market['base']['id'], market['quote']['id']))
+            self.recorders[key] = MarketRecorder(path, market, depth)
+            # Market notifications keep the order book up to date
+            get_order_book(bitshares, market).live = True
+
+    @classmethod
+    def from_config(cls, bitshares, config, get_market):
+        """ Create the recorder from the config
+
+            :param bitshares.BitShares bitshares: BitShares instance
+            :param dict config: dexbot config
+            :param callable get_market: returns :class:`bitshares.market.Market` by market name
+            :return: OrderBookRecorder or None if recording is not configured
+        """
+        settings = config.get('recorder')
+        if not settings or not settings.get('markets'):
+            return None
+
+        path = settings.get('path') or os.path.join(get_user_data_directory(), 'recordings')
+        markets = [get_market(name) for name in settings['markets']]
+        return cls(bitshares, markets, path, settings.get('depth', RECORDER_DEPTH))
+
+    @property
+    def market_names(self):
+        return [recorder.market.get_string('/') for recorder in self.recorders.values()]
+
+    def on_market(self, notification):
+        """ Remember fills of the recorded markets
+
+            A trade is notified once for each of the matched orders, only the maker side is recorded.
+
+            :param notification: market notification, only fills are used
+        """
+        if 'pays' not in notification or 'receives' not in notification:
+            return
+        if not notification.get('is_maker', True):
+            return
+        recorder = self.recorders.get(
+            frozenset((notification['pays']['asset_id'], notification['receives']['asset_id']))
+        )
+        if recorder:
+            recorder.add_fill(notification)
+
+    def on_block(self, block_id, *args, **kwargs):
+        """ Record order books of all recorded markets
+        """
+        block_num = block_number(block_id)
+        try:
+            # Records are stamped with chain time, so they line up with blocks on replay
+            timestamp = parse_time(self.bitshares.rpc.get_block_header(block_num)['timestamp']).timestamp()
+        except Exception:
+            log.exception('Getting time of block {}'.format(block_num))
+            timestamp = None
+
+        for recorder in self.recorders.values():
+            try:
+                limit_orders = get_order_book(self.bitshares, recorder.market).get_limit_orders(recorder.depth)
+                recorder.record(block_num, limit_orders, timestamp)
+            except Exception:
+                log.exception('Recording order book of {}'.format(recorder.market.get_string('/')))
+
+    def close(self):
+        for recorder in self.recorders.values():
+            recorder.close()
+
+
+class RecordedSnapshot:
+    """ Order book and fills of one recorded block
+
+        Orders are dicts shaped like :class:`bitshares.price.Order` objects returned by get_market_buy_orders() and
+        get_market_sell_orders(): `price` as BASE/QUOTE, `base` and `quote` amounts with symbols.
+    """
+
+    def __init__(self, block_num, timestamp, buy_orders, sell_orders, fills):
+        self.block_num = block_num
+        self.timestamp = timestamp
+        self.buy_orders = buy_orders
+        self.sell_orders = sell_orders
+        self.fills = fills
+
+
+class _IndexBlocks:
+    """ Block numbers of the index entries as a sequence, for bisect
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return len(self.reader)
+
+    def __getitem__(self, i):
+        return INDEX_ENTRY.unpack_from(self.reader.index, i * INDEX_ENTRY.size)[0]
+
+
+class RecordingReader:
+    """ Memory-mapped read access to a market recording
+
+        Records written after the reader was opened are not visible, open a new reader to see them.
+
+        :param str data_file: path of the data file
+        :param str index_file: path of the index file, default is the data file with .index extension
+    """
+
+    def __init__(self, data_file, index_file=None):
+        if index_file is None:
+            index_file = os.path.splitext(data_file)[0] + '.index'
+
+        self._files = [open(data_file, 'rb'), open(index_file, 'rb')]
+        # Index is mapped first, records of all its entries are already in the data file
+        if os.fstat(self._files[1].fileno()).st_size:
+            self.index = mmap.mmap(self._files[1].fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.index = b''
+        self.data = mmap.mmap(self._files[0].fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.depth, base_precision, quote_precision, base, quote = HEADER.unpack_from(self.data)
+        if (magic, version) != (RECORDING_MAGIC, RECORDING_VERSION):
+            raise ValueError('{} is not a recording'.format(data_file))
+        self.base_symbol = base.rstrip(b'\0').decode()
+        self.quote_symbol = quote.rstrip(b'\0').decode()
+        self.blocks = _IndexBlocks(self)
+
+    @classmethod
+    def open(cls, path, market):
+        """ Open recording of the market made by :class:`OrderBookRecorder`
+
+            :param str path: directory of the recordings
+            :param bitshares.market.Market market: market
+        """
+        return cls(*recording_paths(path, market))
+
+    def __len__(self):
+        # Incomplete trailing entry of an interrupted write is ignored
+        return len(self.index) // INDEX_ENTRY.size
+
+    def __getitem__(self, i):
+        """ Snapshot of record number i
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('record index out of range')
+
+        _, _, offset = INDEX_ENTRY.unpack_from(self.index, i * INDEX_ENTRY.size)
+        block_num, timestamp, buys, sells, fills = RECORD.unpack_from(self.data, offset)
+        offset += RECORD.size
+
+        columns = []
+        for count in (buys, buys, sells, sells, fills, fills):
+            columns.append(struct.unpack_from('<{}d'.format(count), self.data, offset))
+            offset += count * 8
+        sides = struct.unpack_from('<{}B'.format(fills), self.data, offset)
+        buy_prices, buy_amounts, sell_prices, sell_amounts, fill_prices, fill_amounts = columns
+
+        return RecordedSnapshot(
+            block_num,
+            timestamp,
+            [self.order_view(price, amount) for price, amount in zip(buy_prices, buy_amounts)],
+            [self.order_view(price, amount) for price, amount in zip(sell_prices, sell_amounts)],
+            [
+                dict(self.order_view(price, amount), type='buy' if side == BUY else 'sell')
+                for price, amount, side in zip(fill_prices, fill_amounts, sides)
+            ],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def order_view(self, price, amount):
+        """ Order-like dict of an order of `amount` QUOTE at `price` BASE/QUOTE
+        """
+        return {
+            'price': price,
+            'base': {'amount': amount * price, 'symbol': self.base_symbol},
+            'quote': {'amount': amount, 'symbol': self.quote_symbol},
+        }
+
+    def get_snapshot(self, block_num):
+        """ Order book as it was at the block, fills are those of the latest recorded block at or before it
+
+            :param int block_num: block number
+            :return: RecordedSnapshot, None if the recording starts after the block
+        """
+        i = bisect.bisect_right(self.blocks, block_num)
+        if not i:
+            return None
+        return self[i - 1]
+
+    def close(self):
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+        self.data.close()
+        for file in self._files:
+            file.close()
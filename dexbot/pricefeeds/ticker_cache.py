@@ -0,0 +1,94 @@
+import threading
+import time
+import weakref
+
+# Maximum age in seconds of cached tickers, normally they are dropped on every new block
+TICKER_CACHE_TTL = 3
+
+
+def notification_asset_ids(notification):
+    """ Ids of the assets of the market a market notification belongs to
+
+        :param notification: :class:`bitshares.price.Order`, :class:`bitshares.price.FilledOrder` or
+            :class:`bitshares.price.UpdateCallOrder`
+        :return: frozenset of asset ids, None if the market is unknown, e.g. for deleted orders
+    """
+    if 'sell_price' in notification:
+        sell_price = notification['sell_price']
+        return frozenset((sell_price['base']['asset_id'], sell_price['quote']['asset_id']))
+    if notification.get('base') and notification.get('quote'):
+        return frozenset((notification['base']['asset']['id'], notification['quote']['asset']['id']))
+    return None
+
+
+class TickerCache:
+    """ Market tickers shared by the workers using the same BitShares instance
+
+        Each ticker is fetched once per block. It is dropped when a new block arrives or when a notification about
+        its market comes in, because orders and fills change the ticker. Cached tickers expire after `ttl` seconds in
+        case no blocks are passed to :meth:`on_block`.
+
+        :param float ttl: maximum age of cached tickers in seconds
+    """
+
+    def __init__(self, ttl=TICKER_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.block = None
+        # {(base_id, quote_id): (ticker, expiration time)}
+        self.tickers = {}
+
+    def on_block(self, block, *args, **kwargs):
+        """ Drop cached tickers when a new block arrives
+
+            Subscribed to ontick of every worker, so only the first worker to see the block clears the cache.
+        """
+        with self.lock:
+            if block != self.block:
+                self.block = block
+                self.tickers = {}
+
+    def on_market(self, notification):
+        """ Drop cached ticker of the market the notification belongs to
+
+            :param notification: market notification, deleted orders carry no market and drop all tickers
+        """
+        asset_ids = notification_asset_ids(notification)
+        with self.lock:
+            if asset_ids is None:
+                self.tickers = {}
+                return
+            for key in list(self.tickers):
+                if frozenset(key) == asset_ids:
+                    del self.tickers[key]
+
+    def get_ticker(self, market):
+        """ Ticker of the market, see :meth:`bitshares.market.Market.ticker`
+
+            :param bitshares.market.Market market: market
+            :return: dict ticker
+        """
+        key = (market['base']['id'], market['quote']['id'])
+        with self.lock:
+            ticker, expiration = self.tickers.get(key, (None, 0))
+            if time.time() < expiration:
+                return ticker
+
+        ticker = market.ticker()
+        with self.lock:
+            self.tickers[key] = (ticker, time.time() + self.ttl)
+        return ticker
+
+
+# Ticker caches per BitShares instance
+ticker_caches = weakref.WeakKeyDictionary()
+ticker_caches_lock = threading.Lock()
+
+
+def get_ticker_cache(bitshares):
+    """ Get ticker cache shared by all workers using the BitShares instance
+    """
+    with ticker_caches_lock:
+        if bitshares not in ticker_caches:
+            ticker_caches[bitshares] = TickerCache()
+        return ticker_caches[bitshares]
@@ -1,29 +1,82 @@
+import atexit
+import concurrent.futures
+import functools
 import json
+import logging
 import os
 import os.path
 import queue
+import sqlite3
 import sys
 import threading
-import uuid
+import time
 
-import alembic
-import alembic.config
 from appdirs import user_data_dir
 from dexbot import APP_NAME, AUTHOR
-from sqlalchemy import Boolean, Column, Float, Integer, String, create_engine
+from dexbot.config import DEFAULT_CONFIG_FILE
+from dexbot.config import Config as ConfigFile
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Float,
+    Index,
+    Integer,
+    String,
+    and_,
+    bindparam,
+    cast,
+    create_engine,
+    event,
+    literal,
+    select,
+)
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import load_only, sessionmaker
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import functions
 
 from . import helper
 
+log = logging.getLogger(__name__)
+
 Base = declarative_base()
 
 # For dexbot.sqlite file
 storageDatabase = "dexbot.sqlite"
 
+# Latest alembic revision, databases stamped with it are not passed to alembic at all
+MIGRATIONS_HEAD = '3c7a9e2f1b6d'
+
+# Maximum number of write tasks grouped into one transaction
+BATCH_MAX_SIZE = 100
+
+# Maximum time in seconds a write may stay uncommitted while waiting for more writes
+BATCH_MAX_LATENCY = 0.1
+
+# Number of read-only connections used when concurrent reads are enabled
+READ_CONNECTIONS = 4
+
+# Balance history periods in seconds
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Balance history older than this (seconds) is downsampled into hourly rollups, 0 = keep full history
+BALANCE_RETENTION = 0
+
+# Hourly rollups older than this (seconds) are downsampled into daily rollups
+HOURLY_BALANCE_RETENTION = 90 * DAY
+
+# How often in seconds the balance retention job runs when balance_retention is set, 0 = never
+RETENTION_INTERVAL = HOUR
+
+# Maximum number of values in one "IN (...)" clause, sqlite limits number of query parameters
+IN_CLAUSE_MAX_SIZE = 500
+
 
 class Config(Base):
     __tablename__ = 'config'
+    __table_args__ = (Index('ix_config_category_key', 'category', 'key', unique=True),)
 
     id = Column(Integer, primary_key=True)
     category = Column(String)
@@ -38,6 +91,11 @@ class Config(Base):
 
 class Orders(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        Index('ix_orders_order_id', 'order_id'),
+        Index('ix_orders_worker_order_id', 'worker', 'order_id'),
+        Index('ix_orders_worker_virtual_custom', 'worker', 'virtual', 'custom'),
+    )
 
     id = Column(Integer, primary_key=True)
     worker = Column(String)
@@ -56,6 +114,17 @@ class Orders(Base):
 
 class Balances(Base):
     __tablename__ = 'balances'
+    __table_args__ = (
+        Index(
+            'ix_balances_account_worker_symbols_timestamp',
+            'account',
+            'worker',
+            'base_symbol',
+            'quote_symbol',
+            'timestamp',
+        ),
+        Index('ix_balances_timestamp', 'timestamp'),
+    )
 
     id = Column(Integer, primary_key=True)
     account = Column(String)
@@ -78,6 +147,169 @@ class Balances(Base):
         self.timestamp = timestamp
 
 
+class BalanceRollups(Base):
+    """ Downsampled balance history: the earliest balance entry of each hour or day
+    """
+
+    __tablename__ = 'balance_rollups'
+    __table_args__ = (
+        Index(
+            'ix_balance_rollups_account_worker_symbols_timestamp',
+            'account',
+            'worker',
+            'base_symbol',
+            'quote_symbol',
+            'timestamp',
+        ),
+        Index('ix_balance_rollups_period_timestamp', 'period', 'timestamp'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    period = Column(Integer)
+    account = Column(String)
+    worker = Column(String)
+    base_total = Column(Float)
+    base_symbol = Column(String)
+    quote_total = Column(Float)
+    quote_symbol = Column(String)
+    center_price = Column(Float)
+    timestamp = Column(Integer)
+
+    def __init__(self, period, entry):
+        self.period = period
+        self.account = entry.account
+        self.worker = entry.worker
+        self.base_total = entry.base_total
+        self.base_symbol = entry.base_symbol
+        self.quote_total = entry.quote_total
+        self.quote_symbol = entry.quote_symbol
+        self.center_price = entry.center_price
+        self.timestamp = entry.timestamp
+
+
+# Core statements for the hot storage operations. They are built once and DatabaseWorker caches their compiled form,
+# which saves building and compiling ORM queries and creating mapped objects on every call.
+config_table = Config.__table__
+orders_table = Orders.__table__
+balances_table = Balances.__table__
+rollups_table = BalanceRollups.__table__
+
+SELECT_ITEMS = select([config_table.c.key, config_table.c.value]).where(
+    config_table.c.category == bindparam('category')
+)
+INSERT_ITEM = config_table.insert()
+UPDATE_ITEM = config_table.update().where(
+    and_(config_table.c.category == bindparam('where_category'), config_table.c.key == bindparam('where_key'))
+)
+DELETE_ITEM = config_table.delete().where(
+    and_(config_table.c.category == bindparam('category'), config_table.c.key == bindparam('key'))
+)
+
+SELECT_ORDER_IDS = select([orders_table.c.order_id]).where(
+    orders_table.c.order_id.in_(bindparam('order_ids', expanding=True))
+)
+INSERT_ORDER = orders_table.insert()
+UPDATE_ORDER = orders_table.update().where(orders_table.c.order_id == bindparam('where_order_id'))
+DELETE_ORDER = orders_table.delete().where(
+    and_(orders_table.c.worker == bindparam('worker'), orders_table.c.order_id == bindparam('order_id'))
+)
+DELETE_ORDERS = orders_table.delete().where(
+    and_(
+        orders_table.c.worker == bindparam('worker'),
+        orders_table.c.order_id.in_(bindparam('order_ids', expanding=True)),
+    )
+)
+
+INSERT_BALANCE = balances_table.insert()
+
+
+@functools.lru_cache()
+def select_orders(ids_only, filter_virtual, filter_custom):
+    """ Build statement selecting worker's orders
+
+        :param bool ids_only: True = select only order ids
+        :param bool filter_virtual: True = filter by "virtual" parameter
+        :param bool filter_custom: True = filter by "custom" parameter
+    """
+    if ids_only:
+        columns = [orders_table.c.order_id]
+    else:
+        columns = [orders_table.c.order_id, orders_table.c.order, orders_table.c.virtual, orders_table.c.custom]
+    clauses = [orders_table.c.worker == bindparam('worker')]
+    if filter_virtual:
+        clauses.append(orders_table.c.virtual == bindparam('virtual'))
+    if filter_custom:
+        clauses.append(orders_table.c.custom == bindparam('custom'))
+    return select(columns).where(and_(*clauses))
+
+
+@functools.lru_cache()
+def select_recent_balance(table):
+    """ Build statement selecting the most recent balance entry of account and worker
+
+        :param table: balances or balance_rollups table
+    """
+    return (
+        select([table])
+        .where(
+            and_(
+                table.c.account == bindparam('account'),
+                table.c.worker == bindparam('worker'),
+                table.c.base_symbol == bindparam('base_symbol'),
+                table.c.quote_symbol == bindparam('quote_symbol'),
+            )
+        )
+        .order_by(table.c.timestamp.desc(), table.c.id.desc())
+        .limit(1)
+    )
+
+
+def rollup_balances(table, period, whereclause):
+    """ Build statement inserting rollups made of the earliest balance entry of each period
+
+        :param table: balances or balance_rollups table
+        :param int period: rollup period in seconds
+        :param whereclause: entries to downsample
+    """
+    # SQLite takes bare columns of an aggregate query from the row holding MIN()
+    timestamp = functions.min(table.c.timestamp)
+    entries = (
+        select(
+            [
+                literal(period),
+                table.c.account,
+                table.c.worker,
+                table.c.base_total,
+                table.c.base_symbol,
+                table.c.quote_total,
+                table.c.quote_symbol,
+                table.c.center_price,
+                timestamp,
+            ]
+        )
+        .where(whereclause)
+        .group_by(
+            table.c.account,
+            table.c.worker,
+            table.c.base_symbol,
+            table.c.quote_symbol,
+            cast(table.c.timestamp / period, Integer),
+        )
+    )
+    columns = [
+        'period',
+        'account',
+        'worker',
+        'base_total',
+        'base_symbol',
+        'quote_total',
+        'quote_symbol',
+        'center_price',
+        'timestamp',
+    ]
+    return rollups_table.insert().from_select(columns, entries)
+
+
 class Storage(dict):
     """ Storage class
 
@@ -89,28 +321,28 @@ class Storage(dict):
         self.category = category
 
     def __setitem__(self, key, value):
-        db_worker.set_item(self.category, key, value)
+        get_db_worker().set_item(self.category, key, value)
 
     def __getitem__(self, key):
-        return db_worker.get_item(self.category, key)
+        return get_db_worker().get_item(self.category, key)
 
     def __delitem__(self, key):
-        db_worker.del_item(self.category, key)
+        get_db_worker().del_item(self.category, key)
 
     def __contains__(self, key):
-        return db_worker.contains(self.category, key)
+        return get_db_worker().contains(self.category, key)
 
     def items(self):
-        return db_worker.get_items(self.category)
+        return get_db_worker().get_items(self.category)
 
     def clear(self):
-        db_worker.clear(self.category)
+        get_db_worker().clear(self.category)
 
     def save_order(self, order):
         """ Save the order to the database
         """
         order_id = order['id']
-        db_worker.save_order(self.category, order_id, order)
+        get_db_worker().save_order(self.category, order_id, order)
 
     def save_order_extended(self, order, virtual=None, custom=None):
         """ Save the order to the database providing additional data
@@ -120,7 +352,18 @@ class Storage(dict):
             :param str custom: any additional data
         """
         order_id = order['id']
-        db_worker.save_order_extended(self.category, order_id, order, virtual, custom)
+        get_db_worker().save_order_extended(self.category, order_id, order, virtual, custom)
+
+    def save_orders_extended(self, orders, virtual=None, custom=None):
+        """ Save many orders to the database in one transaction
+
+            :param list orders: list of orders (dicts with "id" key)
+            :param bool virtual: True = orders are virtual orders
+            :param str custom: any additional data
+        """
+        if not orders:
+            return
+        get_db_worker().save_orders_extended(self.category, [(order['id'], order) for order in orders], virtual, custom)
 
     def remove_order(self, order):
         """ Removes an order from the database
@@ -131,12 +374,21 @@ class Storage(dict):
             order_id = order['id']
         else:
             order_id = order
-        db_worker.remove_order(self.category, order_id)
+        get_db_worker().remove_order(self.category, order_id)
+
+    def remove_orders(self, orders):
+        """ Removes many orders from the database with one query
+
+            :param list orders: orders to remove, could be Order instances or just order ids
+        """
+        order_ids = [order['id'] if isinstance(order, dict) else order for order in orders]
+        if order_ids:
+            get_db_worker().remove_orders(self.category, order_ids)
 
     def clear_orders(self):
         """ Removes all worker's orders from the database
         """
-        db_worker.clear_orders(self.category)
+        get_db_worker().clear_orders(self.category)
 
     def clear_orders_extended(self, worker=None, only_virtual=False, only_real=False, custom=None):
         """ Removes worker's orders matching a criteria from the database
@@ -150,7 +402,7 @@ class Storage(dict):
             raise ValueError('only_virtual and only_real are mutually exclusive')
         if not worker:
             worker = self.category
-        return db_worker.clear_orders_extended(worker, only_virtual, only_real, custom)
+        return get_db_worker().clear_orders_extended(worker, only_virtual, only_real, custom)
 
     def fetch_orders(self, worker=None):
         """ Get all the orders (or just specific worker's orders) from the database
@@ -159,7 +411,7 @@ class Storage(dict):
         """
         if not worker:
             worker = self.category
-        return db_worker.fetch_orders(worker)
+        return get_db_worker().fetch_orders(worker)
 
     def fetch_orders_extended(
         self, worker=None, only_virtual=False, only_real=False, custom=None, return_ids_only=False
@@ -179,12 +431,11 @@ class Storage(dict):
             raise ValueError('only_virtual and only_real are mutually exclusive')
         if not worker:
             worker = self.category
-        return db_worker.fetch_orders_extended(worker, only_virtual, only_real, custom, return_ids_only)
+        return get_db_worker().fetch_orders_extended(worker, only_virtual, only_real, custom, return_ids_only)
 
     @staticmethod
     def clear_worker_data(worker):
-        db_worker.clear_orders(worker)
-        db_worker.clear(worker)
+        get_db_worker().clear_worker_data(worker)
 
     @staticmethod
     def store_balance_entry(
@@ -192,59 +443,149 @@ class Storage(dict):
     ):
         balance = Balances(account, worker, base_total, base_symbol, quote_total, quote_symbol, center_price, timestamp)
         # Save balance to db
-        db_worker.save_balance(balance)
+        get_db_worker().save_balance(balance)
 
     @staticmethod
     def get_balance_history(account, worker, timestamp, base_asset, quote_asset):
-        return db_worker.get_balance(account, worker, timestamp, base_asset, quote_asset)
+        return get_db_worker().get_balance(account, worker, timestamp, base_asset, quote_asset)
 
     @staticmethod
     def get_recent_balance_entry(account, worker, base_asset, quote_asset):
-        return db_worker.get_recent_balance_entry(account, worker, base_asset, quote_asset)
+        return get_db_worker().get_recent_balance_entry(account, worker, base_asset, quote_asset)
+
+    @staticmethod
+    def cache_info():
+        """ Return hit/miss statistics of the key/value cache
+        """
+        return get_db_worker().cache_info()
 
 
 class DatabaseWorker(threading.Thread):
     """ Thread safe database worker
+
+        Write tasks are grouped into transactions: consecutive writes are committed together once `batch_size`
+        writes are pending or the oldest pending write is `batch_latency` seconds old. Reads are executed in the same
+        session, so they always see preceding writes. batch_size=1 commits after every write.
+
+        With `concurrent_reads` the database is switched to WAL journaling and order/balance reads run on the calling
+        thread through a pool of read-only connections, so they are not blocked by a long write. A thread whose own
+        writes are not committed yet still reads through the database thread to see them.
+
+        :param str sqlite_file: path to the database file
+        :param int batch_size: maximum number of writes per transaction
+        :param float batch_latency: maximum time in seconds before pending writes are committed
+        :param bool concurrent_reads: True = enable WAL mode and read on the calling thread
+        :param int read_connections: size of the read-only connection pool
+        :param int balance_retention: seconds of full balance history to keep, older entries are downsampled into
+            hourly rollups, 0 = keep full history and don't run the retention job
+        :param int hourly_balance_retention: seconds of hourly rollups to keep, older ones are downsampled into daily
+            rollups
+        :param int retention_interval: how often in seconds to run the balance retention job, 0 = never
     """
 
     def __init__(self, **kwargs):
         super().__init__()
 
         sqlite_file = kwargs.get('sqlite_file', sqlDataBaseFile)
+        self.batch_size = max(kwargs.get('batch_size', BATCH_MAX_SIZE), 1)
+        self.batch_latency = kwargs.get('batch_latency', BATCH_MAX_LATENCY)
+        concurrent_reads = kwargs.get('concurrent_reads', False)
+        self.balance_retention = kwargs.get('balance_retention') or BALANCE_RETENTION
+        # Hourly rollups can't be younger than the full history they are made of
+        self.hourly_balance_retention = max(
+            kwargs.get('hourly_balance_retention', HOURLY_BALANCE_RETENTION), self.balance_retention
+        )
+        self.retention_interval = kwargs.get('retention_interval', RETENTION_INTERVAL) if self.balance_retention else 0
 
         # Obtain engine and session
         dsn = 'sqlite:///{}'.format(sqlite_file)
         engine = create_engine(dsn, echo=False)
+        if concurrent_reads:
+            event.listen(engine, 'connect', self._enable_wal)
         Session = sessionmaker(bind=engine)
         self.session = Session()
 
-        # Find out where migrations are
-        if hasattr(sys, 'frozen') and hasattr(sys, '_MEIPASS'):
-            # We're bundled into pyinstaller executable
-            bundle_dir = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
-            migrations_dir = os.path.join(bundle_dir, 'migrations')
-        else:
-            from pkg_resources import resource_filename
-
-            migrations_dir = resource_filename('dexbot', 'migrations')
-
         if os.path.exists(sqlite_file) and os.path.getsize(sqlite_file) > 0:
-            # Run migrations on existing database
-            self.run_migrations(migrations_dir, dsn)
+            # Run migrations on existing database, unless it is up to date already
+            if self.get_revision(engine) != MIGRATIONS_HEAD:
+                self.run_migrations(self.get_migrations_dir(), dsn)
         else:
             Base.metadata.create_all(engine)
             self.session.commit()
             # We're created database from scratch, stamp it with "head" revision
-            self.run_migrations(migrations_dir, dsn, stamp_only=True)
+            self.run_migrations(self.get_migrations_dir(), dsn, stamp_only=True)
 
         self.task_queue = queue.Queue()
-        self.results = {}
 
-        self.lock = threading.Lock()
-        self.event = threading.Event()
+        # Writes executed in the current, not yet committed, transaction
+        self.pending_writes = []
+
+        # Read-only sessions for concurrent reads, None = all reads go through the database thread
+        self.read_session = None
+        if concurrent_reads:
+            read_engine = create_engine(
+                'sqlite://',
+                creator=lambda: sqlite3.connect(
+                    'file:{}?mode=ro'.format(sqlite_file), uri=True, check_same_thread=False
+                ),
+                poolclass=QueuePool,
+                pool_size=kwargs.get('read_connections', READ_CONNECTIONS),
+            )
+            self.read_session = sessionmaker(bind=read_engine)
+
+        # Write sequence numbers tell concurrent readers whether their own writes are committed
+        self.write_lock = threading.Lock()
+        self.write_seq = 0
+        self.processed_writes = 0
+        self.committed_seq = 0
+        self.thread_data = threading.local()
+        # Set by stop(), tasks are refused afterwards instead of waiting for a thread which is gone
+        self.stopped = False
+
+        # Compiled Core statements
+        self.compiled_cache = {}
+
+        # Write-through cache of config key/value pairs: {category: {key: json value}}
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Bumped by the database thread when writes are rolled back, the cache may hold values never committed
+        self.cache_generation = 0
+        self.cache_valid_generation = 0
+        # Bumped on every key/value write, a category read from the database meanwhile may miss it
+        self.cache_writes = 0
+
         self.daemon = True
         self.start()
 
+        # Daemon thread would be killed on exit together with uncommitted writes
+        atexit.register(self.stop)
+
+    @staticmethod
+    def get_migrations_dir():
+        """ Find out where migrations are
+        """
+        if hasattr(sys, 'frozen') and hasattr(sys, '_MEIPASS'):
+            # We're bundled into pyinstaller executable
+            bundle_dir = getattr(sys, '_MEIPASS', os.path.abspath(os.path.dirname(__file__)))
+            return os.path.join(bundle_dir, 'migrations')
+        else:
+            from pkg_resources import resource_filename
+
+            return resource_filename('dexbot', 'migrations')
+
+    @staticmethod
+    def get_revision(engine):
+        """ Get alembic revision the database is stamped with
+
+            :return: revision id, None if the database is not stamped
+        """
+        try:
+            return engine.execute('SELECT version_num FROM alembic_version').scalar()
+        except OperationalError:
+            return None
+
     @staticmethod
     def run_migrations(script_location, dsn, stamp_only=False):
         """ Apply database migrations using alembic
@@ -253,6 +594,10 @@ class DatabaseWorker(threading.Thread):
             :param str dsn: database URL
             :param bool stamp_only: True = only mark the db as "head" without applying migrations
         """
+        # Alembic is slow to import and is needed only when the database is not up to date
+        import alembic.command
+        import alembic.config
+
         alembic_cfg = alembic.config.Config()
         alembic_cfg.set_main_option('script_location', script_location)
         alembic_cfg.set_main_option('sqlalchemy.url', dsn)
@@ -263,6 +608,26 @@ class DatabaseWorker(threading.Thread):
         else:
             alembic.command.upgrade(alembic_cfg, 'head')
 
+    def connection(self, session):
+        """ Get connection of the session which caches compiled Core statements
+        """
+        return session.connection().execution_options(compiled_cache=self.compiled_cache)
+
+    @staticmethod
+    def _enable_wal(dbapi_connection, connection_record):
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+    @staticmethod
+    def chunks(values, size=IN_CLAUSE_MAX_SIZE):
+        """ Split list of values into lists fitting into one "IN (...)" clause
+        """
+        values = list(values)
+        chunks = []
+        while values:
+            chunk, values = values[:size], values[size:]
+            chunks.append(chunk)
+        return chunks
+
     @staticmethod
     def get_filter_by(worker, only_virtual, only_real, custom):
         """ Make filter_by for sqlalchemy query based on args
@@ -277,135 +642,379 @@ class DatabaseWorker(threading.Thread):
         return filter_by
 
     def run(self):
-        for func, args, token in iter(self.task_queue.get, None):
-            if token is not None:
-                args = args + (token,)
-            func(*args)
+        deadline = None
+        # Retention job runs every retention_interval seconds, not on start to keep startup fast
+        retention_deadline = time.monotonic() + self.retention_interval if self.retention_interval else None
 
-    def _get_result(self, token):
         while True:
-            with self.lock:
-                if token in self.results:
-                    return_value = self.results[token]
-                    del self.results[token]
-                    return return_value
+            if retention_deadline is not None and time.monotonic() >= retention_deadline:
+                self._apply_balance_retention()
+                deadline = None
+                retention_deadline = time.monotonic() + self.retention_interval
+
+            deadlines = [d for d in (deadline, retention_deadline) if d is not None]
+            timeout = max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+            try:
+                task = self.task_queue.get(timeout=timeout)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    # Oldest pending write reached max latency and no more tasks arrived
+                    self._commit()
+                    deadline = None
+                continue
+
+            if task is None:
+                self._commit()
+                self._fail_queued_tasks()
+                break
+
+            func, args, future = task
+            try:
+                if future is not None:
+                    func(*(args + (future,)))
                 else:
-                    self.event.clear()
-            self.event.wait()
+                    self.processed_writes += 1
+                    func(*args)
+                    self.pending_writes.append((func, args))
+                    if deadline is None:
+                        deadline = time.monotonic() + self.batch_latency
+            except Exception as exception:
+                log.exception('Database task {} failed, rolling it back'.format(func.__name__))
+                self._rollback()
+                if future is not None and not future.done():
+                    future.set_exception(exception)
+
+            if not self.pending_writes:
+                deadline = None
+            elif len(self.pending_writes) >= self.batch_size or time.monotonic() >= deadline:
+                self._commit()
+                deadline = None
+
+    def _commit(self):
+        """ Commit pending writes, if any
+        """
+        try:
+            self.session.commit()
+        except Exception:
+            log.exception('Failed to commit {} pending writes'.format(len(self.pending_writes)))
+            self.session.rollback()
+            self.cache_generation += 1
+        self.pending_writes = []
+        self.committed_seq = self.processed_writes
+
+    def _rollback(self):
+        """ Roll back the failed task and replay writes which succeeded earlier in the same transaction
+        """
+        self.session.rollback()
+        self.cache_generation += 1
+        writes, self.pending_writes = self.pending_writes, []
+        for func, args in writes:
+            try:
+                func(*args)
+            except Exception:
+                log.exception('Failed to replay database task {}'.format(func.__name__))
+                self.session.rollback()
+                self.pending_writes = []
+                self.committed_seq = self.processed_writes
+                return
+            self.pending_writes.append((func, args))
+
+    def _apply_balance_retention(self):
+        """ Run balance retention job and commit it together with pending writes
+        """
+        try:
+            self._downsample_balances(time.time())
+        except Exception:
+            log.exception('Balance retention job failed, rolling it back')
+            self._rollback()
+        self._commit()
+
+    def _downsample_balances(self, now):
+        """ Replace old balance entries with hourly rollups, and old hourly rollups with daily ones
+
+            Cutoffs are aligned to whole periods, so each period is downsampled exactly once. Both steps are single
+            INSERT ... SELECT and DELETE statements, entries are not loaded into the session.
+
+            :param float now: current unix time
+        """
+        hourly_cutoff = (now - self.balance_retention) // HOUR * HOUR
+        self.session.execute(rollup_balances(balances_table, HOUR, balances_table.c.timestamp < hourly_cutoff))
+        self.session.execute(balances_table.delete().where(balances_table.c.timestamp < hourly_cutoff))
+
+        daily_cutoff = (now - self.hourly_balance_retention) // DAY * DAY
+        hourly = and_(rollups_table.c.period == HOUR, rollups_table.c.timestamp < daily_cutoff)
+        self.session.execute(rollup_balances(rollups_table, DAY, hourly))
+        self.session.execute(rollups_table.delete().where(hourly))
 
-    def _set_result(self, token, result):
-        with self.lock:
-            self.results[token] = result
-            self.event.set()
+    def stop(self):
+        """ Commit pending writes and stop the database thread
+
+            Tasks submitted after stop() fail with RuntimeError.
+        """
+        with self.write_lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            if self.is_alive():
+                self.task_queue.put(None)
+        self.join()
+
+    def _fail_queued_tasks(self):
+        """ Fail tasks which were queued behind the stop request
+        """
+        while True:
+            try:
+                task = self.task_queue.get_nowait()
+            except queue.Empty:
+                return
+            if task is not None and task[2] is not None:
+                task[2].set_exception(RuntimeError('Database worker is stopped'))
+
+    def _has_pending_writes(self):
+        """ Whether writes queued by the calling thread are not committed yet
+        """
+        return getattr(self.thread_data, 'write_seq', 0) > self.committed_seq
+
+    def flush(self):
+        """ Wait until all previously queued writes are committed to the database
+        """
+        return self.execute(self._flush)
+
+    def _flush(self, future):
+        self._commit()
+        self._set_result(future, None)
+
+    @staticmethod
+    def _set_result(future, result):
+        future.set_result(result)
+
+    def submit(self, func, *args):
+        """ Queue a task which returns a result
+
+            :param func: task to run on the database thread, receives a Future as the last argument
+            :return: concurrent.futures.Future resolved with the task result
+        """
+        future = concurrent.futures.Future()
+        with self.write_lock:
+            if self.stopped:
+                raise RuntimeError('Database worker is stopped')
+            self.task_queue.put((func, args, future))
+        return future
 
     def execute(self, func, *args):
-        token = str(uuid.uuid4)
-        self.task_queue.put((func, args, token))
-        return self._get_result(token)
+        return self.submit(func, *args).result()
 
     def execute_noreturn(self, func, *args):
-        self.task_queue.put((func, args, None))
+        with self.write_lock:
+            if self.stopped:
+                raise RuntimeError('Database worker is stopped')
+            self.write_seq += 1
+            self.thread_data.write_seq = self.write_seq
+            self.task_queue.put((func, args, None))
+
+    def execute_read(self, func, *args):
+        """ Run a read-only query func(session, *args) and return its result
+
+            The query runs on the calling thread when concurrent reads are enabled, otherwise on the database thread.
+        """
+        if self.read_session is None or self._has_pending_writes():
+            # Uncommitted writes of this thread are visible only to the database thread session
+            return self.execute(self._execute_read, func, args)
+
+        session = self.read_session()
+        try:
+            return func(session, *args)
+        finally:
+            session.close()
+
+    def _execute_read(self, func, args, future):
+        self._set_result(future, func(self.session, *args))
 
     def set_item(self, category, key, value):
-        self.execute_noreturn(self._set_item, category, key, value)
+        value = json.dumps(value)
+        with self.cache_lock:
+            self._validate_cache()
+            if category in self.cache:
+                self.cache[category][key] = value
+            self.cache_writes += 1
+            self.execute_noreturn(self._set_item, category, key, value)
 
     def _set_item(self, category, key, value):
-        value = json.dumps(value)
-        e = self.session.query(Config).filter_by(category=category, key=key).first()
-        if e:
-            e.value = value
-        else:
-            e = Config(category, key, value)
-            self.session.add(e)
-        self.session.commit()
+        connection = self.connection(self.session)
+        if not connection.execute(UPDATE_ITEM, where_category=category, where_key=key, value=value).rowcount:
+            connection.execute(INSERT_ITEM, category=category, key=key, value=value)
 
     def get_item(self, category, key):
-        return self.execute(self._get_item, category, key)
-
-    def _get_item(self, category, key, token):
-        e = self.session.query(Config).filter_by(category=category, key=key).first()
-        if not e:
-            result = None
-        else:
-            result = json.loads(e.value)
-        self._set_result(token, result)
+        value = self._cached_category(category).get(key)
+        if value is None:
+            return None
+        return json.loads(value)
 
     def del_item(self, category, key):
-        self.execute_noreturn(self._del_item, category, key)
+        with self.cache_lock:
+            self._validate_cache()
+            if category in self.cache:
+                self.cache[category].pop(key, None)
+            self.cache_writes += 1
+            self.execute_noreturn(self._del_item, category, key)
 
     def _del_item(self, category, key):
-        e = self.session.query(Config).filter_by(category=category, key=key).first()
-        self.session.delete(e)
-        self.session.commit()
+        self.connection(self.session).execute(DELETE_ITEM, category=category, key=key)
 
     def contains(self, category, key):
-        return self.execute(self._contains, category, key)
-
-    def _contains(self, category, key, token):
-        e = self.session.query(Config).filter_by(category=category, key=key).first()
-        self._set_result(token, bool(e))
+        return key in self._cached_category(category)
 
     def get_items(self, category):
-        return self.execute(self._get_items, category)
+        return list(self._cached_category(category).items())
 
-    def _get_items(self, category, token):
-        es = self.session.query(Config).filter_by(category=category).all()
-        result = [(e.key, e.value) for e in es]
-        self._set_result(token, result)
+    def _get_items(self, session, category):
+        return [tuple(row) for row in self.connection(session).execute(SELECT_ITEMS, category=category)]
 
     def clear(self, category):
-        self.execute_noreturn(self._clear, category)
+        with self.cache_lock:
+            self._validate_cache()
+            if category in self.cache:
+                self.cache[category] = {}
+            self.cache_writes += 1
+            self.execute_noreturn(self._clear, category)
 
     def _clear(self, category):
-        rows = self.session.query(Config).filter_by(category=category)
-        for row in rows:
-            self.session.delete(row)
-            self.session.commit()
+        self.session.query(Config).filter_by(category=category).delete()
+
+    def clear_worker_data(self, worker):
+        """ Remove worker's orders and key/value data in one task, so they are committed in one transaction
+        """
+        with self.cache_lock:
+            self._validate_cache()
+            if worker in self.cache:
+                self.cache[worker] = {}
+            self.cache_writes += 1
+            self.execute_noreturn(self._clear_worker_data, worker)
+
+    def _clear_worker_data(self, worker):
+        self._clear_orders(worker)
+        self._clear(worker)
+
+    def _cached_category(self, category):
+        """ Return cached key/value pairs of the category (values are json), loading them on first access
+
+            The category is read from the database without holding cache_lock, so other threads keep using the cache
+            meanwhile. The result is cached only if no writes or rollbacks happened during the read, otherwise it
+            may miss them and is just returned.
+        """
+        with self.cache_lock:
+            self._validate_cache()
+            entries = self.cache.get(category)
+            if entries is not None:
+                self.cache_hits += 1
+                return entries
+            self.cache_misses += 1
+            version = (self.cache_generation, self.cache_writes)
+
+        entries = dict(self.execute(self._execute_read, self._get_items, (category,)))
+
+        with self.cache_lock:
+            if (self.cache_generation, self.cache_writes) == version:
+                self._validate_cache()
+                entries = self.cache.setdefault(category, entries)
+        return entries
+
+    def _validate_cache(self):
+        """ Drop the cache if writes were rolled back since it was filled, must be called with cache_lock held
+        """
+        generation = self.cache_generation
+        if generation != self.cache_valid_generation:
+            self.cache.clear()
+            self.cache_valid_generation = generation
+
+    def cache_info(self):
+        """ Return key/value cache statistics
+
+            :return: dict with hits, misses and number of cached categories
+        """
+        with self.cache_lock:
+            return {'hits': self.cache_hits, 'misses': self.cache_misses, 'categories': len(self.cache)}
+
+    def invalidate_cache(self, category=None):
+        """ Drop cached key/value data so it will be reloaded from the database
+
+            :param str category: category to drop, None = drop everything
+        """
+        with self.cache_lock:
+            if category is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(category, None)
+            # Category being loaded right now must not get into the cache either
+            self.cache_writes += 1
 
     def save_order(self, worker, order_id, order):
         self.execute_noreturn(self._save_order, worker, order_id, order)
 
     def _save_order(self, worker, order_id, order):
         value = json.dumps(order)
-        e = self.session.query(Orders).filter_by(order_id=order_id).first()
-        if e:
-            e.value = value
-        else:
-            e = Orders(worker, order_id, value, None, None)
-            self.session.add(e)
-        self.session.commit()
+        connection = self.connection(self.session)
+        if not connection.execute(UPDATE_ORDER, where_order_id=order_id, order=value).rowcount:
+            connection.execute(INSERT_ORDER, worker=worker, order_id=order_id, order=value, virtual=None, custom=None)
 
     def save_order_extended(self, worker, order_id, order, virtual, custom):
         self.execute_noreturn(self._save_order_extended, worker, order_id, order, virtual, custom)
 
     def _save_order_extended(self, worker, order_id, order, virtual, custom):
-        order_json = json.dumps(order)
+        values = {'order': json.dumps(order), 'virtual': virtual, 'custom': json.dumps(custom)}
+        connection = self.connection(self.session)
+        if not connection.execute(UPDATE_ORDER, where_order_id=order_id, **values).rowcount:
+            connection.execute(INSERT_ORDER, worker=worker, order_id=order_id, **values)
+
+    def save_orders_extended(self, worker, orders, virtual, custom):
+        self.execute_noreturn(self._save_orders_extended, worker, orders, virtual, custom)
+
+    def _save_orders_extended(self, worker, orders, virtual, custom):
+        """ Insert or update many orders at once
+
+            :param list orders: list of tuples (order_id, order)
+        """
         custom_json = json.dumps(custom)
-        e = self.session.query(Orders).filter_by(order_id=order_id).first()
-        if e:
-            e.order = order_json
-            e.virtual = virtual
-            e.custom = custom_json
-        else:
-            e = Orders(worker, order_id, order_json, virtual, custom_json)
-            self.session.add(e)
-        self.session.commit()
+        orders_json = {order_id: json.dumps(order) for order_id, order in orders}
+        connection = self.connection(self.session)
+
+        existing_ids = set()
+        for chunk in self.chunks(orders_json):
+            existing_ids.update(row.order_id for row in connection.execute(SELECT_ORDER_IDS, order_ids=chunk))
+
+        updates = [
+            {'where_order_id': order_id, 'order': orders_json[order_id], 'virtual': virtual, 'custom': custom_json}
+            for order_id in existing_ids
+        ]
+        inserts = [
+            {'worker': worker, 'order_id': order_id, 'order': order_json, 'virtual': virtual, 'custom': custom_json}
+            for order_id, order_json in orders_json.items()
+            if order_id not in existing_ids
+        ]
+        if updates:
+            connection.execute(UPDATE_ORDER, updates)
+        if inserts:
+            connection.execute(INSERT_ORDER, inserts)
 
     def remove_order(self, worker, order_id):
         self.execute_noreturn(self._remove_order, worker, order_id)
 
     def _remove_order(self, worker, order_id):
-        e = self.session.query(Orders).filter_by(worker=worker, order_id=order_id).first()
-        if e:
-            self.session.delete(e)
-            self.session.commit()
+        self.connection(self.session).execute(DELETE_ORDER, worker=worker, order_id=order_id)
+
+    def remove_orders(self, worker, order_ids):
+        self.execute_noreturn(self._remove_orders, worker, order_ids)
+
+    def _remove_orders(self, worker, order_ids):
+        connection = self.connection(self.session)
+        for chunk in self.chunks(order_ids):
+            connection.execute(DELETE_ORDERS, worker=worker, order_ids=chunk)
 
     def clear_orders(self, worker):
         self.execute_noreturn(self._clear_orders, worker)
 
     def _clear_orders(self, worker):
         self.session.query(Orders).filter_by(worker=worker).delete()
-        self.session.commit()
 
     def clear_orders_extended(self, worker, only_virtual, only_real, custom):
         self.execute_noreturn(self._clear_orders_extended, worker, only_virtual, only_real, custom)
@@ -413,33 +1022,33 @@ class DatabaseWorker(threading.Thread):
     def _clear_orders_extended(self, worker, only_virtual, only_real, custom):
         filter_by = self.get_filter_by(worker, only_virtual, only_real, custom)
         self.session.query(Orders).filter_by(**filter_by).delete()
-        self.session.commit()
 
     def fetch_orders(self, category):
-        return self.execute(self._fetch_orders, category)
+        return self.execute_read(self._fetch_orders, category)
 
-    def _fetch_orders(self, worker, token):
-        results = self.session.query(Orders).filter_by(worker=worker).all()
+    def _fetch_orders(self, session, worker):
+        results = self.connection(session).execute(select_orders(False, False, False), worker=worker).fetchall()
         if not results:
             result = None
         else:
             result = {}
             for row in results:
                 result[row.order_id] = json.loads(row.order)
-        self._set_result(token, result)
+        return result
 
     def fetch_orders_extended(self, category, only_virtual, only_real, custom, return_ids_only):
-        return self.execute(self._fetch_orders_extended, category, only_virtual, only_real, custom, return_ids_only)
+        return self.execute_read(
+            self._fetch_orders_extended, category, only_virtual, only_real, custom, return_ids_only
+        )
 
-    def _fetch_orders_extended(self, worker, only_virtual, only_real, custom, return_ids_only, token):
+    def _fetch_orders_extended(self, session, worker, only_virtual, only_real, custom, return_ids_only):
         filter_by = self.get_filter_by(worker, only_virtual, only_real, custom)
+        statement = select_orders(return_ids_only, 'virtual' in filter_by, 'custom' in filter_by)
+        results = self.connection(session).execute(statement, **filter_by)
 
         if return_ids_only:
-            query = self.session.query(Orders).options(load_only('order_id'))
-            results = query.filter_by(**filter_by).all()
             result = [row.order_id for row in results]
         else:
-            results = self.session.query(Orders).filter_by(**filter_by).all()
             result = []
             for row in results:
                 entry = {
@@ -450,54 +1059,127 @@ class DatabaseWorker(threading.Thread):
                 }
                 result.append(entry)
 
-        self._set_result(token, result)
+        return result
 
     def save_balance(self, balance):
         self.execute_noreturn(self._save_balance, balance)
 
     def _save_balance(self, balance):
-        self.session.add(balance)
-        self.session.commit()
+        columns = (column.name for column in Balances.__table__.columns if not column.primary_key)
+        self.connection(self.session).execute(INSERT_BALANCE, {name: getattr(balance, name) for name in columns})
 
     def get_balance(self, account, worker, timestamp, base_asset, quote_asset):
-        return self.execute(self._get_balance, account, worker, timestamp, base_asset, quote_asset)
+        return self.execute_read(self._get_balance, account, worker, timestamp, base_asset, quote_asset)
 
-    def _get_balance(self, account, worker, timestamp, base_asset, quote_asset, token):
+    @staticmethod
+    def _get_balance(session, account, worker, timestamp, base_asset, quote_asset):
         """ Get first item that has bigger time as given timestamp and matches account and worker name
+
+            Rollups hold history older than any full balance entry, so they are looked up first.
+
+            :return: Balances or BalanceRollups instance, None if nothing found
         """
-        result = (
-            self.session.query(Balances)
-            .filter(
-                Balances.account == account,
-                Balances.worker == worker,
-                Balances.base_symbol == base_asset,
-                Balances.quote_symbol == quote_asset,
-                Balances.timestamp > timestamp,
+        for table in (BalanceRollups, Balances):
+            entry = (
+                session.query(table)
+                .filter(
+                    table.account == account,
+                    table.worker == worker,
+                    table.base_symbol == base_asset,
+                    table.quote_symbol == quote_asset,
+                    table.timestamp > timestamp,
+                )
+                .order_by(table.timestamp)
+                .first()
             )
-            .first()
-        )
-
-        self._set_result(token, result)
+            if entry:
+                return entry
+        return None
 
     def get_recent_balance_entry(self, account, worker, base_asset, quote_asset):
-        return self.execute(self._get_recent_balance_entry, account, worker, base_asset, quote_asset)
+        return self.execute_read(self._get_recent_balance_entry, account, worker, base_asset, quote_asset)
 
-    def _get_recent_balance_entry(self, account, worker, base_asset, quote_asset, token):
+    def _get_recent_balance_entry(self, session, account, worker, base_asset, quote_asset):
         """ Get most recent balance history item that matches account and worker name
+
+            Falls back to the most recent rollup when all full entries were downsampled.
+
+            :return: row with balance columns as attributes, None if nothing found
         """
-        result = (
-            self.session.query(Balances)
-            .filter(
-                Balances.account == account,
-                Balances.worker == worker,
-                Balances.base_symbol == base_asset,
-                Balances.quote_symbol == quote_asset,
-            )
-            .order_by(Balances.id.desc())
-            .first()
-        )
+        connection = self.connection(session)
+        for table in (Balances.__table__, BalanceRollups.__table__):
+            entry = connection.execute(
+                select_recent_balance(table),
+                account=account,
+                worker=worker,
+                base_symbol=base_asset,
+                quote_symbol=quote_asset,
+            ).first()
+            if entry:
+                return entry
+        return None
+
+
+def get_storage_options(path=DEFAULT_CONFIG_FILE):
+    """ Read DatabaseWorker options from the optional "storage" section of the config file
+
+        Example config.yml section:
+
+        .. code-block:: yaml
+
+            storage:
+                concurrent_reads: true
+                read_connections: 4
+                batch_size: 100
+                batch_latency: 0.1
+                balance_retention: 604800
+                hourly_balance_retention: 7776000
+                retention_interval: 3600
+
+        :param str path: path to the config file
+        :return: dict of keyword arguments for DatabaseWorker
+    """
+    if not os.path.isfile(path):
+        return {}
+    config = ConfigFile.load_config(path) or {}
+    return dict(config.get('storage') or {})
 
-        self._set_result(token, result)
+
+def get_db_worker():
+    """ Get the database worker, it is created and started on first use
+
+        The worker is configured from the config file passed to configure_storage(), if any.
+    """
+    global db_worker
+
+    if db_worker is None:
+        with db_worker_lock:
+            if db_worker is None:
+                options = get_storage_options(storage_config_file) if storage_config_file else {}
+                db_worker = DatabaseWorker(**options)
+    return db_worker
+
+
+def configure_storage(path=DEFAULT_CONFIG_FILE):
+    """ Use storage options from the given config file
+
+        Options are read when the database worker is started. A running worker is restarted with the new options when
+        the config file sets any. Pending writes of the previous worker are committed first, tasks submitted to it
+        afterwards fail with RuntimeError instead of waiting forever.
+
+        :param str path: path to the config file
+    """
+    global db_worker, storage_config_file
+
+    with db_worker_lock:
+        storage_config_file = path
+        if db_worker is None:
+            return
+        options = get_storage_options(path)
+        if not options:
+            return
+        db_worker.stop()
+        db_worker = DatabaseWorker(**options)
 
 
 # Derive sqlite file directory
@@ -507,4 +1189,9 @@ sqlDataBaseFile = os.path.join(data_dir, storageDatabase)
 # Create directory for sqlite file
 helper.mkdir(data_dir)
 
-db_worker = DatabaseWorker()
+# Started lazily by get_db_worker(), so importing this module doesn't touch the database
+db_worker = None
+db_worker_lock = threading.Lock()
+
+# Config file with storage options, set by configure_storage()
+storage_config_file = None
@@ -8,8 +8,11 @@ from bitshares.amount import Asset
 from bitshares.instance import shared_bitshares_instance
 from bitshares.market import Market
 from dexbot.config import Config
-from dexbot.orderengines.bitshares_engine import BitsharesOrderEngine
+from dexbot.orderengines.bitshares_engine import BitsharesOrderEngine, get_conversion_rates, get_fee_cache
+from dexbot.orderengines.retry import RetryPolicy
 from dexbot.pricefeeds.bitshares_feed import BitsharesPriceFeed
+from dexbot.pricefeeds.order_book import get_order_book
+from dexbot.pricefeeds.ticker_cache import get_ticker_cache
 from dexbot.qt_queue.idle_queue import idle_add
 from dexbot.storage import Storage
 from dexbot.strategies.config_parts.base_config import BaseConfig
@@ -99,6 +102,7 @@ class StrategyBase(BitsharesOrderEngine, BitsharesPriceFeed):
         onUpdateCallOrder=None,
         ontick=None,
         bitshares_instance=None,
+        market_data=None,
         *args,
         **kwargs
     ):
@@ -112,6 +116,24 @@ class StrategyBase(BitsharesOrderEngine, BitsharesPriceFeed):
         # Events
         Events.__init__(self)
 
+        # Account data is cached until the next block, an account notification or an own broadcast
+        self.account_state_stale = True
+        self.ontick += self.invalidate_account_state
+        self.onAccount += self.invalidate_account_state
+
+        # Own limit orders indexed by order id and the account limit_orders list the index was built from
+        self.limit_orders_index = {}
+        self.indexed_limit_orders = None
+
+        # Transactions broadcast with execute_async(), tracked against incoming blocks
+        self.pending_transactions = {}
+        # Number of the next block to look for pending transactions in
+        self.pending_scan_block = None
+        self.ontick += self.check_pending_transactions
+
+        # Retries of failed broadcasts
+        self.retry_policy = RetryPolicy()
+
         if ontick:
             self.ontick += ontick
         if onMarketUpdate:
@@ -144,13 +166,20 @@ class StrategyBase(BitsharesOrderEngine, BitsharesPriceFeed):
         # Count of orders to be fetched from the API
         self.fetch_depth = 8
 
+        # Depths as (quote_amount, base_amount) the worker prices the market at, priced in advance on each block
+        self.market_price_amounts = [(0, 0)]
+
         # What percent of balance the worker should use
         self.operational_percent_quote = self.worker.get('operational_percent_quote', 0) / 100
         self.operational_percent_base = self.worker.get('operational_percent_base', 0) / 100
 
         # Get Bitshares account and market for this worker
         self._account = Account(self.worker["account"], full=True, bitshares_instance=self.bitshares)
-        self._market = Market(config["workers"][name]["market"], bitshares_instance=self.bitshares)
+        if market_data:
+            # Market object is shared by all workers on the market
+            self._market = market_data.get_market(config["workers"][name]["market"])
+        else:
+            self._market = Market(config["workers"][name]["market"], bitshares_instance=self.bitshares)
 
         # Set fee asset
         fee_asset_symbol = self.worker.get('fee_asset')
@@ -164,11 +193,22 @@ class StrategyBase(BitsharesOrderEngine, BitsharesPriceFeed):
             # If there is no fee asset, use BTS
             self.fee_asset = Asset('1.3.0', bitshares_instance=self.bitshares)
 
-        # CER cache
-        self.core_exchange_rate = None
+        # Fee schedule and CER cache
+        self.fee_cache = get_fee_cache(self.bitshares)
 
-        # Ticker
-        self.ticker = self._market.ticker
+        # Asset conversion rates, refreshed on each block
+        self.conversion_rates = get_conversion_rates(self.bitshares)
+        self.ontick += self.conversion_rates.on_block
+
+        # Tickers cached until the next block or market notification
+        self.ticker_cache = get_ticker_cache(self.bitshares)
+        self.ontick += self.ticker_cache.on_block
+
+        # Order book shared by all workers on the market
+        self.order_book = get_order_book(self.bitshares, self._market)
+
+        # Market data hub handing out market snapshots, set for workers run by WorkerInfrastructure
+        self.market_data = market_data
 
         # Settings for bitshares instance
         self.bitshares.bundle = bool(self.worker.get("bundle", False))
@@ -315,14 +355,6 @@ class StrategyBase(BitsharesOrderEngine, BitsharesPriceFeed):
 
         return profit
 
-    @property
-    def balances(self):
-        """ Returns all the balances of the account assigned for the worker.
-
-            :return: Balances in list where each asset is in their own Amount object
-        """
-        return self._account.balances
-
     @staticmethod
     def purge_all_local_worker_data(worker_name):
         """ Removes worker's data and orders from local sqlite database
@@ -333,7 +365,7 @@ class StrategyBase(BitsharesOrderEngine, BitsharesPriceFeed):
 
     # GUI updaters
     def update_gui_slider(self):
-        ticker = self.market.ticker()
+        ticker = self.ticker()
         latest_price = ticker.get('latest', {}).get('price', None)
         if not latest_price:
             return
@@ -111,7 +111,7 @@ class Strategy(RelativeStrategy):
         # Check only closest orders (optimization)
         orders_to_check = self.filter_closest_orders(orders)
         try:
-            refreshed_orders = [self.get_order(order['id']) for order in orders_to_check]
+            refreshed_orders = self.get_orders(orders_to_check)
         except UnhandledRPCError as e:
             if str(e).startswith('first_dot != second_dot'):
                 # Wrong order id, probably a transition from SO
@@ -239,26 +239,32 @@ class Strategy(RelativeStrategy):
             sell_prices = []
 
         # Calc orders
+        # Each order takes its percentage of the balance left after placing the previous orders
+        orders = []
         # Arrange prices from far end towards center
         buy_prices = list(reversed(buy_prices))
+        base_balance = self.balance(self.market['base'])['amount']
         for price, percentage in zip(buy_prices, self.buy_orders_percentages):
-            base_amount = percentage * self.balance(self.market['base'])['amount']
+            base_amount = percentage * base_balance
             quote_amount = base_amount / price
             if quote_amount == 0:
                 break
-            # TODO: refactor place_market_xxx_order to raise InsufficientFunds exception instead of disabling worker
-            order = self.place_market_buy_order(quote_amount, price)
-            # TODO: refactor place_market_xxx_order to return orderid even if order immediately filled
-            try:
-                self.save_order(order)
-            except KeyError:
-                pass
+            orders.append({'type': 'buy', 'amount': quote_amount, 'price': price})
+            base_balance -= base_amount
 
+        quote_balance = self.balance(self.market['quote'])['amount']
         for price, percentage in zip(sell_prices, self.sell_orders_percentages):
-            quote_amount = percentage * self.balance(self.market['quote'])['amount']
+            quote_amount = percentage * quote_balance
             if quote_amount == 0:
                 break
-            order = self.place_market_sell_order(quote_amount, price)
+            orders.append({'type': 'sell', 'amount': quote_amount, 'price': price})
+            quote_balance -= quote_amount
+
+        # TODO: refactor place_market_orders to raise InsufficientFunds exception instead of disabling worker
+        for order in self.place_market_orders(orders):
+            if not order:
+                continue
+            # TODO: refactor place_market_orders to return orderid even if order immediately filled
             try:
                 self.save_order(order)
             except KeyError:
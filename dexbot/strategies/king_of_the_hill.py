@@ -142,16 +142,17 @@ class Strategy(StrategyBase):
                 self.log.info('Own {} order filled, placing a new one'.format(order_type))
                 self.place_order(order_type)
 
-            if need_cancel and self.cancel_orders(order):
-                self.place_order(order_type)
+            if need_cancel and not self.place_order(order_type, replace=order):
+                # New order was not placed, still remove the outdated one
+                self.cancel_orders(order)
 
     def get_top_prices(self):
         """ Get current top prices (foreign orders)
         """
         # Obtain orderbook orders excluding our orders
         market_orders = self.get_market_orders(depth=100)
-        own_orders_ids = [order['id'] for order in self.own_orders]
-        market_orders = [order for order in market_orders if order['id'] not in own_orders_ids]
+        self.refresh_account()
+        market_orders = [order for order in market_orders if order['id'] not in self.own_limit_orders]
         buy_orders = self.filter_buy_orders(market_orders)
         sell_orders = self.filter_sell_orders(market_orders, invert=True)
 
@@ -219,8 +220,12 @@ class Strategy(StrategyBase):
 
         return False
 
-    def place_order(self, order_type):
+    def place_order(self, order_type, replace=None):
         """ Place single order
+
+            :param str order_type: 'buy' or 'sell'
+            :param dict replace: own order to cancel in the same transaction
+            :return: placed order, None if the order was not placed
         """
         new_order = None
 
@@ -230,7 +235,11 @@ class Strategy(StrategyBase):
                 self.disabled = True
                 return
 
-            amount_base = Decimal(self.amount_base).quantize(Decimal(0).scaleb(-self.market['base']['precision']))
+            amount_base = self.amount_base
+            if replace and self.is_relative_order_size:
+                # Funds of the replaced order are released by the same transaction
+                amount_base += float(replace['for_sale']) * self.buy_order_amount / 100
+            amount_base = Decimal(amount_base).quantize(Decimal(0).scaleb(-self.market['base']['precision']))
             if not amount_base:
                 self.log.error(
                     'Cannot place {} order with 0 amount. Adjust your settings or add balance'.format(order_type)
@@ -264,7 +273,10 @@ class Strategy(StrategyBase):
                 )
                 return
 
-            new_order = self.place_market_buy_order(float(amount_quote), float(price))
+            if replace:
+                new_order = self.replace_order(replace, float(amount_quote), float(price))
+            else:
+                new_order = self.place_market_buy_order(float(amount_quote), float(price))
             self.beaten_buy_order = self.buy_order_to_beat
         elif order_type == 'sell':
             if not self.top_sell_price:
@@ -272,7 +284,11 @@ class Strategy(StrategyBase):
                 self.disabled = True
                 return
 
-            amount_quote = Decimal(self.amount_quote).quantize(Decimal(0).scaleb(-self.market['quote']['precision']))
+            amount_quote = self.amount_quote
+            if replace and self.is_relative_order_size:
+                # Funds of the replaced order are released by the same transaction
+                amount_quote += float(replace['for_sale']) * self.sell_order_amount / 100
+            amount_quote = Decimal(amount_quote).quantize(Decimal(0).scaleb(-self.market['quote']['precision']))
             if not amount_quote:
                 self.log.error(
                     'Cannot place {} order with 0 amount. Adjust your settings or add balance'.format(order_type)
@@ -305,7 +321,10 @@ class Strategy(StrategyBase):
                 )
                 return
 
-            new_order = self.place_market_sell_order(float(amount_quote), float(price))
+            if replace:
+                new_order = self.replace_order(replace, float(amount_quote), float(price))
+            else:
+                new_order = self.place_market_sell_order(float(amount_quote), float(price))
             self.beaten_sell_order = self.sell_order_to_beat
 
         if new_order:
@@ -314,6 +333,8 @@ class Strategy(StrategyBase):
         else:
             self.log.error('Failed to place {} order'.format(order_type))
 
+        return new_order
+
     def place_orders(self):
         """ Place new orders
         """
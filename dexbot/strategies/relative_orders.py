@@ -1,6 +1,7 @@
 import math
 from datetime import datetime, timedelta
 
+from dexbot.pricefeeds.market_depth import MarketDepth
 from dexbot.strategies.base import StrategyBase
 from dexbot.strategies.config_parts.relative_config import RelativeConfig
 from dexbot.strategies.external_feeds.price_feed import PriceFeed
@@ -265,26 +266,25 @@ class Strategy(StrategyBase):
         self.calculate_order_prices()
 
         order_ids = []
-        expected_num_orders = 0
+        orders = []
 
         amount_to_buy = self.amount_to_buy
         amount_to_sell = self.amount_to_sell
 
         # Buy Side
         if amount_to_buy:
-            buy_order = self.place_market_buy_order(amount_to_buy, self.buy_price, True)
-            if buy_order:
-                self.save_order(buy_order)
-                order_ids.append(buy_order['id'])
-            expected_num_orders += 1
+            orders.append({'type': 'buy', 'amount': amount_to_buy, 'price': self.buy_price})
 
         # Sell Side
         if amount_to_sell:
-            sell_order = self.place_market_sell_order(amount_to_sell, self.sell_price, True)
-            if sell_order:
-                self.save_order(sell_order)
-                order_ids.append(sell_order['id'])
-            expected_num_orders += 1
+            orders.append({'type': 'sell', 'amount': amount_to_sell, 'price': self.sell_price})
+
+        # Place both sides with one transaction
+        expected_num_orders = len(orders)
+        for order in self.place_market_orders(orders, return_none=True):
+            if order:
+                self.save_order(order)
+                order_ids.append(order['id'])
 
         self['order_ids'] = order_ids
 
@@ -294,163 +294,26 @@ class Strategy(StrategyBase):
         if len(order_ids) < expected_num_orders and not self.disabled:
             self.update_orders()
 
-    def get_market_buy_price(self, quote_amount=0, base_amount=0, **kwargs):
-        """ Returns the BASE/QUOTE price for which [depth] worth of QUOTE could be bought, enhanced with
-            moving average or weighted moving average
+    def get_market_depth(self, exclude_own_orders=True, **kwargs):
+        """ Returns buy and sell sides of one order book snapshot, used by get_market_buy_price(),
+            get_market_sell_price(), get_market_center_price() and get_market_spread()
 
-            :param float | quote_amount:
-            :param float | base_amount:
+            :param bool | exclude_own_orders: Exclude own orders when calculating a price
             :param dict | kwargs:
-                bool | exclude_own_orders: Exclude own orders when calculating a price
-            :return: price as float
+            :return: tuple of buy side and sell side as MarketDepth
         """
-        exclude_own_orders = kwargs.get('exclude_own_orders', True)
-        market_buy_orders = []
-
-        # Exclude own orders from orderbook if needed
-        if exclude_own_orders:
-            market_buy_orders = self.get_market_buy_orders(depth=self.fetch_depth)
-            own_buy_orders_ids = [order['id'] for order in self.get_own_buy_orders()]
-            market_buy_orders = [order for order in market_buy_orders if order['id'] not in own_buy_orders_ids]
-
-        # In case amount is not given, return price of the highest buy order on the market
-        if quote_amount == 0 and base_amount == 0:
-            if exclude_own_orders:
-                if market_buy_orders:
-                    return float(market_buy_orders[0]['price'])
-                else:
-                    return 0.0
-            else:
-                return float(self.ticker().get('highestBid'))
-
-        # Like get_market_sell_price(), but defaulting to base_amount if both base and quote are specified.
-        asset_amount = base_amount
-
-        # Since the purpose is never get both quote and base amounts, favor base amount if both given because
-        # this function is looking for buy price.
-
-        if base_amount > quote_amount:
-            base = True
+        snapshot = self.market_snapshot
+        if snapshot is not None:
+            limit_orders = snapshot.limit_orders
         else:
-            asset_amount = quote_amount
-            base = False
-
-        if not market_buy_orders:
-            market_buy_orders = self.get_market_buy_orders(depth=self.fetch_depth)
-        market_fee = self.market['base'].market_fee_percent
-
-        target_amount = asset_amount * (1 + market_fee)
-
-        quote_amount = 0
-        base_amount = 0
-        missing_amount = target_amount
-
-        for order in market_buy_orders:
-            if base:
-                # BASE amount was given
-                if order['base']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['base']['amount']
-                else:
-                    base_amount += missing_amount
-                    quote_amount += missing_amount / order['price']
-                    break
-            elif not base:
-                # QUOTE amount was given
-                if order['quote']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['quote']['amount']
-                else:
-                    base_amount += missing_amount * order['price']
-                    quote_amount += missing_amount
-                    break
-
-        # Prevent division by zero
-        if not quote_amount:
-            return 0.0
-
-        return base_amount / quote_amount
-
-    def get_market_sell_price(self, quote_amount=0, base_amount=0, **kwargs):
-        """ Returns the BASE/QUOTE price for which [quote_amount] worth of QUOTE could be bought,
-            enhanced with moving average or weighted moving average.
-
-            [quote/base]_amount = 0 means lowest regardless of size
-
-            :param float | quote_amount:
-            :param float | base_amount:
-            :param dict | kwargs:
-                bool | exclude_own_orders: Exclude own orders when calculating a price
-            :return:
-        """
-        exclude_own_orders = kwargs.get('exclude_own_orders', True)
-        market_sell_orders = []
+            limit_orders = self.order_book.get_limit_orders(self.fetch_depth)
 
         # Exclude own orders from orderbook if needed
         if exclude_own_orders:
-            market_sell_orders = self.get_market_sell_orders(depth=self.fetch_depth)
-            own_sell_orders_ids = [order['id'] for order in self.get_own_sell_orders()]
-            market_sell_orders = [order for order in market_sell_orders if order['id'] not in own_sell_orders_ids]
-
-        # In case amount is not given, return price of the lowest sell order on the market
-        if quote_amount == 0 and base_amount == 0:
-            if exclude_own_orders:
-                if market_sell_orders:
-                    return float(market_sell_orders[0]['price'])
-                else:
-                    return 0.0
-            else:
-                return float(self.ticker().get('lowestAsk'))
-
-        asset_amount = quote_amount
+            self.refresh_account()
+            limit_orders = [order for order in limit_orders if order['id'] not in self.own_limit_orders]
 
-        # Since the purpose is never get both quote and base amounts, favor quote amount if both given because
-        # this function is looking for sell price.
-        if quote_amount > base_amount:
-            quote = True
-        else:
-            asset_amount = base_amount
-            quote = False
-
-        if not market_sell_orders:
-            market_sell_orders = self.get_market_sell_orders(depth=self.fetch_depth)
-        market_fee = self.market['quote'].market_fee_percent
-
-        target_amount = asset_amount * (1 + market_fee)
-
-        quote_amount = 0
-        base_amount = 0
-        missing_amount = target_amount
-
-        for order in market_sell_orders:
-            if quote:
-                # QUOTE amount was given
-                if order['quote']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['quote']['amount']
-                else:
-                    base_amount += missing_amount * order['price']
-                    quote_amount += missing_amount
-                    break
-            elif not quote:
-                # BASE amount was given
-                if order['base']['amount'] <= missing_amount:
-                    quote_amount += order['quote']['amount']
-                    base_amount += order['base']['amount']
-                    missing_amount -= order['base']['amount']
-                else:
-                    base_amount += missing_amount
-                    quote_amount += missing_amount / order['price']
-                    break
-
-        # Prevent division by zero
-        if not quote_amount:
-            return 0.0
-
-        return base_amount / quote_amount
+        return MarketDepth.from_limit_orders(limit_orders, self.market)
 
     def _calculate_center_price(self, suppress_errors=False):
         highest_bid = float(self.ticker().get('highestBid'))
@@ -564,12 +427,11 @@ class Strategy(StrategyBase):
             need_update = True
         else:
             # Loop trough the orders and look for changes
-            for order_id, order in orders.items():
-                if not order_id.startswith('1.7.'):
-                    need_update = True
-                    break
-                current_order = self.get_order(order_id)
-
+            order_ids = list(orders)
+            if not all(order_id.startswith('1.7.') for order_id in order_ids):
+                need_update = True
+                order_ids = []
+            for current_order in self.get_orders(order_ids):
                 if not current_order:
                     need_update = True
                     self.log.debug('Could not find order on the market, it was filled, expired or cancelled')
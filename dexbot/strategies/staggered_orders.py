@@ -82,6 +82,8 @@ class Strategy(StrategyBase):
         self.virtual_buy_orders = []
         self.virtual_sell_orders = []
         self.virtual_orders_restored = False
+        # Virtual orders waiting to be saved into the db in one batch, None = save each order immediately
+        self.unsaved_virtual_orders = None
         self.quote_total_balance = 0
         self.base_total_balance = 0
         self.quote_balance = None
@@ -465,11 +467,8 @@ class Strategy(StrategyBase):
         to_add_ids = current_real_ids.difference(stored_ids)
         to_add_orders = [order for order in current_real_orders if order['id'] in to_add_ids]
 
-        for _id in to_remove_ids:
-            self.remove_order(_id)
-
-        for order in to_add_orders:
-            self.save_order_extended(order, custom='current')
+        self.remove_orders(to_remove_ids)
+        self.save_orders_extended(to_add_orders, custom='current')
 
     def dump_initial_orders(self):
         """ Save orders after initial placement for later use (visualization and so on)
@@ -480,10 +479,10 @@ class Strategy(StrategyBase):
         # Ids should be changed to avoid ids intersection with "current" orders
         for order in orders:
             order['id'] = str(uuid.uuid4())
-            if isinstance(order, VirtualOrder):
-                self.save_order_extended(order, virtual=True, custom='initial')
-            else:
-                self.save_order_extended(order, virtual=False, custom='initial')
+        virtual_orders = [order for order in orders if isinstance(order, VirtualOrder)]
+        real_orders = [order for order in orders if not isinstance(order, VirtualOrder)]
+        self.save_orders_extended(virtual_orders, virtual=True, custom='initial')
+        self.save_orders_extended(real_orders, virtual=False, custom='initial')
 
     def drop_initial_orders(self):
         """ Drop old "initial" orders from the db
@@ -536,20 +535,33 @@ class Strategy(StrategyBase):
         """
 
         def place_further_buy_orders():
-            furthest_order = self.real_buy_orders[-1]
-            while furthest_order['price'] > self.lower_bound * (1 + self.increment):
-                furthest_order = self.place_further_order('base', furthest_order, virtual=True)
-                if not isinstance(furthest_order, VirtualOrder):
-                    # Failed to place order
-                    break
+            self.unsaved_virtual_orders = []
+            try:
+                furthest_order = self.real_buy_orders[-1]
+                while furthest_order['price'] > self.lower_bound * (1 + self.increment):
+                    furthest_order = self.place_further_order('base', furthest_order, virtual=True)
+                    if not isinstance(furthest_order, VirtualOrder):
+                        # Failed to place order
+                        break
+            finally:
+                save_virtual_orders()
 
         def place_further_sell_orders():
-            furthest_order = self.real_sell_orders[-1]
-            while furthest_order['price'] ** -1 < self.upper_bound / (1 + self.increment):
-                furthest_order = self.place_further_order('quote', furthest_order, virtual=True)
-                if not isinstance(furthest_order, VirtualOrder):
-                    # Failed to place order
-                    break
+            self.unsaved_virtual_orders = []
+            try:
+                furthest_order = self.real_sell_orders[-1]
+                while furthest_order['price'] ** -1 < self.upper_bound / (1 + self.increment):
+                    furthest_order = self.place_further_order('quote', furthest_order, virtual=True)
+                    if not isinstance(furthest_order, VirtualOrder):
+                        # Failed to place order
+                        break
+            finally:
+                save_virtual_orders()
+
+        def save_virtual_orders():
+            # Virtual orders placed above are saved into the db in one batch
+            self.save_orders_extended(self.unsaved_virtual_orders, virtual=True, custom='current')
+            self.unsaved_virtual_orders = None
 
         # Load orders from the database
         result = self.fetch_orders_extended(only_virtual=True, custom='current')
@@ -574,8 +586,7 @@ class Strategy(StrategyBase):
             # Only buy orders, purge stored sell orders
             if stored_sell_orders:
                 self.log.info('Purging virtual sell orders because of no real sell orders')
-                for order in stored_sell_orders:
-                    self.remove_order(order)
+                self.remove_orders(stored_sell_orders)
 
             if stored_buy_orders:
                 self.log.info('Loading virtual buy orders from database')
@@ -586,8 +597,7 @@ class Strategy(StrategyBase):
         elif not self.buy_orders and self.sell_orders:
             if stored_buy_orders:
                 self.log.info('Purging virtual buy orders because of no real buy orders')
-                for order in stored_buy_orders:
-                    self.remove_order(order)
+                self.remove_orders(stored_buy_orders)
 
             if stored_sell_orders:
                 self.log.info('Loading virtual sell orders from database')
@@ -1465,18 +1475,16 @@ class Strategy(StrategyBase):
                         order_type, self.mode, old_amount, price
                     )
                 )
-                self.cancel_orders_wrapper(orders[index])
-
-                if asset == 'quote':
-                    if isinstance(orders[index], VirtualOrder):
+                if isinstance(orders[index], VirtualOrder):
+                    self.cancel_orders_wrapper(orders[index])
+                    if asset == 'quote':
                         self.place_virtual_sell_order(order['base']['amount'], price)
-                    else:
-                        self.place_market_sell_order(order['base']['amount'], price)
-                elif asset == 'base':
-                    if isinstance(orders[index], VirtualOrder):
+                    elif asset == 'base':
                         self.place_virtual_buy_order(order['quote']['amount'], price)
-                    else:
-                        self.place_market_buy_order(order['quote']['amount'], price)
+                elif asset == 'quote':
+                    self.replace_order(orders[index], order['base']['amount'], price)
+                elif asset == 'base':
+                    self.replace_order(orders[index], order['quote']['amount'], price)
 
                 # Limit number of operations to send at once
                 ops_num = len(self.bitshares.txbuffer.ops)
@@ -1536,14 +1544,13 @@ class Strategy(StrategyBase):
 
         # Make sure we have enough balance to replace partially filled order
         if asset_balance + order['for_sale']['amount'] >= order['base']['amount']:
-            # Cancel closest order and immediately replace it with new one.
+            # Cancel closest order and replace it with new one in the same transaction
             self.log.info('Replacing partially filled {} order'.format(order_type))
-            self.cancel_orders_wrapper(order)
             if order_type == 'buy':
-                self.place_market_buy_order(order['quote']['amount'], order['price'])
+                self.replace_order(order, order['quote']['amount'], order['price'])
             elif order_type == 'sell':
                 price = order['price'] ** -1
-                self.place_market_sell_order(order['base']['amount'], price)
+                self.replace_order(order, order['base']['amount'], price)
             if self.returnOrderId:
                 self.refresh_balances()
         else:
@@ -2145,7 +2152,10 @@ class Strategy(StrategyBase):
         # Immediately lower avail balance
         self.base_balance['amount'] -= order['base']['amount']
 
-        self.save_order_extended(order, virtual=True, custom='current')
+        if self.unsaved_virtual_orders is None:
+            self.save_order_extended(order, virtual=True, custom='current')
+        else:
+            self.unsaved_virtual_orders.append(order)
 
         return order
 
@@ -2180,7 +2190,10 @@ class Strategy(StrategyBase):
         # Immediately lower avail balance
         self.quote_balance['amount'] -= order['base']['amount']
 
-        self.save_order_extended(order, virtual=True, custom='current')
+        if self.unsaved_virtual_orders is None:
+            self.save_order_extended(order, virtual=True, custom='current')
+        else:
+            self.unsaved_virtual_orders.append(order)
 
         return order
 
@@ -2198,8 +2211,7 @@ class Strategy(StrategyBase):
             # Just rebuild virtual orders list to avoid calling Asset's __eq__ method
             self.virtual_orders = [order for order in self.virtual_orders if order not in virtual_orders]
             # Also remove virtual order from database
-            for order in virtual_orders:
-                self.remove_order(order)
+            self.remove_orders(virtual_orders)
 
         if real_orders:
             return self.cancel_orders(real_orders, **kwargs)
@@ -13,6 +13,7 @@ from bitshares.instance import set_shared_bitshares_instance
 from dexbot import APP_NAME, AUTHOR, VERSION
 from dexbot.config import Config
 from dexbot.node_manager import get_sorted_nodelist, ping
+from dexbot.storage import configure_storage
 from ruamel import yaml
 
 log = logging.getLogger(__name__)
@@ -156,6 +157,7 @@ def configfile(f):
         if not os.path.isfile(ctx.obj["configfile"]):
             Config(path=ctx.obj['configfile'])
         ctx.config = yaml.safe_load(open(ctx.obj["configfile"]))
+        configure_storage(ctx.obj["configfile"])
         return ctx.invoke(f, *args, **kwargs)
 
     return update_wrapper(new_func, f)
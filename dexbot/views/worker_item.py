@@ -1,7 +1,7 @@
 import re
 
 from dexbot.controllers.worker_controller import WorkerController
-from dexbot.storage import db_worker
+from dexbot.storage import Storage
 from dexbot.views.errors import gui_error
 from PyQt5 import QtCore, QtWidgets
 
@@ -41,13 +41,14 @@ class WorkerItemWidget(QtWidgets.QWidget, Ui_widget):
         strategies = WorkerController.get_strategies()
         self.set_worker_strategy(strategies[module]['name'])
 
-        profit = db_worker.get_item(worker_name, 'profit')
+        storage = Storage(worker_name)
+        profit = storage['profit']
         if profit:
             self.set_worker_profit(profit)
         else:
             self.set_worker_profit(0)
 
-        percentage = db_worker.get_item(worker_name, 'slider')
+        percentage = storage['slider']
         if percentage:
             self.set_worker_slider(percentage)
         else:
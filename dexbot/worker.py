@@ -8,6 +8,11 @@ import threading
 import dexbot.errors as errors
 from bitshares.instance import shared_bitshares_instance
 from bitshares.notify import Notify
+from dexbot.orderengines.retry import RetryDeferred
+from dexbot.pricefeeds.market_data import MarketDataHub
+from dexbot.pricefeeds.order_book import update_order_books
+from dexbot.pricefeeds.recorder import OrderBookRecorder
+from dexbot.pricefeeds.ticker_cache import get_ticker_cache
 from dexbot.strategies.base import StrategyBase
 
 log = logging.getLogger(__name__)
@@ -34,6 +39,12 @@ class WorkerInfrastructure(threading.Thread):
         self.accounts = set()
         self.markets = set()
 
+        # Market objects and per-block market snapshots shared by the workers
+        self.market_data = MarketDataHub(self.bitshares)
+
+        # Order book recorder of the markets in the recorder section of the config
+        self.recorder = None
+
         # Set the module search path
         user_worker_path = os.path.expanduser("~/bots")
         if os.path.exists(user_worker_path):
@@ -69,7 +80,21 @@ class WorkerInfrastructure(threading.Thread):
             try:
                 strategy_class = getattr(importlib.import_module(worker["module"]), 'Strategy')
                 self.workers[worker_name] = strategy_class(
-                    config=config, name=worker_name, bitshares_instance=self.bitshares, view=self.view
+                    config=config,
+                    name=worker_name,
+                    bitshares_instance=self.bitshares,
+                    market_data=self.market_data,
+                    view=self.view,
+                )
+                # Don't let one worker's retry backoff stall the others
+                self.workers[worker_name].retry_policy.blocking = False
+                # Market notifications keep the order book up to date
+                self.workers[worker_name].order_book.live = True
+                self.market_data.subscribe(
+                    worker_name,
+                    worker['market'],
+                    self.workers[worker_name].fetch_depth,
+                    self.workers[worker_name].market_price_amounts,
                 )
                 self.markets.add(worker['market'])
                 self.accounts.add(worker['account'])
@@ -85,6 +110,17 @@ class WorkerInfrastructure(threading.Thread):
                 )
         self.config_lock.release()
 
+    def init_recorder(self):
+        """ Start recording order books of the markets configured in the recorder section of the config
+        """
+        try:
+            self.recorder = OrderBookRecorder.from_config(self.bitshares, self.config, self.market_data.get_market)
+        except Exception:
+            log.exception("Order book recorder initialisation")
+            return
+        if self.recorder:
+            self.markets.update(self.recorder.market_names)
+
     def update_notify(self):
         if not self.config['workers']:
             log.critical("No workers configured to launch, exiting")
@@ -115,6 +151,15 @@ class WorkerInfrastructure(threading.Thread):
             finally:
                 self.jobs = set()
 
+        # Market snapshots are taken once per market for all workers, on first use in the block
+        try:
+            self.market_data.on_block(data)
+        except Exception:
+            log.exception("Resetting market snapshots")
+
+        if self.recorder:
+            self.recorder.on_block(data)
+
         self.config_lock.acquire()
         for worker_name, worker in self.config["workers"].items():
             if worker_name not in self.workers:
@@ -122,9 +167,19 @@ class WorkerInfrastructure(threading.Thread):
             elif self.workers[worker_name].disabled:
                 self.workers[worker_name].log.error('Worker "{}" is disabled'.format(worker_name))
                 self.workers.pop(worker_name)
+                self.market_data.unsubscribe(worker_name)
+                continue
+            elif self.workers[worker_name].retry_policy.is_deferred():
+                # Broadcast transactions get confirmed or expire regardless of the worker being postponed
+                try:
+                    self.workers[worker_name].check_pending_transactions(data)
+                except Exception:
+                    self.workers[worker_name].log.exception("Checking pending transactions")
                 continue
             try:
                 self.workers[worker_name].ontick(data)
+            except RetryDeferred as exception:
+                self.workers[worker_name].log.warning('Postponing worker: {}'.format(exception))
             except Exception as e:
                 self.workers[worker_name].log.exception("in ontick()")
                 try:
@@ -134,6 +189,13 @@ class WorkerInfrastructure(threading.Thread):
         self.config_lock.release()
 
     def on_market(self, data):
+        # Update order books and tickers once for all workers on the market
+        update_order_books(self.bitshares, data)
+        get_ticker_cache(self.bitshares).on_market(data)
+        self.market_data.on_market(data)
+        if self.recorder:
+            self.recorder.on_market(data)
+
         if data.get("deleted", False):  # No info available on deleted orders
             return
 
@@ -144,10 +206,15 @@ class WorkerInfrastructure(threading.Thread):
             elif self.workers[worker_name].disabled:
                 self.workers[worker_name].log.error('Worker "{}" is disabled'.format(worker_name))
                 self.workers.pop(worker_name)
+                self.market_data.unsubscribe(worker_name)
+                continue
+            elif self.workers[worker_name].retry_policy.is_deferred():
                 continue
             if worker["market"] == data.market:
                 try:
                     self.workers[worker_name].onMarketUpdate(data)
+                except RetryDeferred as exception:
+                    self.workers[worker_name].log.warning('Postponing worker: {}'.format(exception))
                 except Exception as e:
                     self.workers[worker_name].log.exception("in onMarketUpdate()")
                     try:
@@ -165,10 +232,15 @@ class WorkerInfrastructure(threading.Thread):
             elif self.workers[worker_name].disabled:
                 self.workers[worker_name].log.error('Worker "{}" is disabled'.format(worker_name))
                 self.workers.pop(worker_name)
+                self.market_data.unsubscribe(worker_name)
+                continue
+            elif self.workers[worker_name].retry_policy.is_deferred():
                 continue
             if worker["account"] == account["name"]:
                 try:
                     self.workers[worker_name].onAccount(account_update)
+                except RetryDeferred as exception:
+                    self.workers[worker_name].log.warning('Postponing worker: {}'.format(exception))
                 except Exception as e:
                     self.workers[worker_name].log.exception("in onAccountUpdate()")
                     try:
@@ -177,6 +249,14 @@ class WorkerInfrastructure(threading.Thread):
                         self.workers[worker_name].log.exception("in error_onAccountUpdate()")
         self.config_lock.release()
 
+    def get_retry_stats(self):
+        """ Retry counters of the running workers
+
+            :return: dict {worker_name: {error class: {'retries': int, 'deferred': int, 'exhausted': int}}}
+        """
+        with self.config_lock:
+            return {worker_name: worker.retry_policy.stats() for worker_name, worker in self.workers.items()}
+
     def add_worker(self, worker_name, config):
         with self.config_lock:
             self.config['workers'][worker_name] = config['workers'][worker_name]
@@ -185,6 +265,7 @@ class WorkerInfrastructure(threading.Thread):
 
     def run(self):
         self.init_workers(self.config)
+        self.init_recorder()
         self.update_notify()
         self.notify.listen()
 
@@ -217,6 +298,7 @@ class WorkerInfrastructure(threading.Thread):
             if pause and worker_name in self.workers:
                 self.workers[worker_name].pause()
             self.workers.pop(worker_name, None)
+            self.market_data.unsubscribe(worker_name)
         else:
             # Kill all of the workers
             if pause:
@@ -230,6 +312,9 @@ class WorkerInfrastructure(threading.Thread):
         else:
             # No workers left, close websocket
             self.notify.websocket.close()
+            if self.recorder:
+                self.recorder.close()
+                self.recorder = None
 
     def remove_worker(self, worker_name=None):
         if worker_name:
@@ -247,8 +332,9 @@ class WorkerInfrastructure(threading.Thread):
                 if market == worker['market']:
                     break  # Found the same market, do nothing
             else:
-                # No markets found, safe to remove
-                self.markets.remove(market)
+                # No markets found, safe to remove unless the market is recorded
+                if not self.recorder or market not in self.recorder.market_names:
+                    self.markets.remove(market)
 
     @staticmethod
     def remove_offline_worker(config, worker_name, bitshares_instance):
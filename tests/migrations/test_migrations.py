@@ -1,6 +1,9 @@
+import alembic.config
 import pytest
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect
 
-from dexbot.storage import DatabaseWorker
+from dexbot.storage import MIGRATIONS_HEAD, DatabaseWorker
 
 
 @pytest.mark.mandatory
@@ -15,3 +18,54 @@ def test_apply_migrations_historic(historic_db):
     """ Test transition of old installation before alembic
     """
     DatabaseWorker.run_migrations('dexbot/migrations', 'sqlite:///{}'.format(historic_db))
+
+
+def get_indexes(db_file):
+    engine = create_engine('sqlite:///{}'.format(db_file))
+    inspector = inspect(engine)
+    return {table: {index['name'] for index in inspector.get_indexes(table)} for table in inspector.get_table_names()}
+
+
+@pytest.mark.mandatory
+def test_indexes_fresh_and_historic_match(fresh_db, historic_db):
+    """ Indexes created from models must match the ones created by migrations
+    """
+    DatabaseWorker.run_migrations('dexbot/migrations', 'sqlite:///{}'.format(historic_db))
+    fresh = get_indexes(fresh_db)
+    historic = get_indexes(historic_db)
+    for table in ['config', 'orders', 'balances', 'balance_rollups']:
+        assert fresh[table]
+        assert fresh[table] == historic[table]
+
+
+@pytest.mark.mandatory
+def test_duplicate_config_keys_removed(historic_db):
+    engine = create_engine('sqlite:///{}'.format(historic_db))
+    with engine.connect() as conn:
+        conn.execute("INSERT INTO config (category, key, value) VALUES ('foo', 'bar', '1')")
+        conn.execute("INSERT INTO config (category, key, value) VALUES ('foo', 'bar', '2')")
+
+    DatabaseWorker.run_migrations('dexbot/migrations', 'sqlite:///{}'.format(historic_db))
+
+    with engine.connect() as conn:
+        rows = conn.execute("SELECT value FROM config WHERE category = 'foo' AND key = 'bar'").fetchall()
+    assert rows == [('2',)]
+
+
+@pytest.mark.mandatory
+def test_migrations_head():
+    """ MIGRATIONS_HEAD must be updated together with new migrations
+    """
+    config = alembic.config.Config()
+    config.set_main_option('script_location', 'dexbot/migrations')
+    assert ScriptDirectory.from_config(config).get_current_head() == MIGRATIONS_HEAD
+
+
+@pytest.mark.mandatory
+def test_up_to_date_db_skips_migrations(fresh_db, monkeypatch):
+    def run_migrations(*args, **kwargs):
+        raise AssertionError('Migrations must not run on up to date database')
+
+    monkeypatch.setattr(DatabaseWorker, 'run_migrations', run_migrations)
+    worker = DatabaseWorker(sqlite_file=fresh_db)
+    worker.stop()
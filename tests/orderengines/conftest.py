@@ -0,0 +1,54 @@
+import logging
+
+import pytest
+from dexbot.strategies.base import StrategyBase
+
+log = logging.getLogger("dexbot")
+
+
+@pytest.fixture(scope='session')
+def assets(create_asset):
+    """ Create some assets with different precision
+    """
+    create_asset('ENGBASE', 3)
+    create_asset('ENGQUOTE', 8)
+
+
+@pytest.fixture
+def account(assets, prepare_account):
+    """ Prepare worker account with some balance
+
+        This fixture should be function-scoped to use new fresh bitshares account for each test
+    """
+    return prepare_account({'ENGBASE': 10000, 'ENGQUOTE': 100, 'TEST': 1000})
+
+
+@pytest.fixture(scope='session')
+def worker_name():
+    return 'engine-worker'
+
+
+@pytest.fixture
+def config(bitshares, account, worker_name):
+    return {
+        'node': '{}'.format(bitshares.rpc.url),
+        'workers': {
+            worker_name: {
+                'account': '{}'.format(account),
+                'market': 'ENGQUOTE/ENGBASE',
+                'module': 'dexbot.strategies.base',
+                'fee_asset': 'TEST',
+            }
+        },
+    }
+
+
+@pytest.fixture
+def worker(bitshares, config, worker_name):
+    """ Worker exposing BitsharesOrderEngine methods
+    """
+    worker = StrategyBase(name=worker_name, config=config, bitshares_instance=bitshares)
+    yield worker
+    worker.cancel_all_orders()
+    worker.bitshares.txbuffer.clear()
+    worker.bitshares.bundle = False
@@ -0,0 +1,406 @@
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+import bitsharesapi.exceptions
+import pytest
+from dexbot.orderengines.bitshares_engine import (
+    BitsharesOrderEngine,
+    ConversionRates,
+    FeeCache,
+    PendingTransaction,
+)
+from dexbot.orderengines.retry import RetryPolicy
+
+# Turn on debug for dexbot logger
+log = logging.getLogger("dexbot")
+log.setLevel(logging.DEBUG)
+
+
+@pytest.fixture
+def account_refreshes(worker, monkeypatch):
+    """ Count account data refreshes of the worker
+    """
+    refreshes = []
+    refresh = worker.account.refresh
+
+    def counting_refresh():
+        refreshes.append(True)
+        refresh()
+
+    monkeypatch.setattr(worker.account, 'refresh', counting_refresh)
+    return refreshes
+
+
+@pytest.mark.mandatory
+def test_account_refreshed_once_per_block(worker, account_refreshes):
+    worker.own_orders
+    worker.all_own_orders
+    worker.balances
+    worker.count_asset()
+    worker.calculate_worker_value(worker.base_asset)
+    assert len(account_refreshes) == 1
+
+    # New block
+    worker.ontick('block')
+    worker.own_orders
+    worker.own_orders
+    assert len(account_refreshes) == 2
+
+    # Own broadcast changes account data
+    worker.place_market_buy_order(1, 1)
+    assert len(worker.own_orders) == 1
+    assert len(account_refreshes) == 3
+
+    worker.get_own_orders(force_refresh=True)
+    assert len(account_refreshes) == 4
+
+
+@pytest.fixture
+def get_objects_calls(worker, monkeypatch):
+    """ Record ids requested with get_objects API call
+    """
+    calls = []
+    get_objects = worker.bitshares.rpc.get_objects
+
+    def recording_get_objects(ids, *args, **kwargs):
+        calls.append(list(ids))
+        return get_objects(ids, *args, **kwargs)
+
+    monkeypatch.setattr(worker.bitshares.rpc, 'get_objects', recording_get_objects)
+    return calls
+
+
+@pytest.fixture
+def orders(worker):
+    """ Place 3 buy orders and cancel the last one
+    """
+    orders = [worker.place_market_buy_order(1, price) for price in (1, 0.9, 0.8)]
+    worker.cancel_orders(orders[-1])
+    worker.refresh_account()
+    return orders
+
+
+@pytest.mark.mandatory
+def test_place_market_orders(worker, monkeypatch):
+    broadcasts = []
+    broadcast = worker.bitshares.rpc.broadcast_transaction_synchronous
+
+    def recording_broadcast(transaction, *args, **kwargs):
+        broadcasts.append(len(transaction['operations']))
+        return broadcast(transaction, *args, **kwargs)
+
+    monkeypatch.setattr(worker.bitshares.rpc, 'broadcast_transaction_synchronous', recording_broadcast)
+    requests = [{'type': 'buy', 'amount': 1, 'price': price} for price in (1, 0.9, 0.8)]
+    requests += [{'type': 'sell', 'amount': 1, 'price': price} for price in (1.5, 2)]
+    placed = worker.place_market_orders(requests)
+
+    assert broadcasts == [5]
+    assert [worker.is_buy_order(order) for order in placed] == [True, True, True, False, False]
+    assert placed[0]['price'] == pytest.approx(1)
+    assert placed[-1]['base']['amount'] == 1
+    assert len(worker.own_orders) == 5
+
+
+@pytest.mark.mandatory
+def test_place_market_orders_insufficient_balance(worker):
+    requests = [{'type': 'sell', 'amount': 1000000000, 'price': 1}, {'type': 'buy', 'amount': 1, 'price': 1}]
+    assert worker.place_market_orders(requests) == [None, None]
+    assert worker.disabled
+    assert len(worker.own_orders) == 0
+
+
+@pytest.mark.mandatory
+def test_replace_order(worker):
+    old_order = worker.place_market_buy_order(1, 1)
+    new_order = worker.replace_order(old_order, 2, 0.9)
+
+    assert new_order['price'] == pytest.approx(0.9)
+    assert new_order['quote']['amount'] == 2
+    assert [order['id'] for order in worker.own_orders] == [new_order['id']]
+
+    # Old order is gone, only the new one is placed
+    worker.cancel_orders(new_order)
+    replaced = worker.replace_order(new_order, 1, 0.8)
+    assert [order['id'] for order in worker.own_orders] == [replaced['id']]
+
+
+@pytest.mark.mandatory
+def test_placed_order_not_queried(worker, get_objects_calls):
+    buy_order = worker.place_market_buy_order(1, 0.5)
+    sell_order = worker.place_market_sell_order(1, 2, invert=True)
+
+    # Orders not crossing the market are built from their operations
+    assert not [ids for ids in get_objects_calls if any(object_id.startswith('1.7.') for object_id in ids)]
+    assert buy_order['price'] == pytest.approx(0.5)
+    assert buy_order['for_sale']['amount'] == 0.5
+    assert sell_order['price'] == pytest.approx(2)
+    assert {order['id'] for order in worker.own_orders} == {buy_order['id'], sell_order['id']}
+
+    # Order filled at creation is queried
+    filled_order = worker.place_market_buy_order(1, 2, return_none=True)
+    assert filled_order is None
+
+
+@pytest.mark.mandatory
+def test_get_updated_orders(worker, orders, get_objects_calls):
+    order_ids = [order['id'] for order in orders] + ['1.7.999999']
+    result = worker.get_updated_orders(order_ids)
+    assert [order['id'] if order else None for order in result] == [orders[0]['id'], orders[1]['id'], None, None]
+    # Own orders are taken from account data, the rest is fetched at once
+    assert get_objects_calls == [order_ids[2:]]
+
+
+@pytest.mark.mandatory
+def test_get_orders(worker, orders, get_objects_calls):
+    result = worker.get_orders(orders)
+    assert result[0]['id'] == orders[0]['id']
+    assert result[0]['for_sale']['amount'] == result[0]['base']['amount']
+    assert result[2] is None
+    assert get_objects_calls == [[orders[2]['id']]]
+
+
+def linear_lookup(limit_orders, order_id):
+    """ Previous implementation of own order lookup
+    """
+    for limit_order in limit_orders:
+        if order_id == limit_order['id']:
+            return limit_order
+    return None
+
+
+@pytest.mark.mandatory
+def test_benchmark_order_index():
+    """ Look up 1000 own orders by id
+    """
+    limit_orders = [{'id': '1.7.{}'.format(i), 'for_sale': i} for i in range(1000)]
+    order_ids = [limit_order['id'] for limit_order in reversed(limit_orders)]
+    # Engine with just account data, avoids running a node
+    engine = BitsharesOrderEngine.__new__(BitsharesOrderEngine)
+    engine._account = {'limit_orders': limit_orders}
+    engine.limit_orders_index = {}
+    engine.indexed_limit_orders = None
+    engine.bitshares = SimpleNamespace(rpc=None)
+
+    start = time.perf_counter()
+    linear = [linear_lookup(limit_orders, order_id) for order_id in order_ids]
+    linear_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = engine._get_limit_orders(order_ids, engine.own_limit_orders)
+    index_time = time.perf_counter() - start
+
+    log.info('1000 order lookups: linear scan {:.2f} ms, index {:.2f} ms'.format(linear_time * 1e3, index_time * 1e3))
+    assert [indexed[order_id] for order_id in order_ids] == linear
+    assert index_time < linear_time
+
+    # Index is rebuilt only when account data is refreshed
+    index = engine.own_limit_orders
+    assert engine.own_limit_orders is index
+    engine._account['limit_orders'] = limit_orders[:10]
+    assert len(engine.own_limit_orders) == 10
+
+
+@pytest.mark.mandatory
+def test_fee_cache_refresh(monkeypatch):
+    """ Fee schedule is fetched once per TTL and shared between callers
+    """
+    calls = []
+    next_maintenance = {'time': '2100-01-01T00:00:00'}
+
+    def get_dynamic_global_properties():
+        return {'next_maintenance_time': next_maintenance['time']}
+
+    bitshares = SimpleNamespace(rpc=SimpleNamespace(get_dynamic_global_properties=get_dynamic_global_properties))
+    cache = FeeCache.__new__(FeeCache)
+    cache.bitshares = bitshares
+    cache.dex = SimpleNamespace(returnFees=lambda: calls.append(1) or {'limit_order_create': {'fee': len(calls)}})
+    cache.ttl = 60
+    cache.lock = threading.Lock()
+    cache.fees = None
+    cache.fees_expiration = 0
+    cache.core_exchange_rates = {}
+
+    assert cache.get_fees() == cache.get_fees() == {'limit_order_create': {'fee': 1}}
+    assert len(calls) == 1
+
+    # Expired by TTL
+    monkeypatch.setattr(time, 'time', lambda: cache.fees_expiration)
+    assert cache.get_fees() == {'limit_order_create': {'fee': 2}}
+
+    # Expired by chain maintenance
+    next_maintenance['time'] = '2000-01-01T00:00:00'
+    cache.fees = None
+    cache.get_fees()
+    cache.get_fees()
+    assert len(calls) == 4
+
+
+@pytest.mark.mandatory
+def test_conversion_rates_routing():
+    """ 30 assets are valued with one ticker per asset, routing through BTS when there is no direct market
+    """
+    tickers = []
+    # Latest prices as BASE/QUOTE, only BTS markets have trades
+    latest = {('BTS', 'ASSET{}'.format(i)): i + 1 for i in range(30)}
+    latest[('USD', 'BTS')] = 0.5
+
+    def get_ticker(base, quote):
+        tickers.append((base, quote))
+        if (quote, base) in latest:
+            return {'latest': str(1 / latest[(quote, base)])}
+        return {'latest': str(latest.get((base, quote), 0))}
+
+    rates = ConversionRates(SimpleNamespace(rpc=SimpleNamespace(get_ticker=get_ticker)))
+    assets = ['ASSET{}'.format(i) for i in range(30)]
+
+    result = rates.get_rates(assets + ['BTS', 'USD'], 'BTS')
+    assert result['ASSET2'] == 3
+    assert result['USD'] == 2
+    assert result['BTS'] == 1
+    assert len(tickers) == 31
+
+    # Direct markets have no trades, so each asset goes through BTS using the cached tickers
+    tickers.clear()
+    result = rates.get_rates(assets, 'USD')
+    assert result['ASSET2'] == 1.5
+    assert len(tickers) == 30
+
+    # Cache is dropped on new block only
+    tickers.clear()
+    rates.on_block('block1')
+    rates.get_rates(assets, 'BTS')
+    rates.on_block('block1')
+    rates.get_rates(assets, 'BTS')
+    assert len(tickers) == 30
+
+
+def offline_engine(place_orders_transaction):
+    """ Engine without a node, placing orders through place_orders_transaction(orders)
+    """
+    engine = BitsharesOrderEngine.__new__(BitsharesOrderEngine)
+    engine.log = log
+    engine.disabled = False
+    engine.recheck_orders = False
+    engine._market = {'base': {'symbol': 'BASE', 'precision': 5}, 'quote': {'symbol': 'QUOTE', 'precision': 5}}
+    engine.balance = lambda asset: 10 ** 6
+    engine.retry_policy = RetryPolicy()
+    engine.retry_action = lambda action, *args: action(*args)
+    engine._place_orders_transaction = place_orders_transaction
+    engine.get_orders = lambda order_ids, return_none: [{'id': order_id, 'deleted': False} for order_id in order_ids]
+    engine._may_match = lambda orders: [True] * len(orders)
+    return engine
+
+
+@pytest.mark.mandatory
+def test_place_market_orders_split_failed_chunk(monkeypatch):
+    """ Rejected chunk is split until the bad order is isolated
+    """
+    transactions = []
+
+    def place_orders_transaction(orders):
+        transactions.append(len(orders))
+        if any(order['price'] == 13 for order in orders):
+            raise bitsharesapi.exceptions.UnhandledRPCError('Assert Exception')
+        return {'operation_results': [[1, '1.7.{}'.format(order['price'])] for order in orders]}
+
+    engine = offline_engine(place_orders_transaction)
+    monkeypatch.setattr('dexbot.orderengines.bitshares_engine.PLACE_ORDERS_CHUNK', 40)
+
+    requests = [{'type': 'buy', 'amount': 1, 'price': price} for price in range(1, 61)]
+    placed = engine.place_market_orders(requests)
+
+    assert placed[12] is None
+    expected_ids = ['1.7.{}'.format(price) for price in range(1, 61) if price != 13]
+    assert [order['id'] for order in placed if order] == expected_ids
+    # Only the halves containing the bad order are split again, the rest is placed once
+    assert transactions == [40, 20, 10, 10, 5, 2, 3, 1, 2, 5, 20, 20]
+
+
+@pytest.mark.mandatory
+def test_place_market_orders_batch_error(monkeypatch):
+    """ Errors not caused by an order fail the whole batch instead of splitting it
+    """
+    transactions = []
+
+    def place_orders_transaction(orders):
+        transactions.append(len(orders))
+        if len(transactions) > 1:
+            raise bitsharesapi.exceptions.UnhandledRPCError('Assert Exception: delta.amount > 0: Insufficient Balance')
+        return {'operation_results': [[1, '1.7.{}'.format(order['price'])] for order in orders]}
+
+    engine = offline_engine(place_orders_transaction)
+    monkeypatch.setattr('dexbot.orderengines.bitshares_engine.PLACE_ORDERS_CHUNK', 40)
+
+    requests = [{'type': 'buy', 'amount': 1, 'price': price} for price in range(1, 101)]
+    with pytest.raises(bitsharesapi.exceptions.UnhandledRPCError):
+        engine.place_market_orders(requests)
+    assert transactions == [40, 40]
+
+
+@pytest.mark.mandatory
+def test_may_match_uses_fresh_ticker():
+    """ Orders placed since the cached ticker was taken are seen when checking for crossing orders
+    """
+    engine = BitsharesOrderEngine.__new__(BitsharesOrderEngine)
+    engine.ticker = lambda: {'lowestAsk': 1.1, 'highestBid': 0.9}
+    engine._market = SimpleNamespace(ticker=lambda: {'lowestAsk': 1.0, 'highestBid': 0.95})
+
+    orders = [{'type': 'buy', 'price': 1.0}, {'type': 'sell', 'price': 0.95}, {'type': 'buy', 'price': 0.99}]
+    assert engine._may_match(orders) == [True, True, False]
+
+
+@pytest.mark.mandatory
+def test_check_pending_transactions():
+    """ Pending transactions are resolved by incoming blocks
+    """
+    blocks = {
+        10: {'timestamp': '2020-01-01T00:00:00', 'transaction_ids': ['aa'], 'transactions': [{'operations': []}]},
+        11: {'timestamp': '2020-01-01T00:00:03', 'transaction_ids': [], 'transactions': []},
+    }
+    resolved = []
+    engine = BitsharesOrderEngine.__new__(BitsharesOrderEngine)
+    engine.log = log
+    engine.account_state_stale = False
+    engine.bitshares = SimpleNamespace(rpc=SimpleNamespace(get_block=blocks.get))
+    engine.pending_transactions = {
+        'aa': PendingTransaction('aa', 1577836860, resolved.append),
+        'bb': PendingTransaction('bb', 1577836801, resolved.append),
+    }
+    engine.pending_scan_block = None
+
+    engine.check_pending_transactions('0000000a' + 32 * '0')
+    assert [(handle.id, handle.status, handle.block_num) for handle in resolved] == [('aa', 'confirmed', 10)]
+    assert resolved[0].transaction == {'operations': []}
+    assert engine.account_state_stale
+
+    # Expired by block time
+    engine.check_pending_transactions('0000000b' + 32 * '0')
+    assert [handle.status for handle in resolved] == ['confirmed', 'expired']
+    assert not engine.pending_transactions
+
+
+@pytest.mark.mandatory
+def test_check_pending_transactions_skipped_blocks():
+    """ Transactions included into blocks the worker got no event for are found by scanning up to the new block
+    """
+    blocks = {
+        block_num: {'timestamp': '2020-01-01T00:00:{:02}'.format(block_num), 'transaction_ids': [], 'transactions': []}
+        for block_num in range(10, 14)
+    }
+    blocks[11].update(transaction_ids=['aa'], transactions=[{'operations': []}])
+    scanned = []
+    resolved = []
+    engine = BitsharesOrderEngine.__new__(BitsharesOrderEngine)
+    engine.log = log
+    engine.account_state_stale = False
+    engine.bitshares = SimpleNamespace(rpc=SimpleNamespace(get_block=lambda num: scanned.append(num) or blocks[num]))
+    # Expires before block 13
+    engine.pending_transactions = {'aa': PendingTransaction('aa', 1577836812, resolved.append)}
+    engine.pending_scan_block = 10
+
+    engine.check_pending_transactions('0000000d' + 32 * '0')
+    assert scanned == [10, 11, 12, 13]
+    assert [(handle.status, handle.block_num) for handle in resolved] == [('confirmed', 11)]
+    assert engine.pending_scan_block == 14
@@ -0,0 +1,152 @@
+import logging
+from types import SimpleNamespace
+
+import bitsharesapi.exceptions
+import pytest
+from dexbot.orderengines.bitshares_engine import BitsharesOrderEngine
+from dexbot.orderengines.retry import DEFAULT_RULES, RetryDeferred, RetryPolicy, RetryRule
+
+log = logging.getLogger("dexbot")
+
+ERRORS = {
+    'zero_amount': 'Assert Exception: amount_to_sell.amount > 0: ',
+    'expired': 'Assert Exception: now <= trx.expiration: ',
+    'node_time': 'Assert Exception: trx.expiration <= now + chain_parameters.maximum_time_until_expiration: ',
+    'tapos': 'Assert Exception: trx.ref_block_prefix == tapos_block_summary.block_id._hash: ',
+    'fee_balance': 'Assert Exception: delta.amount > 0: Insufficient Balance: ',
+}
+
+
+class FakeRPC:
+    """ Node which fails broadcasts with the given errors before accepting one
+    """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.broadcasts = 0
+        self.node_switches = 0
+
+    def broadcast(self):
+        self.broadcasts += 1
+        if self.errors:
+            raise bitsharesapi.exceptions.UnhandledRPCError(self.errors.pop(0))
+        return {'id': 'trx'}
+
+    def next(self):
+        self.node_switches += 1
+
+
+@pytest.fixture
+def engine():
+    """ Engine without a node, retrying without delays
+    """
+    engine = BitsharesOrderEngine.__new__(BitsharesOrderEngine)
+    engine.log = log
+    engine.account_state_stale = False
+    engine.account_refreshes = 0
+    engine.retry_policy = RetryPolicy(max_delay=0)
+
+    def refresh_account(force=False):
+        engine.account_refreshes += 1
+
+    engine.refresh_account = refresh_account
+    engine.bitshares = SimpleNamespace(
+        rpc=FakeRPC([]), txbuffer=SimpleNamespace(clear=lambda: None), info=lambda: {'time': '2020-01-01T00:00:00'}
+    )
+    return engine
+
+
+@pytest.mark.mandatory
+@pytest.mark.parametrize('name', ['zero_amount', 'expired', 'node_time', 'tapos'])
+def test_retry_known_error(engine, name):
+    rpc = engine.bitshares.rpc = FakeRPC([ERRORS[name]])
+
+    assert engine.retry_action(rpc.broadcast) == {'id': 'trx'}
+    assert rpc.broadcasts == 2
+    assert engine.account_state_stale
+    assert engine.retry_policy.stats()[name] == {'retries': 1, 'deferred': 0, 'exhausted': 0}
+    assert rpc.node_switches == (1 if name in ('node_time', 'tapos') else 0)
+    assert engine.account_refreshes == (1 if name == 'zero_amount' else 0)
+
+
+@pytest.mark.mandatory
+def test_retry_budget_per_error(engine):
+    # Budgets are counted per error class
+    rpc = engine.bitshares.rpc = FakeRPC(4 * [ERRORS['expired']] + 4 * [ERRORS['tapos']])
+    assert engine.retry_action(rpc.broadcast) == {'id': 'trx'}
+
+    rpc = engine.bitshares.rpc = FakeRPC(5 * [ERRORS['expired']])
+    with pytest.raises(bitsharesapi.exceptions.UnhandledRPCError):
+        engine.retry_action(rpc.broadcast)
+    assert rpc.broadcasts == 5
+    assert engine.retry_policy.stats()['expired'] == {'retries': 8, 'deferred': 0, 'exhausted': 1}
+
+
+@pytest.mark.mandatory
+def test_retry_node_time_exhausted(engine):
+    rpc = engine.bitshares.rpc = FakeRPC(5 * [ERRORS['node_time']])
+    with pytest.raises(Exception, match='please change the node'):
+        engine.retry_action(rpc.broadcast)
+    assert rpc.node_switches == 4
+
+
+@pytest.mark.mandatory
+@pytest.mark.parametrize('error', [ERRORS['fee_balance'], 'Assert Exception: unknown'])
+def test_no_retry(engine, error):
+    rpc = engine.bitshares.rpc = FakeRPC([error])
+    with pytest.raises(bitsharesapi.exceptions.UnhandledRPCError):
+        engine.retry_action(rpc.broadcast)
+    assert rpc.broadcasts == 1
+    assert not any(counters['retries'] for counters in engine.retry_policy.stats().values())
+
+
+@pytest.mark.mandatory
+def test_retry_deferred(engine):
+    engine.retry_policy = RetryPolicy(blocking=False)
+    rpc = engine.bitshares.rpc = FakeRPC([ERRORS['expired']])
+
+    with pytest.raises(RetryDeferred) as deferred:
+        engine.retry_action(rpc.broadcast)
+    assert 6 <= deferred.value.delay <= 9
+    assert engine.retry_policy.is_deferred()
+    assert engine.retry_policy.stats()['expired'] == {'retries': 1, 'deferred': 1, 'exhausted': 0}
+
+    # Errors without delay are retried right away
+    rpc = engine.bitshares.rpc = FakeRPC([ERRORS['tapos']])
+    assert engine.retry_action(rpc.broadcast) == {'id': 'trx'}
+
+
+@pytest.mark.mandatory
+def test_backoff():
+    policy = RetryPolicy(max_delay=20, jitter=0.5)
+    rule = RetryRule('test', ('test',), delay=2)
+    for attempt, base in enumerate([2, 4, 8, 16, 20, 20]):
+        assert base <= policy.backoff(rule, attempt) <= base * 1.5
+    assert policy.classify(Exception(ERRORS['tapos'])) is DEFAULT_RULES[3]
+
+
+@pytest.mark.mandatory
+def test_retry_deferred_escalates(engine):
+    """ Error persisting over deferrals gets longer delays and finally exhausts the budget
+    """
+    engine.retry_policy = RetryPolicy(blocking=False, jitter=0)
+    delays = []
+    for _ in range(4):
+        rpc = engine.bitshares.rpc = FakeRPC([ERRORS['expired']])
+        with pytest.raises(RetryDeferred) as deferred:
+            engine.retry_action(rpc.broadcast)
+        delays.append(deferred.value.delay)
+    assert delays == [6, 12, 24, 48]
+
+    rpc = engine.bitshares.rpc = FakeRPC([ERRORS['expired']])
+    with pytest.raises(bitsharesapi.exceptions.UnhandledRPCError):
+        engine.retry_action(rpc.broadcast)
+    assert engine.retry_policy.stats()['expired'] == {'retries': 4, 'deferred': 4, 'exhausted': 1}
+
+    # Counting starts over after the budget was exhausted and after a successful action
+    rpc = engine.bitshares.rpc = FakeRPC([ERRORS['expired']])
+    with pytest.raises(RetryDeferred) as deferred:
+        engine.retry_action(rpc.broadcast)
+    assert deferred.value.delay == 6
+    assert engine.retry_action(FakeRPC([]).broadcast) == {'id': 'trx'}
+    assert engine.retry_policy.attempts == {}
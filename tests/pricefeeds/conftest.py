@@ -0,0 +1,90 @@
+import pytest
+
+BASE = '1.3.0'
+QUOTE = '1.3.1'
+OTHER = '1.3.2'
+
+
+def limit_order(order_id, sell_asset, sell_amount, receive_asset, receive_amount, for_sale=None):
+    """ Raw limit order object as returned by the node
+    """
+    return {
+        'id': order_id,
+        'seller': '1.2.100',
+        'for_sale': sell_amount if for_sale is None else for_sale,
+        'sell_price': {
+            'base': {'amount': sell_amount, 'asset_id': sell_asset},
+            'quote': {'amount': receive_amount, 'asset_id': receive_asset},
+        },
+        'expiration': '2030-01-01T00:00:00',
+        'deferred_fee': 0,
+    }
+
+
+def price(raw):
+    return raw['sell_price']['base']['amount'] / raw['sell_price']['quote']['amount']
+
+
+class FakeNode:
+    """ Node serving the given limit orders, counting get_limit_orders calls
+
+        Without limit orders every market has a buy order at 0.9 and a sell order at 1.1 BASE/QUOTE.
+    """
+
+    def __init__(self, limit_orders=None):
+        self.limit_orders = limit_orders
+        self.calls = 0
+
+    def get_limit_orders(self, base_id, quote_id, depth):
+        self.calls += 1
+        if self.limit_orders is None:
+            return [limit_order('1.7.1', base_id, 90, quote_id, 100), limit_order('1.7.2', quote_id, 100, base_id, 110)]
+        buys = [order for order in self.limit_orders if order['sell_price']['base']['asset_id'] == base_id]
+        sells = [order for order in self.limit_orders if order['sell_price']['base']['asset_id'] == quote_id]
+        return sorted(buys, key=price, reverse=True)[:depth] + sorted(sells, key=price, reverse=True)[:depth]
+
+    def get_block_header(self, block_num):
+        return {'timestamp': '2020-01-01T00:00:00'}
+
+
+class FakeBitShares:
+    def __init__(self, rpc=None):
+        self.rpc = FakeNode() if rpc is None else rpc
+
+
+class FakeAsset(dict):
+    market_fee_percent = 0
+
+
+class FakeMarket(dict):
+    """ Market counting ticker calls, the ticker reports the number of calls as the latest price
+    """
+
+    def __init__(self, base_id=BASE, quote_id=QUOTE, base_precision=0, quote_precision=0, symbols=('BASE', 'QUOTE')):
+        super().__init__(
+            base=FakeAsset(id=base_id, symbol=symbols[0], precision=base_precision),
+            quote=FakeAsset(id=quote_id, symbol=symbols[1], precision=quote_precision),
+        )
+        self.ticker_calls = 0
+
+    def ticker(self):
+        self.ticker_calls += 1
+        return {'latest': self.ticker_calls}
+
+    def get_string(self, separator=':'):
+        return '{}{}{}'.format(self['quote']['symbol'], separator, self['base']['symbol'])
+
+
+@pytest.fixture
+def node():
+    return FakeNode()
+
+
+@pytest.fixture
+def bitshares(node):
+    return FakeBitShares(node)
+
+
+@pytest.fixture
+def market():
+    return FakeMarket()
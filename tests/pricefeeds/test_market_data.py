@@ -0,0 +1,127 @@
+import logging
+
+import pytest
+from dexbot.pricefeeds.bitshares_feed import BitsharesPriceFeed
+from dexbot.pricefeeds.market_data import MarketDataHub
+from tests.pricefeeds.conftest import BASE, OTHER, QUOTE, FakeBitShares, FakeMarket, limit_order
+
+log = logging.getLogger("dexbot")
+
+
+@pytest.fixture
+def hub(bitshares):
+    hub = MarketDataHub(bitshares)
+    hub.markets = {'QUOTE/BASE': FakeMarket(BASE, QUOTE), 'OTHER/BASE': FakeMarket(BASE, OTHER)}
+    return hub
+
+
+def workers(hub, count, market_data=True):
+    """ Price feeds of workers spread over the markets of the hub
+    """
+    feeds = []
+    market_names = sorted(hub.markets)
+    for i in range(count):
+        market_name = market_names[i % len(market_names)]
+        feed = BitsharesPriceFeed(hub.get_market(market_name), bitshares_instance=hub.bitshares)
+        feed.order_book.live = True
+        if market_data:
+            feed.market_data = hub
+            hub.subscribe('worker{}'.format(i), market_name, feed.fetch_depth, [(0, 0), (50, 0)])
+        feeds.append(feed)
+    return feeds
+
+
+@pytest.mark.mandatory
+def test_snapshot_per_block(hub):
+    feed = workers(hub, 1)[0]
+    hub.on_block('block1')
+    snapshot = feed.market_snapshot
+    assert snapshot.block == 'block1'
+    assert snapshot.ticker == {'latest': 1}
+    assert feed.get_market_center_price() == pytest.approx(0.99 ** 0.5)
+    assert feed.market_snapshot is snapshot
+
+    hub.on_block('block2')
+    assert feed.market_snapshot is not snapshot
+    assert feed.market_snapshot.block == 'block2'
+
+
+@pytest.mark.mandatory
+def test_snapshots_taken_on_first_use(hub):
+    feeds = workers(hub, 2)
+    hub.on_block('block1')
+    assert hub.bitshares.rpc.calls == 0
+    assert sum(market.ticker_calls for market in hub.markets.values()) == 0
+
+    # Only the market somebody looks at is fetched
+    feeds[0].market_snapshot
+    feeds[0].market_snapshot
+    assert hub.bitshares.rpc.calls == 1
+    assert [market.ticker_calls for market in hub.markets.values()] == [0, 1]
+
+
+@pytest.mark.mandatory
+def test_subscribed_depths_priced_in_advance(hub):
+    feed = workers(hub, 1)[0]
+    hub.on_block('block1')
+    assert list(feed.market_snapshot.buy_side.price_cache) == [(50, False)]
+    assert feed.get_market_buy_price(quote_amount=50) == pytest.approx(0.9)
+
+
+@pytest.mark.mandatory
+def test_market_notifications(hub):
+    feeds = workers(hub, 2)
+    hub.on_block('block1')
+    snapshots = [feed.market_snapshot for feed in feeds]
+
+    other_market = hub.markets['OTHER/BASE']
+    hub.on_market(limit_order('1.7.3', other_market['quote']['id'], 1, other_market['base']['id'], 1))
+    assert [feed.market_snapshot is snapshot for feed, snapshot in zip(feeds, snapshots)] == [False, True]
+
+    hub.on_market({'id': '1.7.3', 'deleted': True})
+    assert not any(feed.market_snapshot is snapshot for feed, snapshot in zip(feeds, snapshots))
+
+
+@pytest.mark.mandatory
+def test_unsubscribe(hub):
+    workers(hub, 2)
+    hub.unsubscribe('worker0')
+    hub.unsubscribe('worker1')
+    hub.on_block('block1')
+    assert not hub.snapshots
+
+
+@pytest.mark.mandatory
+def test_market_data_per_block():
+    """ 10 workers on 2 markets, each pricing the market and reading the ticker once per block
+    """
+    blocks = 10
+    results = {}
+    for market_data in (False, True):
+        hub = MarketDataHub(FakeBitShares())
+        hub.markets = {'QUOTE/BASE': FakeMarket(BASE, QUOTE), 'OTHER/BASE': FakeMarket(BASE, OTHER)}
+        feeds = workers(hub, 10, market_data=market_data)
+
+        book_reads = []
+        for book in {id(feed.order_book): feed.order_book for feed in feeds}.values():
+            read = book.get_limit_orders
+            book.get_limit_orders = lambda depth, read=read: book_reads.append(depth) or read(depth)
+
+        for block in range(blocks):
+            if market_data:
+                hub.on_block(block)
+            else:
+                feeds[0].ticker_cache.on_block(block)
+            for feed in feeds:
+                feed.get_market_center_price()
+                feed.ticker()
+
+        tickers = sum(market.ticker_calls for market in hub.markets.values()) / blocks
+        results[market_data] = (len(book_reads) / blocks, tickers)
+
+    log.info(
+        'Per block with 10 workers on 2 markets: {0[0]:.0f} book reads, {0[1]:.0f} tickers without hub, '
+        '{1[0]:.0f} book reads, {1[1]:.0f} tickers with hub'.format(results[False], results[True])
+    )
+    assert results[False] == (10, 2)
+    assert results[True] == (2, 2)
@@ -0,0 +1,144 @@
+import logging
+import random
+import time
+
+import pytest
+from dexbot.pricefeeds.market_depth import MarketDepth
+from tests.pricefeeds.conftest import BASE, QUOTE, FakeMarket, limit_order
+
+log = logging.getLogger("dexbot")
+
+MARKET = FakeMarket(base_precision=5, quote_precision=4)
+
+
+def random_book(levels, seed=0):
+    """ Raw limit orders around 1.0 BASE/QUOTE, best first
+    """
+    rnd = random.Random(seed)
+    buy_orders = []
+    sell_orders = []
+    for i in range(levels):
+        quote_amount = rnd.randint(1, 10 ** 6)
+        buy_price = 1 - (i + rnd.random()) / (levels + 1)
+        sell_price = 1 + (i + rnd.random()) / (levels + 1)
+        base_amounts = int(quote_amount * buy_price * 10), int(quote_amount * sell_price * 10)
+        buy_orders.append(limit_order('1.7.{}'.format(2 * i), BASE, base_amounts[0], QUOTE, quote_amount))
+        sell_orders.append(limit_order('1.7.{}'.format(2 * i + 1), QUOTE, quote_amount, BASE, base_amounts[1]))
+    return buy_orders + sell_orders
+
+
+def order_view(limit_order):
+    """ Amounts as in bitshares.price.Order, sell orders inverted
+    """
+    sell_price = limit_order['sell_price']
+    if sell_price['base']['asset_id'] == BASE:
+        base, quote = sell_price['base']['amount'] / 10 ** 5, sell_price['quote']['amount'] / 10 ** 4
+    else:
+        base, quote = sell_price['quote']['amount'] / 10 ** 5, sell_price['base']['amount'] / 10 ** 4
+    return {'base': {'amount': base}, 'quote': {'amount': quote}, 'price': base / quote}
+
+
+def loop_price(orders, asset_amount, base):
+    """ Depth price as calculated by a loop over the orders before MarketDepth
+    """
+    quote_amount = 0
+    base_amount = 0
+    missing_amount = asset_amount
+
+    for order in orders:
+        if base:
+            if order['base']['amount'] <= missing_amount:
+                quote_amount += order['quote']['amount']
+                base_amount += order['base']['amount']
+                missing_amount -= order['base']['amount']
+            else:
+                base_amount += missing_amount
+                quote_amount += missing_amount / order['price']
+                break
+        else:
+            if order['quote']['amount'] <= missing_amount:
+                quote_amount += order['quote']['amount']
+                base_amount += order['base']['amount']
+                missing_amount -= order['quote']['amount']
+            else:
+                base_amount += missing_amount * order['price']
+                quote_amount += missing_amount
+                break
+
+    if not quote_amount:
+        return 0.0
+
+    return base_amount / quote_amount
+
+
+def loop_prices(limit_orders, amounts, base):
+    """ Buy and sell prices for each amount, walking the orders per amount and side
+    """
+    orders = [order_view(limit_order) for limit_order in limit_orders]
+    buy_orders = [order for order, raw in zip(orders, limit_orders) if raw['sell_price']['base']['asset_id'] == BASE]
+    sell_orders = [order for order, raw in zip(orders, limit_orders) if raw['sell_price']['base']['asset_id'] != BASE]
+    return [(loop_price(buy_orders, amount, base), loop_price(sell_orders, amount, base)) for amount in amounts]
+
+
+def depth_prices(limit_orders, amounts, base):
+    buy_side, sell_side = MarketDepth.from_limit_orders(limit_orders, MARKET)
+    return list(zip(buy_side.get_prices(amounts, base=base), sell_side.get_prices(amounts, base=base)))
+
+
+@pytest.mark.mandatory
+def test_best_price():
+    buy_side, sell_side = MarketDepth.from_limit_orders(random_book(3), MARKET)
+    assert buy_side.best_price == buy_side.prices[0] < 1 < sell_side.best_price == sell_side.prices[0]
+    assert MarketDepth().best_price == 0.0
+    assert MarketDepth().get_price(10) == 0.0
+
+
+@pytest.mark.mandatory
+def test_whole_orders():
+    # Two sell orders of 10 QUOTE at 1.1 and 1.3 BASE/QUOTE
+    limit_orders = [
+        limit_order('1.7.1', QUOTE, 10 * 10 ** 4, BASE, 11 * 10 ** 5),
+        limit_order('1.7.2', QUOTE, 10 * 10 ** 4, BASE, 13 * 10 ** 5),
+    ]
+    buy_side, sell_side = MarketDepth.from_limit_orders(limit_orders, MARKET)
+    assert not buy_side.prices
+    assert sell_side.get_prices([5, 10, 15, 20, 100]) == pytest.approx([1.1, 1.1, 17.5 / 15, 1.2, 1.2])
+    assert sell_side.get_price(30, base=True) == pytest.approx(1.2)
+
+
+@pytest.mark.mandatory
+@pytest.mark.parametrize('base', [False, True])
+def test_same_as_loop(base):
+    limit_orders = random_book(50, seed=1)
+    amounts = [0.01, 1, 10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 7]
+    expected = loop_prices(limit_orders, amounts, base)
+    for prices, expected_prices in zip(depth_prices(limit_orders, amounts, base), expected):
+        assert prices == pytest.approx(expected_prices)
+
+
+@pytest.mark.mandatory
+@pytest.mark.parametrize('levels', [8, 100, 1000])
+def test_benchmark_depth_prices(levels):
+    """ Price 5 depths of a book from one snapshot, compared with a loop per depth and side
+    """
+    limit_orders = random_book(levels)
+    amounts = [10, 100, 1000, 10 ** 4, 10 ** 5]
+    rounds = 20
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        expected = loop_prices(limit_orders, amounts, False)
+    loop_time = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        prices = depth_prices(limit_orders, amounts, False)
+    depth_time = (time.perf_counter() - start) / rounds
+
+    log.info(
+        '{} levels, {} depths: loop {:.3f} ms, market depth {:.3f} ms'.format(
+            levels, len(amounts), loop_time * 1e3, depth_time * 1e3
+        )
+    )
+    for price_pair, expected_pair in zip(prices, expected):
+        assert price_pair == pytest.approx(expected_pair)
@@ -0,0 +1,134 @@
+import logging
+import time
+
+import pytest
+from dexbot.pricefeeds.order_book import OrderBook, get_order_book, update_order_books
+from tests.pricefeeds.conftest import BASE, QUOTE, FakeNode, limit_order
+
+log = logging.getLogger("dexbot")
+
+
+def notification(raw, deleted=False):
+    """ Order from a market notification, for_sale is converted to Amount-like dict
+    """
+    if deleted:
+        return {'id': raw['id'], 'deleted': True}
+    order = dict(raw)
+    order['for_sale'] = {'amount': raw['for_sale'] / 10 ** 5, 'asset': {'precision': 5}}
+    return order
+
+
+@pytest.fixture
+def node():
+    return FakeNode(
+        [
+            # Buy orders at 0.9, 0.8 and 0.7 BASE/QUOTE
+            limit_order('1.7.1', BASE, 90, QUOTE, 100),
+            limit_order('1.7.2', BASE, 80, QUOTE, 100),
+            limit_order('1.7.3', BASE, 70, QUOTE, 100),
+            # Sell orders at 1.1, 1.2 and 1.3 BASE/QUOTE
+            limit_order('1.7.4', QUOTE, 100, BASE, 110),
+            limit_order('1.7.5', QUOTE, 100, BASE, 120),
+            limit_order('1.7.6', QUOTE, 100, BASE, 130),
+        ]
+    )
+
+
+@pytest.fixture
+def book(bitshares):
+    book = OrderBook(bitshares, BASE, QUOTE)
+    book.live = True
+    return book
+
+
+def ids(limit_orders):
+    return [order['id'] for order in limit_orders]
+
+
+@pytest.mark.mandatory
+def test_not_live_book_fetches_every_time(book, node):
+    book.live = False
+    book.get_limit_orders(1)
+    book.get_limit_orders(1)
+    assert node.calls == 2
+
+
+@pytest.mark.mandatory
+def test_updates(book, node):
+    assert ids(book.get_limit_orders(2)) == ['1.7.1', '1.7.2', '1.7.4', '1.7.5']
+
+    # New best buy order, partial fill of the best sell order, cancel of a buy order
+    new_order = limit_order('1.7.7', BASE, 95, QUOTE, 100)
+    book.update(notification(new_order))
+    book.update(notification(limit_order('1.7.4', QUOTE, 100, BASE, 110, for_sale=40)))
+    book.update(notification(limit_order('1.7.2', BASE, 80, QUOTE, 100), deleted=True))
+
+    limit_orders = book.get_limit_orders(3)
+    assert ids(limit_orders) == ['1.7.7', '1.7.1', '1.7.3', '1.7.4', '1.7.5', '1.7.6']
+    assert limit_orders[3]['for_sale'] == 40
+    assert node.calls == 1
+
+
+@pytest.mark.mandatory
+def test_consistency_check(book, node):
+    book.get_limit_orders(1)
+    # Notification was missed
+    node.limit_orders.pop(0)
+    assert not book.sync()
+    assert ids(book.get_limit_orders(1)) == ['1.7.2', '1.7.4']
+    assert book.sync()
+
+    # Book is checked after check interval
+    book.check_interval = 0
+    time.sleep(0.01)
+    book.get_limit_orders(1)
+    assert node.calls == 4
+
+
+@pytest.mark.mandatory
+def test_partial_book(bitshares, node):
+    book = OrderBook(bitshares, BASE, QUOTE, depth=2)
+    book.live = True
+    assert ids(book.get_limit_orders(2)) == ['1.7.1', '1.7.2', '1.7.4', '1.7.5']
+
+    # Order placed beyond known part of the book is not used until it becomes known
+    book.update(notification(limit_order('1.7.8', BASE, 10, QUOTE, 100)))
+    node.limit_orders.pop(0)
+    book.update(notification(limit_order('1.7.1', BASE, 90, QUOTE, 100), deleted=True))
+    assert ids(book.get_limit_orders(2)) == ['1.7.2', '1.7.3', '1.7.4', '1.7.5']
+    assert node.calls == 2
+
+    # Deeper than book depth
+    assert len(book.get_limit_orders(3)) == 5
+    assert node.calls == 3
+
+
+@pytest.mark.mandatory
+def test_shared_books(bitshares, node):
+    market = {'base': {'id': BASE}, 'quote': {'id': QUOTE}}
+    inverted_market = {'base': {'id': QUOTE}, 'quote': {'id': BASE}}
+    book = get_order_book(bitshares, market)
+    assert get_order_book(bitshares, market) is book
+    assert get_order_book(bitshares, inverted_market) is book
+    book.live = True
+    book.get_limit_orders(1)
+
+    update_order_books(bitshares, notification(limit_order('1.7.7', BASE, 95, QUOTE, 100)))
+    update_order_books(bitshares, notification(limit_order('1.7.4', QUOTE, 100, BASE, 110), deleted=True))
+    # Fills and other notifications are ignored
+    update_order_books(bitshares, {'pays': {}, 'receives': {}})
+    assert ids(book.get_limit_orders(1)) == ['1.7.7', '1.7.5']
+    assert node.calls == 1
+
+
+@pytest.mark.mandatory
+def test_benchmark_order_book(book, node):
+    """ Read top of the book 1000 times from memory
+    """
+    book.get_limit_orders(8)
+    start = time.perf_counter()
+    for _ in range(1000):
+        book.get_limit_orders(8)
+    elapsed = time.perf_counter() - start
+    log.info('1000 order book reads: {:.2f} us per read'.format(elapsed * 1e3))
+    assert node.calls == 1
@@ -0,0 +1,172 @@
+import logging
+import os
+
+import pytest
+from dexbot.pricefeeds.recorder import INDEX_ENTRY, MarketRecorder, OrderBookRecorder, RecordingReader
+from tests.pricefeeds.conftest import BASE, QUOTE, FakeBitShares, FakeMarket, FakeNode, limit_order
+
+log = logging.getLogger("dexbot")
+
+# BitShares block interval is 3 seconds
+BLOCKS_PER_DAY = 24 * 60 * 60 // 3
+
+
+def fill(pays_asset, pays_amount, receives_asset, receives_amount, is_maker=True):
+    return {
+        'pays': {'amount': pays_amount, 'asset_id': pays_asset},
+        'receives': {'amount': receives_amount, 'asset_id': receives_asset},
+        'is_maker': is_maker,
+    }
+
+
+def book(best_buy_for_sale=900):
+    """ Buy 10 USD at 0.9 BTS/USD and sell 10 USD at 1.1 BTS/USD, sizes in satoshis
+    """
+    return [
+        limit_order('1.7.1', BASE, 900, QUOTE, 100, for_sale=best_buy_for_sale),
+        limit_order('1.7.2', QUOTE, 100, BASE, 1100),
+    ]
+
+
+def usd_market():
+    return FakeMarket(base_precision=2, quote_precision=1, symbols=('BTS', 'USD'))
+
+
+@pytest.fixture
+def market():
+    return usd_market()
+
+
+@pytest.mark.mandatory
+def test_record_and_read(tmp_path, market):
+    recorder = MarketRecorder(str(tmp_path), market)
+    assert recorder.record(100, book(), timestamp=1.0)
+    # Nothing changed
+    assert not recorder.record(101, book(), timestamp=4.0)
+    recorder.add_fill(fill(QUOTE, 50, BASE, 450))
+    recorder.add_fill(fill(BASE, 450, QUOTE, 50))
+    assert recorder.record(102, book(best_buy_for_sale=450), timestamp=7.0)
+    recorder.close()
+
+    reader = RecordingReader(recorder.data_file)
+    assert len(reader) == 2
+    assert (reader.base_symbol, reader.quote_symbol, reader.depth) == ('BTS', 'USD', 8)
+
+    snapshot = reader[0]
+    assert (snapshot.block_num, snapshot.timestamp, snapshot.fills) == (100, 1.0, [])
+    assert snapshot.buy_orders == [
+        {'price': pytest.approx(0.9), 'base': {'amount': 9, 'symbol': 'BTS'}, 'quote': {'amount': 10, 'symbol': 'USD'}}
+    ]
+    assert snapshot.sell_orders[0]['price'] == pytest.approx(1.1)
+    assert snapshot.sell_orders[0]['quote']['amount'] == 10
+
+    snapshot = reader[-1]
+    assert snapshot.buy_orders[0]['quote']['amount'] == pytest.approx(5)
+    assert [(f['type'], f['quote']['amount']) for f in snapshot.fills] == [('sell', 5), ('buy', 5)]
+    assert [f['price'] for f in snapshot.fills] == pytest.approx([0.9, 0.9])
+
+    # Blocks which were not recorded are served from the previous record
+    assert reader.get_snapshot(99) is None
+    assert reader.get_snapshot(101).block_num == 100
+    assert reader.get_snapshot(1000).block_num == 102
+    assert [snapshot.block_num for snapshot in reader] == [100, 102]
+    reader.close()
+
+
+@pytest.mark.mandatory
+def test_append_to_recording(tmp_path, market):
+    recorder = MarketRecorder(str(tmp_path), market)
+    recorder.record(100, book())
+    recorder.close()
+
+    recorder = MarketRecorder(str(tmp_path), market)
+    recorder.record(101, book())
+    recorder.close()
+
+    # Interrupted write of an index entry
+    with open(recorder.index_file, 'ab') as index:
+        index.write(b'\0' * 5)
+
+    reader = RecordingReader.open(str(tmp_path), market)
+    assert [snapshot.block_num for snapshot in reader] == [100, 101]
+    reader.close()
+
+    # Torn index entry and a record without an entry are cut off, new records stay aligned
+    data_size = os.path.getsize(recorder.data_file)
+    with open(recorder.data_file, 'ab') as data:
+        data.write(b'\1' * 20)
+    recorder = MarketRecorder(str(tmp_path), market)
+    assert os.path.getsize(recorder.index_file) % INDEX_ENTRY.size == 0
+    assert os.path.getsize(recorder.data_file) == data_size
+    recorder.record(102, book(best_buy_for_sale=450))
+    recorder.close()
+
+    # Index entry pointing past the end of the data file is dropped too
+    with open(recorder.data_file, 'r+b') as data:
+        data.truncate(data_size + 10)
+    recorder = MarketRecorder(str(tmp_path), market)
+    recorder.record(103, book(best_buy_for_sale=300))
+    recorder.close()
+
+    reader = RecordingReader.open(str(tmp_path), market)
+    assert [snapshot.block_num for snapshot in reader] == [100, 101, 103]
+    assert reader[-1].buy_orders[0]['quote']['amount'] == pytest.approx(3 / 0.9)
+    reader.close()
+
+    # Other market recorded into the same files
+    other_market = usd_market()
+    other_market['quote']['symbol'] = 'CNY'
+    other_market.get_string = market.get_string
+    with pytest.raises(ValueError):
+        MarketRecorder(str(tmp_path), other_market)
+
+
+@pytest.mark.mandatory
+def test_recorder_events(tmp_path, market):
+    bitshares = FakeBitShares(FakeNode(book()))
+    config = {'recorder': {'markets': ['USD/BTS'], 'path': str(tmp_path), 'depth': 5}}
+    recorder = OrderBookRecorder.from_config(bitshares, config, lambda name: market)
+    assert recorder.market_names == ['USD/BTS']
+    assert OrderBookRecorder.from_config(bitshares, {'workers': {}}, lambda name: market) is None
+
+    # Fills of other markets, taker side of the trade and other notifications are ignored
+    recorder.on_market(fill(QUOTE, 50, BASE, 450))
+    recorder.on_market(fill(BASE, 450, QUOTE, 50, is_maker=False))
+    recorder.on_market(fill(QUOTE, 50, '1.3.2', 450))
+    recorder.on_market(limit_order('1.7.3', BASE, 1, QUOTE, 1))
+    recorder.on_block('000000ff' + 32 * 'a')
+    recorder.close()
+
+    reader = RecordingReader.open(str(tmp_path), market)
+    assert reader.depth == 5
+    snapshot = reader[0]
+    assert (snapshot.block_num, snapshot.timestamp) == (255, 1577836800)
+    assert len(snapshot.buy_orders) == len(snapshot.sell_orders) == len(snapshot.fills) == 1
+    reader.close()
+
+
+@pytest.mark.mandatory
+def test_recording_size(tmp_path, market):
+    """ Book of 8 orders per side changing on every block, with 2 fills per block
+    """
+    recorder = MarketRecorder(str(tmp_path), market)
+    blocks = 1000
+    for block_num in range(blocks):
+        limit_orders = []
+        for i in range(8):
+            limit_orders.append(limit_order('1.7.{}'.format(i), BASE, 900 - i, QUOTE, 100, for_sale=900 - block_num))
+            limit_orders.append(limit_order('1.7.{}'.format(i + 8), QUOTE, 100, BASE, 1100 + i))
+        recorder.add_fill(fill(QUOTE, 50, BASE, 450))
+        recorder.add_fill(fill(BASE, 450, QUOTE, 50))
+        recorder.record(block_num, limit_orders)
+    recorder.close()
+
+    size = os.path.getsize(recorder.data_file) + os.path.getsize(recorder.index_file)
+    megabytes_per_day = size / blocks * BLOCKS_PER_DAY / 2 ** 20
+    log.info('Recording size: {:.0f} bytes per block, {:.1f} MB per day'.format(size / blocks, megabytes_per_day))
+    assert megabytes_per_day < 20
+
+    reader = RecordingReader(recorder.data_file)
+    assert len(reader) == blocks
+    assert reader.get_snapshot(500).buy_orders[0]['quote']['amount'] == pytest.approx(400 / 100 / 0.9)
+    reader.close()
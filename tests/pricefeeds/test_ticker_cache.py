@@ -0,0 +1,103 @@
+import logging
+
+import pytest
+from dexbot.pricefeeds.ticker_cache import TickerCache, get_ticker_cache
+from tests.pricefeeds.conftest import BASE, OTHER, QUOTE, FakeBitShares, FakeMarket
+
+log = logging.getLogger("dexbot")
+
+
+def order(base_id, quote_id):
+    return {'sell_price': {'base': {'asset_id': base_id}, 'quote': {'asset_id': quote_id}}}
+
+
+def fill(base_id, quote_id):
+    return {'base': {'asset': {'id': base_id}}, 'quote': {'asset': {'id': quote_id}}}
+
+
+@pytest.fixture
+def cache():
+    return TickerCache(ttl=60)
+
+
+@pytest.mark.mandatory
+def test_cached_until_next_block(cache):
+    market = FakeMarket(BASE, QUOTE)
+    cache.on_block('block1')
+    assert cache.get_ticker(market) is cache.get_ticker(market)
+    assert market.ticker_calls == 1
+
+    # Same block seen by another worker
+    cache.on_block('block1')
+    cache.get_ticker(market)
+    assert market.ticker_calls == 1
+
+    cache.on_block('block2')
+    cache.get_ticker(market)
+    assert market.ticker_calls == 2
+
+
+@pytest.mark.mandatory
+def test_market_notifications(cache):
+    market = FakeMarket(BASE, QUOTE)
+    inverted_market = FakeMarket(QUOTE, BASE)
+    other_market = FakeMarket(BASE, OTHER)
+    markets = [market, inverted_market, other_market]
+    for m in markets:
+        cache.get_ticker(m)
+
+    # Order and fill notifications drop tickers of their market in both directions
+    cache.on_market(order(QUOTE, BASE))
+    for m in markets:
+        cache.get_ticker(m)
+    assert [m.ticker_calls for m in markets] == [2, 2, 1]
+
+    cache.on_market(fill(OTHER, BASE))
+    for m in markets:
+        cache.get_ticker(m)
+    assert [m.ticker_calls for m in markets] == [2, 2, 2]
+
+    # Deleted orders carry no market
+    cache.on_market({'id': '1.7.1', 'deleted': True})
+    for m in markets:
+        cache.get_ticker(m)
+    assert [m.ticker_calls for m in markets] == [3, 3, 3]
+
+
+@pytest.mark.mandatory
+def test_ttl():
+    cache = TickerCache(ttl=0)
+    market = FakeMarket(BASE, QUOTE)
+    cache.get_ticker(market)
+    cache.get_ticker(market)
+    assert market.ticker_calls == 2
+
+
+@pytest.mark.mandatory
+def test_shared_cache():
+    bitshares = FakeBitShares()
+    assert get_ticker_cache(bitshares) is get_ticker_cache(bitshares)
+    assert get_ticker_cache(bitshares) is not get_ticker_cache(FakeBitShares())
+
+
+@pytest.mark.mandatory
+def test_ticker_calls_per_block():
+    """ 10 Relative Orders workers on 2 markets, each calling ticker 5 times per block: twice in
+        _calculate_center_price(), twice in calculate_asset_offset() and once in update_gui_slider()
+    """
+    cache = TickerCache(ttl=60)
+    markets = [FakeMarket(BASE, QUOTE), FakeMarket(BASE, OTHER)]
+    workers = [markets[i % 2] for i in range(10)]
+    calls_per_worker = 5
+    blocks = 10
+
+    for block in range(blocks):
+        cache.on_block(block)
+        for market in workers:
+            for _ in range(calls_per_worker):
+                cache.get_ticker(market)
+
+    uncached = len(workers) * calls_per_worker
+    cached = sum(market.ticker_calls for market in markets) / blocks
+    log.info('Ticker calls per block with 10 workers: {} uncached, {:.0f} cached'.format(uncached, cached))
+    assert cached == len(markets)
@@ -1,7 +1,10 @@
+import os
+import tempfile
+
 import pytest
 import logging
 
-from dexbot.storage import Storage
+from dexbot.storage import DatabaseWorker, Storage
 
 log = logging.getLogger("dexbot")
 log.setLevel(logging.DEBUG)
@@ -12,3 +15,22 @@ def storage():
     worker_name = 'test_worker'
     yield Storage(worker_name)
     Storage.clear_worker_data(worker_name)
+
+
+@pytest.fixture
+def db_worker():
+    """ Database worker bound to a temporary database file
+
+        Keyword arguments are passed to DatabaseWorker
+    """
+    db_files = []
+
+    def _db_worker(**kwargs):
+        _, db_file = tempfile.mkstemp()
+        db_files.append(db_file)
+        return DatabaseWorker(sqlite_file=db_file, **kwargs)
+
+    yield _db_worker
+
+    for db_file in db_files:
+        os.unlink(db_file)
@@ -0,0 +1,445 @@
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import load_only
+
+from dexbot.storage import BATCH_MAX_SIZE, Balances, Config, Orders
+
+log = logging.getLogger("dexbot")
+
+WRITES = 2000
+
+
+def count_statements(worker):
+    """ Record SQL statements and commits of the database thread connection
+
+        :return: dict with lists of 'statements' and 'commits', appended to as the worker runs
+    """
+    executed = {'statements': [], 'commits': []}
+    engine = worker.session.bind
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed['statements'].append(statement)
+
+    @event.listens_for(engine, 'commit')
+    def commit(conn):
+        executed['commits'].append(True)
+
+    return executed
+
+
+def measure_writes(worker, writes=WRITES):
+    """ Queue `writes` set_item tasks, including final commit
+
+        :return: tuple (writes per second, number of commits)
+    """
+    executed = count_statements(worker)
+    start = time.perf_counter()
+    for i in range(writes):
+        worker.set_item('benchmark', 'key_{}'.format(i % 50), i)
+    worker.flush()
+    return writes / (time.perf_counter() - start), len(executed['commits'])
+
+
+@pytest.mark.mandatory
+def test_batched_writes_are_visible_to_reads(db_worker):
+    worker = db_worker(batch_size=1000, batch_latency=60)
+    worker.set_item('foo', 'bar', 1)
+    worker.set_item('foo', 'bar', 2)
+    worker.set_item('foo', 'baz', 3)
+    worker.del_item('foo', 'baz')
+    assert worker.get_item('foo', 'bar') == 2
+    assert not worker.contains('foo', 'baz')
+
+
+@pytest.mark.mandatory
+def test_batched_writes_committed_after_latency(db_worker):
+    worker = db_worker(batch_size=1000, batch_latency=0.05)
+    worker.set_item('foo', 'bar', 1)
+    time.sleep(0.5)
+    # Separate connection sees committed data only
+    with worker.session.bind.connect() as conn:
+        rows = conn.execute("SELECT value FROM config WHERE category = 'foo' AND key = 'bar'").fetchall()
+    assert rows == [('1',)]
+
+
+@pytest.mark.mandatory
+def test_failed_write_keeps_rest_of_batch(db_worker):
+    worker = db_worker(batch_size=1000, batch_latency=60)
+    worker.set_item('foo', 'bar', 1)
+    # Value which can't be serialized makes the write fail on the database thread
+    worker.save_order_extended('foo', '1.7.1', {'id': '1.7.1'}, False, object())
+    worker.set_item('foo', 'baz', 2)
+    worker.flush()
+
+    with worker.session.bind.connect() as conn:
+        rows = conn.execute("SELECT key, value FROM config WHERE category = 'foo' ORDER BY key").fetchall()
+    assert rows == [('bar', '1'), ('baz', '2')]
+
+
+@pytest.mark.mandatory
+def test_stop_commits_pending_writes(db_worker):
+    worker = db_worker(batch_size=1000, batch_latency=60)
+    worker.set_item('foo', 'bar', 1)
+    worker.stop()
+    assert not worker.is_alive()
+
+    with worker.session.bind.connect() as conn:
+        rows = conn.execute("SELECT value FROM config WHERE category = 'foo' AND key = 'bar'").fetchall()
+    assert rows == [('1',)]
+
+
+@pytest.mark.mandatory
+def test_stopped_worker_fails_fast(db_worker):
+    """ Callers holding a worker replaced by configure_storage() get an error instead of waiting forever
+    """
+    worker = db_worker()
+    worker.stop()
+    worker.stop()
+    with pytest.raises(RuntimeError):
+        worker.get_item('foo', 'bar')
+    with pytest.raises(RuntimeError):
+        worker.set_item('foo', 'bar', 1)
+
+    # Task which raced the stop request and got queued behind it
+    worker = db_worker()
+    release = threading.Event()
+    worker.execute_noreturn(release.wait, 10)
+    future = concurrent.futures.Future()
+    worker.task_queue.put(None)
+    worker.task_queue.put((worker._get_items, (worker.session, 'foo'), future))
+    release.set()
+    with pytest.raises(RuntimeError):
+        future.result(5)
+
+
+@pytest.mark.mandatory
+def test_benchmark_batched_writes(db_worker):
+    unbatched, unbatched_commits = measure_writes(db_worker(batch_size=1, batch_latency=0))
+    batched, batched_commits = measure_writes(db_worker(batch_latency=60))
+    log.info('set_item writes/sec: unbatched {:.0f}, batched {:.0f}'.format(unbatched, batched))
+    # Timings depend on the machine, only the number of transactions is checked
+    assert unbatched_commits >= WRITES
+    assert batched_commits <= WRITES // BATCH_MAX_SIZE + 1
+
+
+@pytest.mark.mandatory
+def test_concurrent_readers_get_own_results(db_worker):
+    """ Many threads reading different workers' orders at once must each receive their own result
+    """
+    worker = db_worker()
+    threads_count = 16
+    reads_per_thread = 200
+    for i in range(threads_count):
+        worker.save_order_extended('worker_{}'.format(i), str(i), {'id': str(i)}, False, None)
+    worker.flush()
+
+    errors = []
+
+    def reader(i):
+        for _ in range(reads_per_thread):
+            result = worker.fetch_orders_extended('worker_{}'.format(i), False, False, None, True)
+            if result != [str(i)]:
+                errors.append((i, result))
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(threads_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    log.info(
+        '{} threads: {:.0f} fetch_orders_extended reads/sec'.format(
+            threads_count, threads_count * reads_per_thread / elapsed
+        )
+    )
+    assert errors == []
+
+
+@pytest.mark.mandatory
+def test_failed_read_raises_in_caller(db_worker):
+    worker = db_worker()
+
+    def _broken(future):
+        raise ValueError('broken')
+
+    with pytest.raises(ValueError):
+        worker.execute(_broken)
+    # Worker thread keeps processing tasks
+    assert worker.get_item('foo', 'bar') is None
+
+
+def measure_reads_under_writes(worker, readers=4, duration=1.0):
+    """ Run `readers` threads calling fetch_orders_extended while one thread keeps writing orders
+
+        :return: tuple (reads per second achieved by all readers together, reads run on the database thread)
+    """
+    thread_reads = []
+    execute_read = worker._execute_read
+
+    def counting_execute_read(*args):
+        thread_reads.append(True)
+        return execute_read(*args)
+
+    worker._execute_read = counting_execute_read
+    for i in range(100):
+        worker.save_order_extended('reader', str(i), {'id': str(i)}, False, None)
+    worker.flush()
+
+    stop = threading.Event()
+    reads = []
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            worker.save_order_extended('writer', str(i), {'id': str(i), 'payload': 'x' * 1000}, False, None)
+            i += 1
+            if i % 50 == 0:
+                # Keep the queue bounded, like a strategy waiting for its writes
+                worker.flush()
+
+    def reader():
+        count = 0
+        while not stop.is_set():
+            assert len(worker.fetch_orders_extended('reader', False, False, None, False)) == 100
+            count += 1
+        reads.append(count)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    worker.flush()
+
+    return sum(reads) / duration, len(thread_reads)
+
+
+@pytest.mark.mandatory
+def test_concurrent_reads_see_own_writes(db_worker):
+    worker = db_worker(concurrent_reads=True, batch_size=1000, batch_latency=60)
+    worker.save_order_extended('foo', '1.7.1', {'id': '1.7.1'}, True, None)
+    assert worker.fetch_orders_extended('foo', False, False, None, True) == ['1.7.1']
+    worker.remove_order('foo', '1.7.1')
+    assert worker.fetch_orders('foo') is None
+
+
+def start_reader(worker, worker_name):
+    """ Fetch worker's order ids on a separate thread
+
+        :return: tuple (thread, dict receiving the order ids under 'ids')
+    """
+    result = {}
+
+    def reader():
+        result['ids'] = worker.fetch_orders_extended(worker_name, False, False, None, True)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    return thread, result
+
+
+@pytest.mark.mandatory
+@pytest.mark.parametrize('concurrent_reads', [False, True])
+def test_reader_not_blocked_by_open_write_batch(db_worker, concurrent_reads):
+    """ With concurrent reads, a reader on another thread gets committed data while the database thread is busy
+    """
+    worker = db_worker(concurrent_reads=concurrent_reads, batch_size=1000, batch_latency=60)
+    worker.save_order_extended('reader', '1.7.1', {'id': '1.7.1'}, False, None)
+    worker.flush()
+
+    # Open a write batch and keep the database thread busy until released
+    release = threading.Event()
+    worker.save_order_extended('reader', '1.7.2', {'id': '1.7.2'}, False, None)
+    worker.execute_noreturn(release.wait, 10)
+
+    thread, result = start_reader(worker, 'reader')
+    if concurrent_reads:
+        # Read completes while the database thread is still busy, uncommitted write of the other thread is not visible
+        thread.join(5)
+        assert not thread.is_alive() and not release.is_set()
+        assert result['ids'] == ['1.7.1']
+        release.set()
+    else:
+        # Read waits for the database thread
+        thread.join(0.2)
+        assert thread.is_alive()
+        release.set()
+        thread.join()
+        assert result['ids'] == ['1.7.1', '1.7.2']
+
+
+@pytest.mark.mandatory
+def test_benchmark_concurrent_reads(db_worker):
+    serialized, serialized_thread_reads = measure_reads_under_writes(db_worker())
+    concurrent, concurrent_thread_reads = measure_reads_under_writes(db_worker(concurrent_reads=True))
+    log.info(
+        'fetch_orders_extended reads/sec under writes: serialized {:.0f}, concurrent {:.0f}'.format(
+            serialized, concurrent
+        )
+    )
+    # Timings depend on the machine, only where the reads run is checked
+    assert serialized_thread_reads >= 4
+    assert concurrent_thread_reads == 0
+
+
+def fill_config(worker, category, rows):
+    worker.session.bind.execute(
+        Config.__table__.insert(),
+        [{'category': category, 'key': 'key_{}'.format(i), 'value': '0'} for i in range(rows)],
+    )
+
+
+def delete_row_by_row(worker, category):
+    """ Previous implementation of DatabaseWorker._clear
+    """
+    for row in worker.session.query(Config).filter_by(category=category):
+        worker.session.delete(row)
+
+
+@pytest.mark.mandatory
+def test_benchmark_clear(db_worker):
+    """ Clearing 10k rows is a single DELETE, rows are not loaded like when deleting them one by one
+    """
+    rows = 10000
+    worker = db_worker()
+    executed = count_statements(worker)
+    fill_config(worker, 'row_by_row', rows)
+    start = time.perf_counter()
+    worker.execute_noreturn(delete_row_by_row, worker, 'row_by_row')
+    worker.flush()
+    row_by_row = time.perf_counter() - start
+
+    fill_config(worker, 'bulk', rows)
+    del executed['statements'][:]
+    start = time.perf_counter()
+    worker.clear('bulk')
+    worker.flush()
+    bulk = time.perf_counter() - start
+
+    log.info('clear {} rows: row-by-row {:.2f}s, set-based {:.2f}s'.format(rows, row_by_row, bulk))
+    assert [statement.split()[0] for statement in executed['statements']] == ['DELETE']
+    assert worker.get_items('row_by_row') == []
+    assert worker.get_items('bulk') == []
+
+
+# ORM implementations of the hot operations replaced by Core statements, kept for comparison
+def orm_get_items(session, category):
+    return [(e.key, e.value) for e in session.query(Config).filter_by(category=category).all()]
+
+
+def orm_set_item(session, category, key, value):
+    e = session.query(Config).filter_by(category=category, key=key).first()
+    if e:
+        e.value = value
+    else:
+        session.add(Config(category, key, value))
+    session.flush()
+
+
+def orm_fetch_orders_extended(session, worker, return_ids_only):
+    if return_ids_only:
+        return [row.order_id for row in session.query(Orders).options(load_only('order_id')).filter_by(worker=worker)]
+    return [
+        {'order_id': row.order_id, 'order': json.loads(row.order), 'virtual': row.virtual, 'custom': row.custom}
+        for row in session.query(Orders).filter_by(worker=worker)
+    ]
+
+
+def orm_save_order_extended(session, worker, order_id, order):
+    e = session.query(Orders).filter_by(order_id=order_id).first()
+    if e:
+        e.order = json.dumps(order)
+    else:
+        session.add(Orders(worker, order_id, json.dumps(order), False, json.dumps(None)))
+    session.flush()
+
+
+def orm_remove_order(session, worker, order_id):
+    e = session.query(Orders).filter_by(worker=worker, order_id=order_id).first()
+    if e:
+        session.delete(e)
+    session.flush()
+
+
+def orm_get_recent_balance_entry(session, account, worker, base_asset, quote_asset):
+    return (
+        session.query(Balances)
+        .filter_by(account=account, worker=worker, base_symbol=base_asset, quote_symbol=quote_asset)
+        .order_by(Balances.timestamp.desc(), Balances.id.desc())
+        .first()
+    )
+
+
+def measure_operations(worker, operations, calls, future):
+    """ Run every operation `calls` times on the database thread
+
+        :return: dicts of mean latency in seconds and of number of SQL statements per operation
+    """
+    executed = count_statements(worker)
+    latencies = {}
+    statements = {}
+    for name, func in operations.items():
+        del executed['statements'][:]
+        start = time.perf_counter()
+        for i in range(calls):
+            func(i)
+        latencies[name] = (time.perf_counter() - start) / calls
+        statements[name] = len(executed['statements']) / calls
+    worker.session.commit()
+    future.set_result((latencies, statements))
+
+
+@pytest.mark.mandatory
+def test_benchmark_orm_vs_core(db_worker):
+    calls = 200
+    rows = 500
+    worker = db_worker(retention_interval=0)
+    fill_config(worker, 'orm', rows)
+    fill_config(worker, 'core', rows)
+    order = {'id': '1.7.0', 'base': {'amount': 1, 'symbol': 'BASE'}, 'quote': {'amount': 1, 'symbol': 'QUOTE'}}
+    for prefix in ['orm', 'core']:
+        worker.save_orders_extended(prefix, [('{}-{}'.format(prefix, i), order) for i in range(rows)], False, None)
+    for i in range(rows):
+        worker.save_balance(Balances('account', 'worker_{}'.format(i % 50), 1, 'BASE', 1, 'QUOTE', 1, i))
+    worker.flush()
+
+    session = worker.session
+    orm = {
+        'get_items': lambda i: orm_get_items(session, 'orm'),
+        'set_item': lambda i: orm_set_item(session, 'orm', 'key_{}'.format(i), '1'),
+        'fetch_order_ids': lambda i: orm_fetch_orders_extended(session, 'orm', True),
+        'fetch_orders_extended': lambda i: orm_fetch_orders_extended(session, 'orm', False),
+        'save_order': lambda i: orm_save_order_extended(session, 'orm', 'orm-{}'.format(i * 2), order),
+        'remove_order': lambda i: orm_remove_order(session, 'orm', 'orm-{}'.format(i * 2 + 1)),
+        'recent_balance': lambda i: orm_get_recent_balance_entry(session, 'account', 'worker_1', 'BASE', 'QUOTE'),
+    }
+    core = {
+        'get_items': lambda i: worker._get_items(session, 'core'),
+        'set_item': lambda i: worker._set_item('core', 'key_{}'.format(i), '1'),
+        'fetch_order_ids': lambda i: worker._fetch_orders_extended(session, 'core', False, False, None, True),
+        'fetch_orders_extended': lambda i: worker._fetch_orders_extended(session, 'core', False, False, None, False),
+        'save_order': lambda i: worker._save_order_extended('core', 'core-{}'.format(i * 2), order, False, None),
+        'remove_order': lambda i: worker._remove_order('core', 'core-{}'.format(i * 2 + 1)),
+        'recent_balance': lambda i: worker._get_recent_balance_entry(session, 'account', 'worker_1', 'BASE', 'QUOTE'),
+    }
+    orm_latency, orm_statements = worker.execute(measure_operations, worker, orm, calls)
+    core_latency, core_statements = worker.execute(measure_operations, worker, core, calls)
+
+    for name in orm:
+        orm_us, core_us = orm_latency[name] * 1e6, core_latency[name] * 1e6
+        log.info('{:<22} ORM {:8.1f} us, Core {:8.1f} us'.format(name, orm_us, core_us))
+    # Timings depend on the machine, only the number of statements per operation is checked
+    assert all(core_statements[name] <= orm_statements[name] for name in orm)
+    assert sum(core_statements.values()) < sum(orm_statements.values())
+    assert worker.get_items('core') == worker.get_items('orm')
@@ -1,6 +1,12 @@
 import logging
+import subprocess
+import sys
+import threading
+
 import pytest
 
+from dexbot.storage import DAY, HOUR, BalanceRollups, Balances, Storage, get_storage_options
+
 log = logging.getLogger("dexbot")
 log.setLevel(logging.DEBUG)
 
@@ -74,3 +80,186 @@ def test_remove_order_by_id(storage):
     storage.save_order(order)
     storage.remove_order(order['id'])
     assert storage.fetch_orders() is None
+
+
+@pytest.mark.mandatory
+def test_items(storage):
+    storage['foo'] = {'bar': 1}
+    storage['baz'] = [1, 2]
+    assert storage['foo'] == {'bar': 1}
+    assert 'baz' in storage
+    assert 'missing' not in storage
+    assert storage['missing'] is None
+
+    del storage['baz']
+    assert 'baz' not in storage
+    assert storage.items() == [('foo', '{"bar": 1}')]
+
+    storage.clear()
+    assert storage['foo'] is None
+
+
+@pytest.mark.mandatory
+def test_cached_value_is_a_copy(storage):
+    storage['foo'] = [1]
+    value = storage['foo']
+    value.append(2)
+    assert storage['foo'] == [1]
+
+
+@pytest.mark.mandatory
+def test_cache_counters(db_worker):
+    worker = db_worker()
+    worker.set_item('foo', 'bar', 1)
+    assert worker.get_item('foo', 'bar') == 1
+    assert worker.get_item('foo', 'bar') == 1
+    assert worker.contains('foo', 'bar')
+    assert worker.cache_info() == {'hits': 2, 'misses': 1, 'categories': 1}
+
+    # Cache is loaded from the database after invalidation
+    worker.invalidate_cache('foo')
+    assert worker.get_item('foo', 'bar') == 1
+    assert worker.cache_info()['misses'] == 2
+
+
+@pytest.mark.mandatory
+def test_write_during_cache_load(db_worker):
+    """ Category read while another thread writes to it is not cached, the write would be lost
+    """
+    worker = db_worker()
+    worker.set_item('foo', 'bar', 1)
+    get_items = worker._get_items
+
+    def racing_get_items(session, category):
+        rows = get_items(session, category)
+        # Cache is not locked while loading, the write gets queued after the read
+        writer = threading.Thread(target=worker.set_item, args=(category, 'baz', 2))
+        writer.start()
+        writer.join()
+        return rows
+
+    worker._get_items = racing_get_items
+    assert worker.get_items('foo') == [('bar', '1')]
+    worker._get_items = get_items
+    assert worker.get_item('foo', 'baz') == 2
+    assert worker.cache_info()['misses'] == 2
+
+
+@pytest.mark.mandatory
+def test_cache_dropped_after_failed_write(db_worker):
+    worker = db_worker(batch_size=1000, batch_latency=60)
+    # Load category into the cache
+    assert worker.get_item('foo', 'bar') is None
+
+    # Key which can't be bound as a query parameter makes the write fail on the database thread
+    key = object()
+    worker.set_item('foo', key, 1)
+    worker.flush()
+    assert not worker.contains('foo', key)
+
+
+@pytest.mark.mandatory
+def test_get_storage_options(tmp_path):
+    assert get_storage_options(str(tmp_path / 'missing.yml')) == {}
+
+    path = tmp_path / 'config.yml'
+    path.write_text('node: wss://example.com\nworkers: {}\n')
+    assert get_storage_options(str(path)) == {}
+
+    path.write_text('node: wss://example.com\nworkers: {}\nstorage:\n  concurrent_reads: true\n  batch_size: 10\n')
+    assert get_storage_options(str(path)) == {'concurrent_reads': True, 'batch_size': 10}
+
+
+@pytest.mark.mandatory
+def test_save_orders_extended(storage):
+    orders = [{'id': str(i), 'base': '10 CNY', 'quote': '1 BTS'} for i in range(3)]
+    storage.save_order_extended(orders[0], virtual=False, custom='foo')
+    storage.save_orders_extended(orders, virtual=True, custom='bar')
+
+    fetched = storage.fetch_orders_extended(only_virtual=True, custom='bar')
+    assert sorted(entry['order_id'] for entry in fetched) == ['0', '1', '2']
+    assert fetched[0]['order'] == orders[0]
+
+
+@pytest.mark.mandatory
+def test_remove_orders(storage):
+    orders = [{'id': str(i), 'base': '10 CNY', 'quote': '1 BTS'} for i in range(1200)]
+    storage.save_orders_extended(orders)
+    # Mix of orders and plain ids, more than fits into one "IN" clause
+    storage.remove_orders(orders[:600] + [order['id'] for order in orders[600:1199]])
+    assert storage.fetch_orders_extended(return_ids_only=True) == ['1199']
+
+
+@pytest.mark.mandatory
+def test_clear_worker_data(storage):
+    storage['foo'] = 'bar'
+    storage.save_order({'id': '111', 'base': '10 CNY', 'quote': '1 BTS'})
+    Storage.clear_worker_data(storage.category)
+    assert storage['foo'] is None
+    assert storage.items() == []
+    assert storage.fetch_orders() is None
+
+
+def count_rollups(worker, period):
+    return worker.execute_read(lambda session: session.query(BalanceRollups).filter_by(period=period).count())
+
+
+@pytest.mark.mandatory
+def test_balance_retention(db_worker):
+    worker = db_worker(retention_interval=0, balance_retention=2 * DAY, hourly_balance_retention=10 * DAY)
+    now = 100 * DAY
+    # Two entries per hour during the last 20 days
+    for timestamp in range(now - 20 * DAY, now, HOUR // 2):
+        worker.save_balance(Balances('acc', 'w', timestamp, 'BASE', 1, 'QUOTE', 1, timestamp))
+    worker.execute_noreturn(worker._downsample_balances, now)
+    worker.flush()
+
+    # Full history of the last 2 days, hourly rollups for days 3-10, daily rollups for the rest
+    assert worker.execute_read(lambda session: session.query(Balances).count()) == 2 * 2 * 24
+    assert count_rollups(worker, HOUR) == 8 * 24
+    assert count_rollups(worker, DAY) == 10
+
+    # Rollups keep the first entry of the period
+    assert worker.get_balance('acc', 'w', now - 15 * DAY, 'BASE', 'QUOTE').timestamp == now - 14 * DAY
+    assert worker.get_balance('acc', 'w', now - 5 * DAY + 1, 'BASE', 'QUOTE').timestamp == now - 5 * DAY + HOUR
+    assert worker.get_balance('acc', 'w', now - DAY, 'BASE', 'QUOTE').timestamp == now - DAY + HOUR // 2
+    assert worker.get_balance('acc', 'w', now, 'BASE', 'QUOTE') is None
+    assert worker.get_recent_balance_entry('acc', 'w', 'BASE', 'QUOTE').timestamp == now - HOUR // 2
+
+    # Repeated run changes nothing
+    worker.execute_noreturn(worker._downsample_balances, now)
+    worker.flush()
+    assert count_rollups(worker, HOUR) == 8 * 24
+    assert count_rollups(worker, DAY) == 10
+
+
+@pytest.mark.mandatory
+def test_balance_retention_opt_in(db_worker):
+    assert db_worker().retention_interval == 0
+    assert db_worker(balance_retention=2 * DAY).retention_interval == HOUR
+
+
+@pytest.mark.mandatory
+def test_balance_retention_float_timestamps(db_worker):
+    """ Balances are saved with time.time(), entries of one hour go into one rollup
+    """
+    worker = db_worker(retention_interval=0, balance_retention=DAY)
+    now = 10 * DAY
+    for timestamp in (HOUR + 0.5, HOUR + 100.25, 2 * HOUR + 0.75):
+        worker.save_balance(Balances('acc', 'w', timestamp, 'BASE', 1, 'QUOTE', 1, timestamp))
+    worker.execute_noreturn(worker._downsample_balances, now)
+    worker.flush()
+
+    assert count_rollups(worker, HOUR) == 2
+    assert worker.get_balance('acc', 'w', HOUR, 'BASE', 'QUOTE').timestamp == pytest.approx(HOUR + 0.5)
+
+
+@pytest.mark.mandatory
+def test_storage_started_on_first_access():
+    code = (
+        'import sys, dexbot.storage as s; '
+        'assert s.db_worker is None and "alembic" not in sys.modules; '
+        's.Storage("test_lazy").items(); '
+        'assert s.db_worker.is_alive()'
+    )
+    subprocess.run([sys.executable, '-c', code], check=True)